@@ -3,6 +3,7 @@ import { Types } from "mongoose";
 import { Application, ApplicationStatus } from "../models/Application.ts";
 import { OpenRole } from "../models/OpenRole.ts";
 import { Club } from "../models/Club.ts";
+import { User } from "../models/User.ts";
 import { CommentThread } from "../models/CommentThread.ts";
 import { Comment } from "../models/Comment.ts";
 
@@ -248,12 +249,23 @@ export async function submitApplication(req: Request, res: Response) {
     const existing = await Application.findOne({ openRole: role._id, applicant: applicantId });
     if (existing) return res.status(409).json({ message: "You have already applied for this role" });
 
+    // Denormalized display fields so backend2's clubRef queries see this application
+    const [applicant, club] = await Promise.all([
+      User.findById(applicantId).select("name email").lean(),
+      Club.findById(role.club).select("name").lean(),
+    ]);
+
     const app = await Application.create({
       _id: new Types.ObjectId(),
       openRole: role._id,
       applicant: applicantId,
       answers,
       status: ApplicationStatus.SUBMITTED,
+      clubRef: role.club,
+      applicantName: applicant?.name ?? "",
+      applicantEmail: applicant?.email ?? "",
+      roleName: role.jobTitle,
+      clubName: club?.name ?? "",
     });
 
     const populated = await Application.findById(app._id)
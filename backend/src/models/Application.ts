@@ -14,6 +14,12 @@ export interface IApplication extends Document {
 	applicant: Types.ObjectId; // link to the User who applied
 	answers: {}; // answers to application questions
 	status: ApplicationStatus;
+	// Read-model fields backend2 queries on (see backend2/backfill_read_model.py)
+	clubRef?: Types.ObjectId;
+	applicantName?: string;
+	applicantEmail?: string;
+	roleName?: string;
+	clubName?: string;
 }
 
 const applicationSchema = new Schema<IApplication>(
@@ -26,6 +32,11 @@ const applicationSchema = new Schema<IApplication>(
 			enum: Object.values(ApplicationStatus),
 			default: ApplicationStatus.SUBMITTED,
 		},
+		clubRef: { type: Schema.Types.ObjectId, ref: "Club" },
+		applicantName: { type: String },
+		applicantEmail: { type: String },
+		roleName: { type: String },
+		clubName: { type: String },
 	},
 	{ timestamps: true }
 );
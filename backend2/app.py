@@ -1,96 +1,779 @@
+import time
+_BOOT_STARTED = time.perf_counter()
+
 import os
+import sys
+import importlib
+import threading
+import io
+import csv
 import json
 import re
-import time
-from flask import Flask, jsonify, request
+import hashlib
+import hmac
+import zlib
+import random
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from itertools import islice
+import orjson
+from flask import Flask, Response, g, jsonify, make_response, request, stream_with_context
 from flask_cors import CORS
-import snowflake.connector
-from pymongo import MongoClient
 from bson import ObjectId
 from dotenv import load_dotenv
+from sortedcontainers import SortedList
 
 load_dotenv()
 
+
+def cooperative_io():
+    """True when gevent has patched sockets, i.e. running under gunicorn -k gevent.
+
+    gunicorn.conf.py patches before this module is imported, so the locks,
+    semaphores and background threads below are all greenlet-aware.
+    """
+    monkey = sys.modules.get('gevent.monkey')
+    return bool(monkey and monkey.is_module_patched('socket'))
+
+
+COOPERATIVE_IO = cooperative_io()
+
 # MongoDB connection
 MONGO_URI = os.getenv('DEV_MONGO')
 MONGO_DB_NAME = os.getenv('MONGO_DB_NAME', 'mcwics-portal')
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_TIMEOUT_MS = int(os.getenv('MONGO_TIMEOUT_MS', '5000'))  # server selection, connect and per-read deadline
 mongo_client = None
 mongo_db = None
 
 # Valid application statuses
 VALID_STATUSES = ['SUBMITTED', 'UNDER_REVIEW', 'ACCEPTED', 'REJECTED', 'WITHDRAWN', 'WAITLISTED', 'INTERVIEW_SCHEDULED']
 
-# Context cache: session_id -> { 'data': {...}, 'timestamp': float }
+# Per-session context scope cache: "session_id:user_email" -> { 'scope': {...}, 'timestamp': float }
 _context_cache = {}
 CONTEXT_CACHE_TTL = 30  # seconds
 
 
+def lazy_import(module_name):
+    """Import a heavy backend module on first use and record how long it took.
+
+    snowflake.connector and pymongo are only imported when a request (or the
+    post-fork warm-up) actually needs them, which keeps worker boot fast.
+    """
+    module = sys.modules.get(module_name)
+    if module is None:
+        started = time.perf_counter()
+        module = importlib.import_module(module_name)
+        BOOT_TIMINGS['lazy_imports'][module_name] = round(time.perf_counter() - started, 4)
+    return module
+
+
+# Import/boot timings, reported under GET /metrics -> boot
+BOOT_TIMINGS = {'lazy_imports': {}, 'warmup': {}, 'cooperative_io': COOPERATIVE_IO}
+
+
 def get_mongo_db():
     """Get MongoDB database connection."""
     global mongo_client, mongo_db
     if mongo_db is None:
-        mongo_client = MongoClient(MONGO_URI)
+        mongo_client = lazy_import('pymongo').MongoClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_TIMEOUT_MS,
+            waitQueueTimeoutMS=MONGO_TIMEOUT_MS,
+            event_listeners=mongo_profile_listeners(),
+        )
         mongo_db = mongo_client[MONGO_DB_NAME]
+    # Fail fast while Mongo's breaker is open instead of waiting out the timeouts
+    breaker_check('mongo')
     return mongo_db
 
 
-def update_application(application_id: str, updates: dict, user_email: str) -> dict:
-    """Update an application in MongoDB. Returns result dict."""
+# ── Dependency resilience ────────────────────────────────────────
+# Mongo, Snowflake and Cortex each get a deadline (driver timeouts above and
+# in get_snowflake_conn/call_cortex_llm) and a circuit breaker: after
+# BREAKER_FAILURES consecutive transient failures, calls fail fast with
+# DependencyUnavailable for BREAKER_RESET_AFTER seconds, then a single
+# trial call decides whether it closes again. guarded() adds bounded
+# retries with full jitter. While a dependency is down, cached contexts,
+# /stats and /clubs are served from the last good copy, marked stale.
+
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', '5'))
+BREAKER_RESET_AFTER = float(os.getenv('BREAKER_RESET_AFTER', '30'))  # seconds
+RETRY_MAX = int(os.getenv('RETRY_MAX', '2'))  # retries for idempotent reads
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '0.2'))  # seconds
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '2'))  # seconds
+STALE_MAX_AGE = int(os.getenv('STALE_MAX_AGE', '3600'))  # oldest last-good response we'll serve
+STALE_ENTRIES_MAX = 256
+
+# Exception class names (anywhere in the MRO) that mean "dependency is slow or down",
+# matched by name so pymongo/snowflake don't have to be imported here
+TRANSIENT_ERROR_NAMES = {
+    'AutoReconnect', 'NetworkTimeout', 'ServerSelectionTimeoutError', 'ExecutionTimeout',
+    'WaitQueueTimeoutError', 'ConnectionFailure', 'OperationalError', 'InterfaceError',
+    'TimeoutError', 'ConnectionError',
+}
+SNOWFLAKE_TIMEOUT_ERRNO = 604  # statement canceled (query timeout)
+
+_breaker_lock = threading.Lock()
+_last_good = OrderedDict()  # key -> (payload, timestamp)
+
+
+class DependencyUnavailable(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+    def __init__(self, dependency, retry_after):
+        super().__init__(f'{dependency} is unavailable (circuit open), retry in {int(retry_after + 0.999)}s')
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+def _breaker(name):
+    return metrics_group('dependencies').setdefault(name, {
+        'state': 'closed', 'consecutive_failures': 0, 'opened_at': None, 'trial_started': None,
+        'failures': 0, 'opened': 0, 'rejected': 0, 'retries': 0, 'stale_served': 0,
+    })
+
+
+def is_transient_error(err):
+    if isinstance(err, DependencyUnavailable):
+        return True
+    if getattr(err, 'errno', None) == SNOWFLAKE_TIMEOUT_ERRNO:
+        return True
+    return any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(err).__mro__)
+
+
+def breaker_check(name):
+    """Raise DependencyUnavailable if name's breaker is open (doesn't start a trial)."""
+    b = _breaker(name)
+    if b['state'] == 'open':
+        remaining = BREAKER_RESET_AFTER - (time.time() - b['opened_at'])
+        if remaining > 0:
+            b['rejected'] += 1
+            raise DependencyUnavailable(name, remaining)
+
+
+def breaker_allow(name):
+    """Admit a call through name's breaker; after the reset window one trial call goes through."""
+    b = _breaker(name)
+    now = time.time()
+    with _breaker_lock:
+        if b['state'] == 'open' and now - b['opened_at'] >= BREAKER_RESET_AFTER:
+            b['state'] = 'half_open'
+            b['trial_started'] = None
+        if b['state'] == 'half_open':
+            # A trial that never reported back (e.g. the worker was busy) is retried after a window
+            if b['trial_started'] and now - b['trial_started'] < BREAKER_RESET_AFTER:
+                b['rejected'] += 1
+                raise DependencyUnavailable(name, BREAKER_RESET_AFTER - (now - b['trial_started']))
+            b['trial_started'] = now
+    breaker_check(name)
+
+
+def breaker_success(name):
+    b = _breaker(name)
+    with _breaker_lock:
+        if b['state'] != 'closed':
+            print(f"[BREAKER] {name} closed")
+        b.update(state='closed', consecutive_failures=0, trial_started=None)
+
+
+def breaker_failure(name, err):
+    b = _breaker(name)
+    with _breaker_lock:
+        b['failures'] += 1
+        b['consecutive_failures'] += 1
+        if b['state'] == 'half_open' or (b['state'] == 'closed' and b['consecutive_failures'] >= BREAKER_FAILURES):
+            b.update(state='open', opened_at=time.time(), trial_started=None)
+            b['opened'] += 1
+            print(f"[BREAKER] {name} opened after {b['consecutive_failures']} failure(s): {err}")
+
+
+def guarded(name, fn, *args, retries=0, **kwargs):
+    """Call fn through name's breaker, retrying transient failures with full-jitter backoff.
+
+    Only pass retries > 0 for idempotent calls. Non-transient errors (bad
+    SQL, validation) are raised as-is and don't count against the breaker.
+    """
+    for attempt in range(retries + 1):
+        breaker_allow(name)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if not is_transient_error(e) or isinstance(e, DependencyUnavailable):
+                raise
+            breaker_failure(name, e)
+            if attempt == retries or _breaker(name)['state'] == 'open':
+                raise
+            _breaker(name)['retries'] += 1
+            time.sleep(random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)))
+            continue
+        breaker_success(name)
+        return result
+
+
+def serve_stale_on_error(dependency, key, fn):
+    """jsonify(fn()), remembering it; on a dependency failure serve the last good copy marked stale."""
+    try:
+        payload = fn()
+    except Exception as e:
+        if not is_transient_error(e):
+            raise
+        entry = _last_good.get(key)
+        if entry is None or time.time() - entry[1] > STALE_MAX_AGE:
+            raise
+        _breaker(dependency)['stale_served'] += 1
+        response = jsonify(entry[0])
+        response.headers['Warning'] = '110 - "Response is Stale"'
+        response.headers['X-Stale-Age'] = str(int(time.time() - entry[1]))
+        return response
+    _last_good[key] = (payload, time.time())
+    _last_good.move_to_end(key)
+    while len(_last_good) > STALE_ENTRIES_MAX:
+        _last_good.popitem(last=False)
+    return jsonify(payload)
+
+
+def dependency_error_response(err):
+    """503 + Retry-After for an open breaker or a transient failure, 500 otherwise."""
+    if not is_transient_error(err):
+        return jsonify({'error': str(err)}), 500
+    retry_after = max(1, int(getattr(err, 'retry_after', BREAKER_RESET_AFTER) + 0.999))
+    g.dependency_error = err
+    response = jsonify({'error': str(err), 'dependency': getattr(err, 'dependency', None)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def mongo_view(view):
+    """Put a view's direct Mongo reads behind the mongo breaker.
+
+    While the breaker is open the view answers 503 without running. A
+    transient failure the view reports through dependency_error_response
+    counts against the breaker; any response below 400 counts as a success.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            breaker_check('mongo')
+        except DependencyUnavailable as e:
+            return dependency_error_response(e)
+        g.dependency_error = None
+        response = make_response(view(*args, **kwargs))
+        err = g.pop('dependency_error', None)
+        if err is not None and not isinstance(err, DependencyUnavailable):
+            breaker_failure('mongo', err)
+        elif response.status_code < 400:
+            breaker_success('mongo')
+        return response
+    return wrapper
+
+
+def update_application(application_id: str, updates: dict, user_email: str, principal=None,
+                       expected_status=None) -> dict:
+    """Update an application in MongoDB. Returns result dict.
+
+    Pass an already-resolved principal to skip the principal lookup.
+    With expected_status the update only applies if the application is still
+    in that status; otherwise the result has conflict=True and currentStatus.
+    """
     try:
         db = get_mongo_db()
         
         # Verify user is admin (check both MongoDB users and demo admins)
-        user = db.users.find_one({'email': user_email}, {'passwordHash': 0})
-        demo_admin = DEMO_ADMINS.get(user_email)
-        
-        is_authorized = False
-        if user:
-            if 'ADMIN' in user.get('roles', []) or 'CLUB_LEADER' in user.get('roles', []):
-                is_authorized = True
-        elif demo_admin:
-            # Demo admin is authorized
-            is_authorized = True
+        if principal is None:
+            principal = get_principal(db, user_email)
+        is_authorized = bool(principal and principal['is_admin'])
         
         if not is_authorized:
             return {'success': False, 'error': 'Unauthorized - admin access required'}
         
-        # Find the application
-        try:
-            app_filter = {'_id': ObjectId(application_id)}
-        except:
-            # Try finding by other identifiers
-            app_filter = {'$or': [
-                {'applicationId': application_id},
-                {'id': application_id}
-            ]}
-        
-        application = db.applications.find_one(app_filter)
-        if not application:
-            return {'success': False, 'error': f'Application {application_id} not found'}
-        
         # Validate status if being updated
         if 'status' in updates:
-            new_status = updates['status'].upper().replace(' ', '_')
+            new_status = normalize_status(updates['status'])
             if new_status not in VALID_STATUSES:
                 return {'success': False, 'error': f'Invalid status. Valid statuses: {", ".join(VALID_STATUSES)}'}
             updates['status'] = new_status
+        if expected_status:
+            expected_status = normalize_status(expected_status)
         
         # Add audit trail
         updates['lastUpdatedBy'] = user_email
         updates['lastUpdatedAt'] = __import__('datetime').datetime.utcnow().isoformat()
         
-        # Perform update
-        result = db.applications.update_one(app_filter, {'$set': updates})
+        app_filter = application_filter(application_id)
+        before, after = find_and_set_application(db, app_filter, updates, expected_status,
+                                                 projection={'answers': 0})
+        if not before:
+            current = current_status(db, app_filter) if expected_status else None
+            if current is not None:
+                return {'success': False, 'conflict': True, 'currentStatus': current,
+                        'error': f'Application {application_id} is {current}, not {expected_status}'}
+            return {'success': False, 'error': f'Application {application_id} not found'}
         
-        if result.modified_count > 0:
-            return {'success': True, 'message': f'Application updated successfully', 'updates': updates}
-        else:
-            return {'success': False, 'error': 'No changes made'}
+        if 'status' in updates:
+            record_status_change(db, after.get('clubRef'), before.get('status'), updates['status'])
+            enqueue_status_notifications(db, [(before, after, updates['status'])])
+        return {'success': True, 'message': f'Application updated successfully', 'updates': updates}
             
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
 
+# ── Application writes ───────────────────────────────────────────
+# Status changes are one find_one_and_update: the filter carries the optional
+# expected previous status (optimistic concurrency), and the pre-image comes
+# back in the same round trip. The pre-image supplies the old status for the
+# funnel counters, and with the $set applied it is the updated document.
+# Read-model documents then need no further reads to hydrate. Only legacy
+# documents without read-model fields cost extra lookups plus one backfill write.
+
+def normalize_status(status):
+    return str(status).upper().replace(' ', '_')
+
+
+def application_filter(application_id):
+    try:
+        return {'_id': ObjectId(application_id)}
+    except Exception:
+        # Try finding by other identifiers
+        return {'$or': [{'applicationId': application_id}, {'id': application_id}]}
+
+
+def find_and_set_application(db, app_filter, set_fields, expected_status=None, projection=None, lookup_cache=None):
+    """Atomically $set fields on one application; return (before, after) or (None, None).
+
+    With expected_status, only an application currently in that status is
+    updated. projection trims the returned documents (e.g. {'answers': 0}).
+    """
+    if expected_status:
+        app_filter = {'$and': [app_filter, {'status': expected_status}]}
+    update = {'$set': set_fields}
+    # The email this change may send is recorded with the write itself (see the outbox)
+    marker = notification_marker(set_fields['status']) if 'status' in set_fields else None
+    if marker:
+        update['$push'] = {'pendingNotifications': marker}
+    before = db.applications.find_one_and_update(
+        app_filter, update, projection=projection,
+        return_document=lazy_import('pymongo').ReturnDocument.BEFORE)
+    if not before:
+        return None, None
+    after = dict(before, **set_fields)
+    if marker:
+        after['pendingNotifications'] = list(before.get('pendingNotifications') or []) + [marker]
+    if 'clubRef' not in after:
+        read_model = application_read_model_fields(db, after, lookup_cache)
+        db.applications.update_one({'_id': before['_id']}, {'$set': read_model})
+        after.update(read_model)
+    return before, after
+
+
+def current_status(db, app_filter):
+    """The application's status, or None if it doesn't exist (used to explain a conflict)."""
+    app = db.applications.find_one(app_filter, {'status': 1})
+    return app.get('status') if app else None
+
+
+# ── Notification outbox ──────────────────────────────────────────
+# A status change that sends an email pushes a `pendingNotifications` marker
+# onto the application in the same find_one_and_update, so the intent is
+# durable with the write. Right after the write the email is inserted into
+# the `outbox` collection (one insert per request, or one insert_many for a
+# bulk change) and the marker is pulled; if that fails, or the worker dies
+# in between, the dispatcher sweeps markers older than OUTBOX_SWEEP_AFTER
+# and queues them (the outbox dedupeKey is the marker id, so nothing is
+# queued twice). The request never waits on SMTP. A
+# dispatcher thread per worker claims due messages in batches under a lease
+# (so several workers can share the collection), sends them over one SMTP
+# connection per batch at no more than OUTBOX_RATE messages per second, and
+# retries failures with exponential backoff until OUTBOX_MAX_ATTEMPTS.
+# Messages whose lease expires (the worker died mid-batch) are picked up again.
+
+SMTP_HOST = os.getenv('SMTP_HOST', '')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '25'))
+SMTP_USER = os.getenv('SMTP_USER', '')
+SMTP_PASSWORD = os.getenv('SMTP_PASSWORD', '')
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'false').lower() == 'true'
+SMTP_FROM = os.getenv('SMTP_FROM', 'recruitment@mcwics-portal.ca')
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '10'))  # seconds
+NOTIFICATIONS = os.getenv('NOTIFICATIONS', 'true' if SMTP_HOST else 'false').lower() == 'true'
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '5'))  # seconds between idle polls
+OUTBOX_SWEEP_AFTER = int(os.getenv('OUTBOX_SWEEP_AFTER', '60'))  # seconds before an unqueued marker is swept
+OUTBOX_RATE = float(os.getenv('OUTBOX_RATE', '5'))  # messages/second per worker
+OUTBOX_BURST = int(os.getenv('OUTBOX_BURST', '10'))
+OUTBOX_LEASE = int(os.getenv('OUTBOX_LEASE', '300'))  # seconds a claimed batch stays reserved
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '6'))
+OUTBOX_RETRY_BASE = float(os.getenv('OUTBOX_RETRY_BASE', '30'))  # seconds, doubled per attempt
+OUTBOX_RETRY_MAX = float(os.getenv('OUTBOX_RETRY_MAX', '3600'))
+
+# Subject and body per new status, filled from the application's read-model fields
+# (same wording as the frontend's EmailPreviewModal templates)
+NOTIFICATION_TEMPLATES = {
+    'INTERVIEW_SCHEDULED': (
+        'Interview Invitation - {position} at {club}',
+        'Hi {name},\n\n'
+        'Congratulations! We are pleased to invite you for an interview for the {position} position at {club}.\n\n'
+        'Please log in to the portal to select your preferred interview time slot.\n\n'
+        'We look forward to meeting you!\n\n'
+        'Best regards,\n{club} Recruitment Team',
+    ),
+    'ACCEPTED': (
+        'Welcome to {club}!',
+        'Hi {name},\n\n'
+        'We are thrilled to offer you the {position} position at {club}!\n\n'
+        'You have been an outstanding candidate throughout the application process.\n\n'
+        'Welcome to the team!\n\n'
+        'Best regards,\n{club} Recruitment Team',
+    ),
+    'REJECTED': (
+        'Application Update - {position} at {club}',
+        'Hi {name},\n\n'
+        'Thank you for your interest in the {position} position at {club}.\n\n'
+        'After careful consideration, we have decided to move forward with other candidates whose experience '
+        'more closely aligns with our current needs.\n\n'
+        'We encourage you to apply for future positions, and we wish you the best in your endeavors.\n\n'
+        'Best regards,\n{club} Recruitment Team',
+    ),
+}
+
+_outbox = {'pid': None, 'thread': None, 'wake': threading.Event(), 'indexes': False}
+_outbox_lock = threading.Lock()
+
+
+def _outbox_metrics():
+    return metrics_group('outbox', enqueued=0, batches=0, sent=0, retried=0, failed=0, duplicates=0,
+                         enqueue_errors=0, swept=0)
+
+
+def ensure_outbox_indexes(db):
+    """Create the indexes the dispatcher and enqueue dedupe rely on (idempotent)."""
+    db.outbox.create_index([('status', 1), ('nextAttemptAt', 1)])
+    db.outbox.create_index('dedupeKey', unique=True)
+    db.applications.create_index('pendingNotifications.at', sparse=True)
+
+
+def _ensure_outbox_indexes_once(db):
+    if not _outbox['indexes']:
+        ensure_outbox_indexes(db)
+        _outbox['indexes'] = True
+
+
+def notification_marker(new_status):
+    """Marker a status write pushes onto the application, or None if new_status sends no email."""
+    if not NOTIFICATIONS or _status_key(new_status) not in NOTIFICATION_TEMPLATES:
+        return None
+    return {'id': str(ObjectId()), 'status': _status_key(new_status), 'at': datetime.utcnow()}
+
+
+def status_notification(before, app, new_status, marker=None):
+    """The outbox document for a status change (pre-image, updated doc), or None if it doesn't notify anyone.
+
+    marker defaults to the one the write pushed (the last on the updated doc).
+    """
+    old_status = before.get('status')
+    template = NOTIFICATION_TEMPLATES.get(_status_key(new_status))
+    marker = marker or (app.get('pendingNotifications') or [None])[-1]
+    if (not template or not marker or _status_key(old_status) == _status_key(new_status)
+            or not app.get('applicantEmail')):
+        return None
+    values = {
+        'name': app.get('applicantName') or 'there',
+        'position': app.get('roleName') or 'open',
+        'club': app.get('clubName') or 'the club',
+    }
+    now = datetime.utcnow()
+    return {
+        'kind': 'status_change',
+        'applicationId': str(app['_id']),
+        'clubRef': app.get('clubRef'),
+        'to': app['applicantEmail'],
+        'subject': template[0].format(**values),
+        'body': template[1].format(**values),
+        'status': 'pending',
+        'attempts': 0,
+        'createdAt': now,
+        'nextAttemptAt': now,
+        # One marker per write, so the request path and a later sweep of the
+        # same marker queue one email. Writes are serialized per document: a
+        # second writer applying the same change sees no transition at all.
+        'dedupeKey': f"{app['_id']}:{marker['id']}",
+    }
+
+
+def enqueue_status_notifications(db, changes):
+    """Queue emails for (before, after, new_status) status changes; returns how many.
+
+    Markers are pulled once their email is queued (or turns out not to be
+    needed); a marker whose insert failed stays for sweep_pending_notifications.
+    """
+    if not NOTIFICATIONS:
+        return 0
+    _ensure_outbox_indexes_once(db)
+    docs, settled = [], []
+    for before, after, new_status in changes:
+        marker = (after.get('pendingNotifications') or [None])[-1]
+        if not marker:
+            continue
+        doc = status_notification(before, after, new_status, marker)
+        if doc:
+            docs.append((doc, after['_id'], marker['id']))
+        else:
+            settled.append((after['_id'], marker['id']))
+    enqueued = _insert_outbox(db, docs, settled)
+    if enqueued:
+        start_outbox_dispatcher()
+        _outbox['wake'].set()
+    return enqueued
+
+
+def _insert_outbox(db, docs, settled):
+    """Insert (doc, application _id, marker id) entries and pull the markers that are done with."""
+    enqueued, failed = len(docs), set()
+    if docs:
+        try:
+            db.outbox.insert_many([doc for doc, _, _ in docs], ordered=False)
+        except lazy_import('pymongo.errors').BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            failed = {err['index'] for err in errors if err.get('code') != 11000}
+            enqueued -= len(errors)
+            _outbox_metrics()['duplicates'] += len(errors) - len(failed)
+            if failed:
+                print(f"[OUTBOX] {len(failed)} notification(s) not queued, left for the sweep: "
+                      f"{errors[0].get('errmsg')}")
+        except Exception as e:
+            # The status change itself succeeded; its markers stay for the sweep
+            enqueued, failed = 0, set(range(len(docs)))
+            print(f"[OUTBOX] Could not queue {len(docs)} notification(s), left for the sweep: {e}")
+    metrics = _outbox_metrics()
+    metrics['enqueued'] += enqueued
+    metrics['enqueue_errors'] += len(failed)
+    settled = settled + [(app_id, marker_id) for i, (_, app_id, marker_id) in enumerate(docs) if i not in failed]
+    if settled:
+        UpdateOne = lazy_import('pymongo').UpdateOne
+        try:
+            db.applications.bulk_write([
+                UpdateOne({'_id': app_id}, {'$pull': {'pendingNotifications': {'id': marker_id}}})
+                for app_id, marker_id in settled
+            ], ordered=False)
+        except Exception as e:
+            # Harmless: the sweep re-inserts them, which dedupeKey turns into duplicates
+            print(f"[OUTBOX] Could not clear {len(settled)} notification marker(s): {e}")
+    return enqueued
+
+
+def sweep_pending_notifications(db, limit=None):
+    """Queue emails whose status write left a marker but that never reached the outbox."""
+    if not NOTIFICATIONS:
+        return 0
+    _ensure_outbox_indexes_once(db)
+    cutoff = datetime.utcnow() - timedelta(seconds=OUTBOX_SWEEP_AFTER)
+    docs, settled = [], []
+    for app in db.applications.find({'pendingNotifications.at': {'$lt': cutoff}},
+                                    {'answers': 0}).limit(limit or OUTBOX_BATCH_SIZE):
+        if 'clubRef' not in app or 'applicantEmail' not in app:
+            app.update(application_read_model_fields(db, app))
+        for marker in app['pendingNotifications']:
+            if marker['at'] >= cutoff:
+                continue
+            # The pre-image is gone; the write already checked this was a real transition
+            doc = status_notification({}, app, marker['status'], marker)
+            if doc:
+                docs.append((doc, app['_id'], marker['id']))
+            else:
+                settled.append((app['_id'], marker['id']))
+    enqueued = _insert_outbox(db, docs, settled)
+    if docs or settled:
+        _outbox_metrics()['swept'] += len(docs) + len(settled)
+        print(f"[OUTBOX] Swept {len(docs) + len(settled)} pending notification marker(s), queued {enqueued}")
+    return enqueued
+
+
+def claim_outbox_batch(db, limit=None):
+    """Lease up to limit due messages to this worker and return them."""
+    now = datetime.utcnow()
+    due = {'$or': [
+        {'status': 'pending', 'nextAttemptAt': {'$lte': now}},
+        {'status': 'sending', 'leaseUntil': {'$lte': now}},  # claimed by a worker that never finished
+    ]}
+    ids = [doc['_id'] for doc in db.outbox.find(due, {'_id': 1}).sort('nextAttemptAt', 1).limit(limit or OUTBOX_BATCH_SIZE)]
+    if not ids:
+        return []
+    claim = f"{os.getpid()}-{os.urandom(4).hex()}"
+    db.outbox.update_many({'$and': [{'_id': {'$in': ids}}, due]}, {
+        '$set': {'status': 'sending', 'claim': claim, 'leaseUntil': now + timedelta(seconds=OUTBOX_LEASE)},
+        '$inc': {'attempts': 1},
+    })
+    return list(db.outbox.find({'claim': claim}))
+
+
+def _smtp_connect():
+    smtplib = lazy_import('smtplib')
+    smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    if SMTP_STARTTLS:
+        smtp.starttls()
+    if SMTP_USER:
+        smtp.login(SMTP_USER, SMTP_PASSWORD)
+    return smtp
+
+
+def _email_message(doc):
+    message = lazy_import('email.message').EmailMessage()
+    message['From'] = SMTP_FROM
+    message['To'] = doc['to']
+    message['Subject'] = doc['subject']
+    # Stable across retries of this notification, unique per transition, and a
+    # valid dot-atom (the dedupe key itself contains '->', '|' and spaces)
+    message_key = hashlib.sha256(doc['dedupeKey'].encode()).hexdigest()[:32]
+    message['Message-ID'] = f"<{message_key}.{doc['applicationId']}@{SMTP_FROM.split('@')[-1]}>"
+    message.set_content(doc['body'])
+    return message
+
+
+def _outbox_retry(db, doc, err):
+    """Schedule doc's next attempt with exponential backoff, or mark it failed."""
+    permanent = isinstance(err, lazy_import('smtplib').SMTPRecipientsRefused)
+    if permanent or doc['attempts'] >= OUTBOX_MAX_ATTEMPTS:
+        db.outbox.update_one({'_id': doc['_id']}, {'$set': {'status': 'failed', 'lastError': str(err)},
+                                                   '$unset': {'claim': '', 'leaseUntil': ''}})
+        _outbox_metrics()['failed'] += 1
+        print(f"[OUTBOX] Giving up on {doc['_id']} to {doc['to']} after {doc['attempts']} attempt(s): {err}")
+        return
+    delay = min(OUTBOX_RETRY_MAX, OUTBOX_RETRY_BASE * 2 ** (doc['attempts'] - 1))
+    delay = random.uniform(delay / 2, delay)
+    db.outbox.update_one({'_id': doc['_id']}, {
+        '$set': {'status': 'pending', 'lastError': str(err),
+                 'nextAttemptAt': datetime.utcnow() + timedelta(seconds=delay)},
+        '$unset': {'claim': '', 'leaseUntil': ''},
+    })
+    _outbox_metrics()['retried'] += 1
+
+
+def deliver_outbox_batch(db, batch):
+    """Send a claimed batch over one SMTP connection; returns the number sent."""
+    _outbox_metrics()['batches'] += 1
+    try:
+        smtp = _smtp_connect()
+    except Exception as e:
+        print(f"[OUTBOX] SMTP connect to {SMTP_HOST}:{SMTP_PORT} failed: {e}")
+        for doc in batch:
+            _outbox_retry(db, doc, e)
+        return 0
+    sent_ids = []
+    try:
+        for i, doc in enumerate(batch):
+            wait = take_rate_token('outbox:smtp', OUTBOX_RATE, OUTBOX_BURST)
+            while wait:
+                time.sleep(wait)
+                wait = take_rate_token('outbox:smtp', OUTBOX_RATE, OUTBOX_BURST)
+            try:
+                smtp.send_message(_email_message(doc))
+                sent_ids.append(doc['_id'])
+            except lazy_import('smtplib').SMTPServerDisconnected as e:
+                for rest in batch[i:]:
+                    _outbox_retry(db, rest, e)
+                break
+            except Exception as e:
+                _outbox_retry(db, doc, e)
+    finally:
+        if sent_ids:
+            db.outbox.update_many({'_id': {'$in': sent_ids}}, {
+                '$set': {'status': 'sent', 'sentAt': datetime.utcnow()},
+                '$unset': {'claim': '', 'leaseUntil': '', 'lastError': ''},
+            })
+            _outbox_metrics()['sent'] += len(sent_ids)
+        try:
+            smtp.quit()
+        except Exception:
+            pass
+    return len(sent_ids)
+
+
+def dispatch_outbox_once():
+    """Sweep stranded markers, then claim and deliver batches until nothing is due; returns the number sent."""
+    db = get_mongo_db()
+    sweep_pending_notifications(db)
+    sent = 0
+    while True:
+        batch = claim_outbox_batch(db)
+        if not batch:
+            return sent
+        sent += deliver_outbox_batch(db, batch)
+
+
+def _outbox_loop():
+    while True:
+        try:
+            dispatch_outbox_once()
+        except Exception as e:
+            print(f"[OUTBOX] Dispatch failed: {e}")
+        _outbox['wake'].wait(OUTBOX_POLL_INTERVAL)
+        _outbox['wake'].clear()
+
+
+def start_outbox_dispatcher():
+    """Start this worker's dispatcher thread once (threads don't survive fork)."""
+    if not NOTIFICATIONS or not SMTP_HOST or _outbox['pid'] == os.getpid():
+        return
+    with _outbox_lock:
+        if _outbox['pid'] == os.getpid():
+            return
+        _outbox['pid'] = os.getpid()
+        _outbox['wake'] = threading.Event()
+        _outbox['thread'] = threading.Thread(target=_outbox_loop, name='outbox-dispatcher', daemon=True)
+        _outbox['thread'].start()
+
+
+def applicant_match_score(app, message_lower):
+    """How strongly a lowercased message names this application's applicant (0 = not at all)."""
+    # Try various field names for applicant info
+    applicant_name = (
+        app.get('applicantName') or 
+        app.get('name') or 
+        app.get('userName') or 
+        app.get('studentName') or 
+        ''
+    ).lower()
+    
+    applicant_email = (
+        app.get('applicantEmail') or 
+        app.get('email') or 
+        app.get('userEmail') or 
+        app.get('studentEmail') or 
+        ''
+    ).lower()
+    
+    match_score = 0
+    
+    # Check full name match
+    if applicant_name and applicant_name in message_lower:
+        match_score = len(applicant_name)
+    
+    # Check individual name parts (first name, last name)
+    if applicant_name:
+        name_parts = applicant_name.split()
+        for part in name_parts:
+            if len(part) > 2 and part in message_lower:
+                match_score = max(match_score, len(part))
+    
+    # Check email or email prefix
+    if applicant_email:
+        email_prefix = applicant_email.split('@')[0].lower()
+        if email_prefix in message_lower:
+            match_score = max(match_score, len(email_prefix))
+        if applicant_email in message_lower:
+            match_score = max(match_score, len(applicant_email))
+    
+    return match_score
+
+
 def parse_update_command(message: str, applications: list) -> dict:
     """Parse a chat message to detect application update commands."""
     message_lower = message.lower()
@@ -130,44 +813,7 @@ def parse_update_command(message: str, applications: list) -> dict:
     
     # Look for applicant name or email in the message
     for app in applications:
-        # Try various field names for applicant info
-        applicant_name = (
-            app.get('applicantName') or 
-            app.get('name') or 
-            app.get('userName') or 
-            app.get('studentName') or 
-            ''
-        ).lower()
-        
-        applicant_email = (
-            app.get('applicantEmail') or 
-            app.get('email') or 
-            app.get('userEmail') or 
-            app.get('studentEmail') or 
-            ''
-        ).lower()
-        
-        match_score = 0
-        
-        # Check full name match
-        if applicant_name and applicant_name in message_lower:
-            match_score = len(applicant_name)
-        
-        # Check individual name parts (first name, last name)
-        if applicant_name:
-            name_parts = applicant_name.split()
-            for part in name_parts:
-                if len(part) > 2 and part in message_lower:
-                    match_score = max(match_score, len(part))
-        
-        # Check email or email prefix
-        if applicant_email:
-            email_prefix = applicant_email.split('@')[0].lower()
-            if email_prefix in message_lower:
-                match_score = max(match_score, len(email_prefix))
-            if applicant_email in message_lower:
-                match_score = max(match_score, len(applicant_email))
-        
+        match_score = applicant_match_score(app, message_lower)
         if match_score > best_match_score:
             best_match_score = match_score
             target_app = app
@@ -198,6 +844,11 @@ def populate_application(db, app):
     app_copy = dict(app)
     app_copy['_id'] = str(app_copy.get('_id', ''))
     
+    # Read-model documents already carry the display fields - no lookups needed
+    if 'clubRef' in app_copy and 'applicantName' in app_copy:
+        app_copy['clubRef'] = str(app_copy['clubRef'] or '')
+        return app_copy
+    
     # Look up applicant info if we have an applicant ID
     applicant_id = app_copy.get('applicant')
     if applicant_id:
@@ -236,6 +887,280 @@ def populate_application(db, app):
     return app_copy
 
 
+# ── Application read model ───────────────────────────────────────
+# Display fields are denormalized onto each application document so list and
+# chat-context reads are single-collection queries on `clubRef`. They are set
+# on every backend2 write (and clubRef on the Node submit path) and kept in
+# sync by backfill_read_model.py. Documents without clubRef still match via
+# their openRole, so enabling the flag before the backfill loses nothing.
+
+APPLICATION_READ_MODEL = os.getenv('APPLICATION_READ_MODEL', 'false').lower() == 'true'
+READ_MODEL_FIELDS = ['applicantName', 'applicantEmail', 'roleName', 'clubName', 'clubRef']
+
+
+def read_model_app_query(club_oids, role_ids):
+    """Applications of these clubs: clubRef, or openRole for documents that don't carry clubRef yet.
+
+    Once CANONICAL_REFS is set every application has been migrated to a
+    clubRef, so the filter is the single indexed field.
+    """
+    by_club = {'clubRef': {'$in': sorted(club_oids)}}
+    if CANONICAL_REFS or not role_ids:
+        return by_club
+    refs = sorted(role_ids) + sorted(str(r) for r in role_ids)
+    return {'$or': [by_club, {'clubRef': None, 'openRole': {'$in': refs}}]}
+
+
+def _as_object_id(value):
+    """Return value as an ObjectId, or None if it isn't one."""
+    if isinstance(value, ObjectId):
+        return value
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return None
+
+
+def application_read_model_fields(db, app, lookup_cache=None):
+    """Compute the denormalized display fields for an application document.
+
+    lookup_cache (optional dict) memoizes user/role/club lookups across calls,
+    which keeps batch backfills to one lookup per distinct reference.
+    """
+    cache = lookup_cache if lookup_cache is not None else {}
+    
+    def lookup(collection, oid, projection):
+        if oid is None:
+            return None
+        key = (collection, oid)
+        if key not in cache:
+            cache[key] = db[collection].find_one({'_id': oid}, projection)
+        return cache[key]
+    
+    fields = {'applicantName': '', 'applicantEmail': '', 'roleName': '', 'clubName': '', 'clubRef': None}
+    
+    applicant = lookup('users', _as_object_id(app.get('applicant')), {'name': 1, 'email': 1})
+    if applicant:
+        fields['applicantName'] = applicant.get('name', '')
+        fields['applicantEmail'] = applicant.get('email', '')
+    
+    role = lookup('openroles', _as_object_id(app.get('openRole') or app.get('roleId') or app.get('positionId')),
+                  {'jobTitle': 1, 'title': 1, 'name': 1, 'club': 1, 'clubId': 1, 'clubName': 1})
+    club = None
+    if role:
+        fields['roleName'] = role.get('jobTitle') or role.get('title') or role.get('name', '')
+        club = lookup('clubs', _as_object_id(role.get('club') or role.get('clubId')), {'name': 1})
+        if not club:
+            fields['clubName'] = role.get('clubName', '')
+    
+    if not club:
+        club = lookup('clubs', _as_object_id(app.get('clubId')), {'name': 1})
+    if not club and isinstance(app.get('club'), str) and app.get('club'):
+        # Legacy documents store the club name
+        key = ('clubs:name', app['club'])
+        if key not in cache:
+            cache[key] = db.clubs.find_one({'name': app['club']}, {'name': 1})
+        club = cache[key]
+    if club:
+        fields['clubName'] = club.get('name', '')
+        fields['clubRef'] = club['_id']
+    
+    return fields
+
+
+def ensure_read_model_indexes(db):
+    """Create the indexes the read-model queries rely on (idempotent)."""
+    db.applications.create_index([('clubRef', 1), ('status', 1)])
+    db.applications.create_index([('applicant', 1)])
+    db.applications.create_index([('openRole', 1)])
+
+
+def backfill_application_read_model(db, batch_size=500, log=print):
+    """Fill read-model fields on every application that doesn't have them yet.
+
+    Also repairs documents that got a clubRef without the display fields
+    (e.g. from an older migrate_canonical_refs run).
+    """
+    from pymongo import UpdateOne
+    
+    cache = {}
+    updated = 0
+    unresolved = 0
+    batch = []
+    missing = {'$or': [{'clubRef': {'$exists': False}}, {'applicantName': {'$exists': False}}]}
+    for app in db.applications.find(missing).batch_size(batch_size):
+        fields = application_read_model_fields(db, app, cache)
+        if fields['clubRef'] is None:
+            unresolved += 1
+            if app.get('clubRef') is not None:
+                del fields['clubRef']  # keep a reference resolved elsewhere
+        batch.append(UpdateOne({'_id': app['_id']}, {'$set': fields}))
+        if len(batch) >= batch_size:
+            updated += db.applications.bulk_write(batch, ordered=False).modified_count
+            batch = []
+            log(f"[READ_MODEL] Backfilled {updated} applications")
+    if batch:
+        updated += db.applications.bulk_write(batch, ordered=False).modified_count
+    log(f"[READ_MODEL] Backfill done: {updated} updated, {unresolved} without a resolvable club")
+    return {'updated': updated, 'unresolved': unresolved}
+
+
+def reconcile_application_read_model(db, log=print):
+    """Push renamed users, roles and clubs into the denormalized application fields."""
+    counts = {'users': 0, 'roles': 0, 'clubs': 0}
+    
+    for applicant_id in db.applications.distinct('applicant', {'clubRef': {'$exists': True}}):
+        user = db.users.find_one({'_id': _as_object_id(applicant_id)}, {'name': 1, 'email': 1})
+        if not user:
+            continue
+        name, email = user.get('name', ''), user.get('email', '')
+        counts['users'] += db.applications.update_many(
+            {'applicant': applicant_id, '$or': [{'applicantName': {'$ne': name}}, {'applicantEmail': {'$ne': email}}]},
+            {'$set': {'applicantName': name, 'applicantEmail': email}}
+        ).modified_count
+    
+    for role_id in db.applications.distinct('openRole', {'clubRef': {'$exists': True}}):
+        role = db.openroles.find_one({'_id': _as_object_id(role_id)}, {'jobTitle': 1, 'title': 1, 'name': 1})
+        if not role:
+            continue
+        role_name = role.get('jobTitle') or role.get('title') or role.get('name', '')
+        counts['roles'] += db.applications.update_many(
+            {'openRole': role_id, 'roleName': {'$ne': role_name}},
+            {'$set': {'roleName': role_name}}
+        ).modified_count
+    
+    for club_ref in db.applications.distinct('clubRef', {'clubRef': {'$ne': None}}):
+        club = db.clubs.find_one({'_id': club_ref}, {'name': 1})
+        if not club:
+            continue
+        counts['clubs'] += db.applications.update_many(
+            {'clubRef': club_ref, 'clubName': {'$ne': club.get('name', '')}},
+            {'$set': {'clubName': club.get('name', '')}}
+        ).modified_count
+    
+    log(f"[READ_MODEL] Reconciled: {counts}")
+    return counts
+
+
+# ── Canonical references ─────────────────────────────────────────
+# Legacy documents reference the same thing several ways (openRole as
+# ObjectId or string, roleId/positionId, club as ObjectId, string id or
+# name). migrate_canonical_refs.py rewrites them to one ObjectId per
+# relation -- applications.applicant/openRole/clubRef and openroles.club --
+# after which CANONICAL_REFS=true lets queries use plain equality/$in.
+
+CANONICAL_REFS = os.getenv('CANONICAL_REFS', 'false').lower() == 'true'
+CANONICAL_MIGRATION_ID = 'canonical_refs'
+
+
+def canonical_openrole_refs(db, role, lookup_cache=None):
+    """Return ({field: ObjectId}, [unresolved relations]) for an openroles document."""
+    cache = lookup_cache if lookup_cache is not None else {}
+    ref = role.get('club') if role.get('club') is not None else role.get('clubId')
+    club_oid = _as_object_id(ref)
+    if club_oid is None and isinstance(ref, str) and ref:
+        # Legacy documents store the club name
+        key = ('clubs:name', ref)
+        if key not in cache:
+            cache[key] = db.clubs.find_one({'name': ref}, {'name': 1})
+        club_oid = cache[key]['_id'] if cache[key] else None
+    if club_oid is None:
+        return {}, ['club']
+    return {'club': club_oid}, []
+
+
+def canonical_application_refs(db, app, lookup_cache=None):
+    """Return ({field: value}, [unresolved relations]) for an applications document.
+
+    Setting clubRef also sets the read-model display fields that come with it.
+    """
+    cache = lookup_cache if lookup_cache is not None else {}
+    refs, unresolved = {}, []
+    
+    applicant = _as_object_id(app.get('applicant'))
+    if applicant is None:
+        unresolved.append('applicant')
+    else:
+        refs['applicant'] = applicant
+    
+    role = _as_object_id(app.get('openRole') or app.get('roleId') or app.get('positionId'))
+    if role is None:
+        unresolved.append('openRole')
+    else:
+        refs['openRole'] = role
+    
+    if app.get('clubRef') is not None:
+        refs['clubRef'] = app['clubRef']
+    else:
+        # clubRef marks a read-model document, so the display fields go with it
+        fields = application_read_model_fields(db, app, cache)
+        if fields['clubRef'] is None:
+            unresolved.append('clubRef')
+        else:
+            refs.update(fields)
+    return refs, unresolved
+
+
+def ensure_canonical_ref_indexes(db):
+    """Indexes for the single-field filters used once references are canonical."""
+    ensure_read_model_indexes(db)
+    db.openroles.create_index([('club', 1)])
+
+
+def migrate_canonical_refs(db, batch_size=500, restart=False, log=print):
+    """Rewrite openroles, then applications, to canonical ObjectId references.
+
+    Walks each collection in _id order and checkpoints the last processed _id
+    in the `migrations` collection after every batch, so an interrupted run
+    resumes where it stopped (restart=True starts over). Documents that can't
+    be fully resolved are listed in the result; resolvable fields on them are
+    still rewritten.
+    """
+    from pymongo import UpdateOne
+    
+    cache = {}
+    report = {}
+    for collection, canonicalize in (('openroles', canonical_openrole_refs),
+                                     ('applications', canonical_application_refs)):
+        checkpoint_id = f'{CANONICAL_MIGRATION_ID}:{collection}'
+        if restart:
+            db.migrations.delete_one({'_id': checkpoint_id})
+        checkpoint = db.migrations.find_one({'_id': checkpoint_id}) or {}
+        if checkpoint.get('done'):
+            log(f"[MIGRATE] {collection}: already migrated, skipping (use --restart to rerun)")
+            report[collection] = {k: checkpoint.get(k) for k in ('updated', 'unresolved')}
+            continue
+        
+        last_id = checkpoint.get('lastId')
+        updated = checkpoint.get('updated', 0)
+        unresolved = checkpoint.get('unresolved', [])
+        while True:
+            query = {'_id': {'$gt': last_id}} if last_id is not None else {}
+            docs = list(db[collection].find(query).sort('_id', 1).limit(batch_size))
+            if not docs:
+                break
+            batch = []
+            for doc in docs:
+                refs, missing = canonicalize(db, doc, cache)
+                if missing:
+                    unresolved.append({'_id': str(doc['_id']), 'missing': missing})
+                if any(doc.get(field) != value for field, value in refs.items()):
+                    batch.append(UpdateOne({'_id': doc['_id']}, {'$set': refs}))
+            if batch:
+                updated += db[collection].bulk_write(batch, ordered=False).modified_count
+            last_id = docs[-1]['_id']
+            db.migrations.update_one({'_id': checkpoint_id}, {'$set': {
+                'lastId': last_id, 'updated': updated, 'unresolved': unresolved,
+                'updatedAt': datetime.utcnow(),
+            }}, upsert=True)
+            log(f"[MIGRATE] {collection}: {updated} updated, {len(unresolved)} unresolved (through {last_id})")
+        
+        db.migrations.update_one({'_id': checkpoint_id}, {'$set': {'done': True}}, upsert=True)
+        report[collection] = {'updated': updated, 'unresolved': unresolved}
+    
+    ensure_canonical_ref_indexes(db)
+    return report
+
+
 # Demo mode admin mappings (matches frontend DevSessionContext)
 DEMO_ADMINS = {
     'admin@mcgillai.ca': {'name': 'Dr. Smith', 'clubName': 'McGill AI Society', 'clubId': 'c1'},
@@ -246,227 +1171,1199 @@ DEMO_ADMINS = {
 }
 
 
-def get_mongo_context(query=None, user_email=None):
-    """Query MongoDB for relevant context based on user query and user role."""
+# ── Tiered chat context ──────────────────────────────────────────
+# Context is split into three scopes with their own refresh policies:
+#   public  - clubs + open roles, one process-wide snapshot (PUBLIC_CONTEXT_TTL)
+#   club    - hydrated applications, shared by every admin of the same clubs
+#             (CLUB_CONTEXT_TTL, refreshed incrementally from a high-water mark)
+#   session - current user + which club scope they see (CONTEXT_CACHE_TTL)
+# get_mongo_context() composes the three into the dict the prompt builder uses.
+
+PUBLIC_CONTEXT_TTL = int(os.getenv('PUBLIC_CONTEXT_TTL', '60'))  # seconds
+CLUB_CONTEXT_TTL = int(os.getenv('CLUB_CONTEXT_TTL', '30'))  # seconds
+CLUB_SNAPSHOTS_MAX = 500
+CONTEXT_SCHEMA_VERSION = 1
+CONTEXT_APPLICATIONS_LIMIT = 100
+CONTEXT_DELTA_SKEW = 5  # seconds of overlap to tolerate clock skew between writers
+CONTEXT_RECENT_CHANGES = 5  # most recently updated applications kept in the digest
+
+_public_snapshot = {'data': None, 'timestamp': 0}
+_club_snapshots = OrderedDict()  # scope key -> {'applications', 'app_query', 'since', 'schema', 'timestamp'}
+_snapshot_lock = threading.Lock()
+
+
+def _context_metrics():
+    return metrics_group('context_refresh', public=0, session=0, club_full=0, club_delta=0, delta_docs=0)
+
+
+def get_public_snapshot(force=False):
+    """Process-wide clubs/openroles snapshot shared by every session.
+
+    If Mongo is failing, the previous snapshot is returned marked stale.
+    """
+    snapshot = _public_snapshot
+    if not force and snapshot['data'] is not None and time.time() - snapshot['timestamp'] < PUBLIC_CONTEXT_TTL:
+        return snapshot['data']
     try:
-        db = get_mongo_db()
-        context = {}
-        
-        # Skip full user list – not needed for LLM prompt
-        # Only fetch lightweight club info (name, slug, description, tags)
-        clubs = list(db.clubs.find({}, {
-            '_id': 0, 'name': 1, 'slug': 1, 'description': 1,
-            'tags': 1, 'memberCount': 1, 'isRecruiting': 1
-        }).limit(50))
-        context['mongo_clubs'] = clubs
-        print(f"[MONGO_CTX] Fetched {len(clubs)} clubs")
-        
-        # Lightweight open roles (title, description, requirements, deadline)
-        openroles = list(db.openroles.find({}, {
-            '_id': 0, 'title': 1, 'jobTitle': 1, 'description': 1,
-            'requirements': 1, 'deadline': 1, 'isOpen': 1, 'clubName': 1
-        }).limit(50))
-        context['openroles'] = openroles
-        print(f"[MONGO_CTX] Fetched {len(openroles)} openroles")
+        return guarded('mongo', _load_public_snapshot, retries=RETRY_MAX)
+    except Exception as e:
+        if snapshot['data'] is None or not is_transient_error(e):
+            raise
+        _breaker('mongo')['stale_served'] += 1
+        print(f"[MONGO_CTX] Serving stale public snapshot: {e}")
+        return dict(snapshot['data'], stale=True)
+
+
+def _load_public_snapshot():
+    db = get_mongo_db()
+    # Skip full user list – not needed for LLM prompt
+    # Only fetch lightweight club info (name, slug, description, tags)
+    clubs = list(db.clubs.find({}, {
+        '_id': 0, 'name': 1, 'slug': 1, 'description': 1,
+        'tags': 1, 'memberCount': 1, 'isRecruiting': 1
+    }).limit(50))
+    # Lightweight open roles (title, description, requirements, deadline)
+    openroles = list(db.openroles.find({}, {
+        '_id': 0, 'title': 1, 'jobTitle': 1, 'description': 1,
+        'requirements': 1, 'deadline': 1, 'isOpen': 1, 'clubName': 1
+    }).limit(50))
+    data = {
+        'mongo_clubs': clubs,
+        'openroles': openroles,
+        'data_version': catalog_data_version(clubs, openroles),
+    }
+    with _snapshot_lock:
+        _public_snapshot.update(data=data, timestamp=time.time())
+    _context_metrics()['public'] += 1
+    print(f"[MONGO_CTX] Public snapshot: {len(clubs)} clubs, {len(openroles)} openroles")
+    return data
+
+
+def _user_fingerprint(user):
+    if not user:
+        return None
+    return (tuple(sorted(user.get('roles', []))), str(user.get('adminClub') or ''))
+
+
+def _changed_since(since):
+    """Filter for documents written or created after `since`.
+
+    Node writes Date `updatedAt`; backend2 writes ISO-string `updatedAt` /
+    `lastUpdatedAt`, so both types are matched. New documents without
+    timestamps are caught by their ObjectId creation time.
+    """
+    since_iso = since.isoformat()
+    return {'$or': [
+        {'updatedAt': {'$gt': since}},
+        {'updatedAt': {'$gt': since_iso}},
+        {'lastUpdatedAt': {'$gt': since_iso}},
+        {'_id': {'$gt': ObjectId.from_datetime(since)}},
+    ]}
+
+
+def club_scope_key(app_key, app_query):
+    """Identify a club snapshot by which list it fills and the query behind it."""
+    digest = hashlib.sha1(orjson.dumps(app_query, default=_json_default, option=orjson.OPT_SORT_KEYS)).hexdigest()[:16]
+    return f'{app_key}:{digest}'
+
+
+def _load_club_snapshot(db, app_query):
+    started_at = datetime.utcnow()
+    applications_raw = list(db.applications.find(app_query).limit(CONTEXT_APPLICATIONS_LIMIT))
+    applications = [populate_application(db, app) for app in applications_raw]
+    _context_metrics()['club_full'] += 1
+    print(f"[MONGO_CTX] Fetched {len(applications)} applications")
+    for a in applications:
+        print(f"[MONGO_CTX]   - {a.get('applicantName')} ({a.get('applicantEmail')}), status={a.get('status')}, _id={a.get('_id')}")
+    return {'applications': applications, 'app_query': app_query, 'since': started_at,
+            'schema': CONTEXT_SCHEMA_VERSION, 'timestamp': time.time()}
+
+
+def _changed_at(app):
+    return str(app.get('lastUpdatedAt') or app.get('updatedAt') or app.get('submittedAt') or '')
+
+
+def _count_digest(applications):
+    by_status, by_role = {}, {}
+    for a in applications:
+        status = _status_label(a.get('status'))
+        role = a.get('roleName') or 'Unknown'
+        by_status[status] = by_status.get(status, 0) + 1
+        by_role[role] = by_role.get(role, 0) + 1
+    return {'total': len(applications), 'by_status': by_status, 'by_role': by_role}
+
+
+def application_digest(db, applications, app_query):
+    """Totals by status and role plus the most recently updated rows for a club scope.
+
+    Counted from the loaded rows when they are the whole scope; otherwise one
+    $group over app_query, so clubs past CONTEXT_APPLICATIONS_LIMIT are
+    still counted in full.
+    """
+    digest = _count_digest(applications)
+    if len(applications) >= CONTEXT_APPLICATIONS_LIMIT:
+        try:
+            by_status, by_role, total = {}, {}, 0
+            for row in db.applications.aggregate([
+                {'$match': app_query},
+                {'$group': {'_id': {'status': '$status', 'role': '$roleName'}, 'count': {'$sum': 1}}},
+            ]):
+                status = _status_label(row['_id'].get('status'))
+                role = row['_id'].get('role') or 'Unknown'
+                by_status[status] = by_status.get(status, 0) + row['count']
+                by_role[role] = by_role.get(role, 0) + row['count']
+                total += row['count']
+            digest = {'total': total, 'by_status': by_status, 'by_role': by_role}
+        except Exception as e:
+            print(f"[MONGO_CTX] Digest aggregation failed, counting loaded rows: {e}")
+    digest['recent'] = sorted(applications, key=_changed_at, reverse=True)[:CONTEXT_RECENT_CHANGES]
+    return digest
+
+
+def _delta_club_snapshot(db, snapshot):
+    """Merge applications changed since the snapshot's high-water mark.
+
+    The ids currently in scope (an _id-only read of the same window the full
+    load uses) decide membership: deleted or out-of-scope applications are
+    dropped, and unchanged ones that slid into the window are fetched. Returns
+    None when a full reload is needed (schema change or more changes than
+    one delta can carry).
+    """
+    if snapshot.get('schema') != CONTEXT_SCHEMA_VERSION:
+        return None
+    started_at = datetime.utcnow()
+    changed = _changed_since(snapshot['since'] - timedelta(seconds=CONTEXT_DELTA_SKEW))
+    live_ids = [d['_id'] for d in db.applications.find(snapshot['app_query'], {'_id': 1})
+                .limit(CONTEXT_APPLICATIONS_LIMIT)]
+    merged = {a['_id']: a for a in snapshot['applications']}
+    changed_raw = list(db.applications.find({'$and': [snapshot['app_query'], changed]})
+                       .limit(CONTEXT_APPLICATIONS_LIMIT))
+    if len(changed_raw) >= CONTEXT_APPLICATIONS_LIMIT:
+        return None
+    for raw in changed_raw:
+        merged[str(raw['_id'])] = populate_application(db, raw)
+    entered = [i for i in live_ids if str(i) not in merged]
+    if entered:
+        for raw in db.applications.find({'_id': {'$in': entered}}):
+            merged[str(raw['_id'])] = populate_application(db, raw)
+    # Rows inserted after the id read are dropped here; they are newer than
+    # started_at, so the next delta picks them up.
+    applications = [merged[str(i)] for i in live_ids if str(i) in merged]
+    changed_count = len(changed_raw) + len(entered)
+    metrics = _context_metrics()
+    metrics['club_delta'] += 1
+    metrics['delta_docs'] += changed_count
+    print(f"[MONGO_CTX] Delta refresh: {changed_count} changed application(s)")
+    return dict(snapshot, applications=applications, since=started_at, timestamp=time.time())
+
+
+def get_club_snapshot(scope_key, app_query, force=False, touch=True):
+    """Hydrated applications for a club scope, shared by all admins of those clubs.
+
+    touch=False refreshes without marking the scope as recently read (used by
+    the background refresher, so idle scopes go cold).
+    """
+    now = time.time()
+    snapshot = _club_snapshots.get(scope_key)
+    if snapshot and not force and now - snapshot['timestamp'] < CLUB_CONTEXT_TTL:
+        if touch:
+            snapshot['accessed'] = now
+        return snapshot
+    try:
+        refreshed = guarded('mongo', _refresh_club_snapshot, snapshot, app_query, retries=RETRY_MAX)
+    except Exception as e:
+        if not snapshot or not is_transient_error(e):
+            raise
+        _breaker('mongo')['stale_served'] += 1
+        print(f"[MONGO_CTX] Serving stale club snapshot {scope_key}: {e}")
+        return dict(snapshot, stale=True)
+    refreshed['accessed'] = now if touch or not snapshot else snapshot.get('accessed', now)
+    with _snapshot_lock:
+        _club_snapshots[scope_key] = refreshed
+        _club_snapshots.move_to_end(scope_key)
+        while len(_club_snapshots) > CLUB_SNAPSHOTS_MAX:
+            _club_snapshots.popitem(last=False)
+    return refreshed
+
+
+def _refresh_club_snapshot(snapshot, app_query):
+    db = get_mongo_db()
+    refreshed = None
+    if snapshot:
+        try:
+            refreshed = _delta_club_snapshot(db, snapshot)
+        except Exception as e:
+            print(f"MongoDB delta refresh error: {e}")
+    if refreshed is None:
+        refreshed = _load_club_snapshot(db, app_query)
+    refreshed['digest'] = application_digest(db, refreshed['applications'], app_query)
+    return refreshed
+
+
+# ── Authorization principals ─────────────────────────────────────
+# email -> roles + the clubs the user administers, cached for a short TTL so
+# reads, writes and context building don't hit users/clubs on every call. A
+# revoked ADMIN/CLUB_LEADER role therefore keeps access for up to
+# PRINCIPAL_CACHE_TTL seconds unless invalidate_principal() (or POST
+# /principals/invalidate) is called when user or club documents change.
+
+PRINCIPAL_CACHE_TTL = int(os.getenv('PRINCIPAL_CACHE_TTL', '60'))  # seconds
+PRINCIPAL_NEGATIVE_TTL = int(os.getenv('PRINCIPAL_NEGATIVE_TTL', '5'))  # seconds for unknown emails
+PRINCIPAL_CACHE_SIZE = int(os.getenv('PRINCIPAL_CACHE_SIZE', '2048'))  # entries, least recently used evicted
+
+_principal_cache = OrderedDict()  # email -> {'principal': dict | None, 'timestamp': float}
+_principal_lock = threading.Lock()
+
+
+def _principal_metrics():
+    return metrics_group('principal_cache', hits=0, misses=0, invalidations=0)
+
+
+def _load_principal(db, user_email):
+    # Find the user in MongoDB
+    user = db.users.find_one({'email': user_email}, {'passwordHash': 0})
+    # Check for demo mode admin if user not found in MongoDB
+    demo_admin = DEMO_ADMINS.get(user_email)
+    
+    if user:
+        roles = user.get('roles', [])
+        principal = {
+            'email': user.get('email'),
+            'name': user.get('name'),
+            'roles': roles,
+            'demo': False,
+            'admin_clubs': [],
+            'user_fp': _user_fingerprint(user),
+        }
         
-        # Check if user is an admin and get their club's applications
-        if user_email:
-            # Find the user in MongoDB
-            user = db.users.find_one({'email': user_email}, {'passwordHash': 0})
+        # If user is an admin, find the clubs they run
+        if 'ADMIN' in roles or 'CLUB_LEADER' in roles:
+            user_oid = user.get('_id')
+            user_oid_str = str(user_oid)
             
-            # Check for demo mode admin if user not found in MongoDB
-            demo_admin = DEMO_ADMINS.get(user_email)
+            # Find clubs where this user is admin/owner/exec
+            # Check various field names and both ObjectId + string formats
+            admin_clubs = list(db.clubs.find({
+                '$or': [
+                    {'adminEmail': user_email},
+                    {'ownerEmail': user_email},
+                    {'email': user_email},
+                    {'admin': user_email},
+                    {'admins': user_email},
+                    {'admins': user_oid},           # ObjectId in admins array
+                    {'execs': user_oid},            # ObjectId in execs array
+                    {'leaderId': user_oid_str},
+                    {'adminId': user_oid_str},
+                ]
+            }, {'name': 1, 'slug': 1}))
             
-            if user:
-                context['current_user'] = {
-                    'email': user.get('email'),
-                    'name': user.get('name'),
-                    'roles': user.get('roles', [])
-                }
-                
-                # If user is an admin, get applications for their clubs
-                if 'ADMIN' in user.get('roles', []) or 'CLUB_LEADER' in user.get('roles', []):
-                    user_oid = user.get('_id')
-                    user_oid_str = str(user_oid)
-                    
-                    # Find clubs where this user is admin/owner/exec
-                    # Check various field names and both ObjectId + string formats
-                    admin_clubs = list(db.clubs.find({
-                        '$or': [
-                            {'adminEmail': user_email},
-                            {'ownerEmail': user_email},
-                            {'email': user_email},
-                            {'admin': user_email},
-                            {'admins': user_email},
-                            {'admins': user_oid},           # ObjectId in admins array
-                            {'execs': user_oid},            # ObjectId in execs array
-                            {'leaderId': user_oid_str},
-                            {'adminId': user_oid_str},
-                        ]
-                    }))
-                    
-                    # Also check if user has adminClub field pointing to a club
-                    if not admin_clubs and user.get('adminClub'):
-                        admin_club_id = user.get('adminClub')
-                        club = db.clubs.find_one({'_id': admin_club_id if isinstance(admin_club_id, ObjectId) else ObjectId(admin_club_id)})
-                        if club:
-                            admin_clubs = [club]
-                    
-                    if admin_clubs:
-                        context['admin_clubs'] = [{
-                            'name': c.get('name'),
-                            'slug': c.get('slug'),
-                            'id': str(c.get('_id'))
-                        } for c in admin_clubs]
-                        
-                        # Get applications for these clubs
-                        club_ids = [str(c.get('_id')) for c in admin_clubs]
-                        club_names = [c.get('name') for c in admin_clubs]
-                        club_slugs = [c.get('slug') for c in admin_clubs]
-                        
-                        applications_raw = list(db.applications.find({
-                            '$or': [
-                                {'clubId': {'$in': club_ids}},
-                                {'club': {'$in': club_names}},
-                                {'clubSlug': {'$in': club_slugs}}
-                            ]
-                        }).limit(100))
-                        
-                        # Populate applicant info for each application
-                        applications = [populate_application(db, app) for app in applications_raw]
-                        
-                        context['club_applications'] = applications
-                        print(f"[MONGO_CTX] Admin clubs: {[c.get('name') for c in admin_clubs]}")
-                        print(f"[MONGO_CTX] Fetched {len(applications)} club_applications")
-                        for a in applications:
-                            print(f"[MONGO_CTX]   - {a.get('applicantName')} ({a.get('applicantEmail')}), status={a.get('status')}, _id={a.get('_id')}")
-                    else:
-                        # Admin but no specific club - show all applications
-                        if 'ADMIN' in user.get('roles', []):
-                            applications_raw = list(db.applications.find({}).limit(100))
-                            applications = [populate_application(db, app) for app in applications_raw]
-                            context['all_applications'] = applications
-                            print(f"[MONGO_CTX] Global admin: fetched {len(applications)} all_applications")
+            # Also check if user has adminClub field pointing to a club
+            if not admin_clubs and user.get('adminClub'):
+                admin_club_id = user.get('adminClub')
+                club = db.clubs.find_one({'_id': admin_club_id if isinstance(admin_club_id, ObjectId) else ObjectId(admin_club_id)}, {'name': 1, 'slug': 1})
+                if club:
+                    admin_clubs = [club]
+            principal['admin_clubs'] = admin_clubs
+    
+    elif demo_admin:
+        # Demo mode: user not in MongoDB but is a recognized demo admin
+        demo_club_name = demo_admin['clubName']
+        principal = {
+            'email': user_email,
+            'name': demo_admin['name'],
+            'roles': ['ADMIN'],
+            'demo': True,
+            'demo_club_name': demo_club_name,
+            # Find clubs matching the demo admin's club
+            'admin_clubs': list(db.clubs.find({
+                '$or': [
+                    {'name': demo_club_name},
+                    {'name': {'$regex': demo_club_name, '$options': 'i'}}
+                ]
+            }, {'name': 1, 'slug': 1})),
+            'user_fp': None,
+        }
+    else:
+        return None
+    
+    principal['is_admin'] = 'ADMIN' in principal['roles'] or 'CLUB_LEADER' in principal['roles']
+    principal['club_ids'] = frozenset(c['_id'] for c in principal['admin_clubs'])
+    return principal
+
+
+def get_principal(db, user_email):
+    """Cached roles/admin clubs for user_email, or None if the user is unknown."""
+    metrics = _principal_metrics()
+    with _principal_lock:
+        cached = _principal_cache.get(user_email)
+        if cached:
+            ttl = PRINCIPAL_CACHE_TTL if cached['principal'] else PRINCIPAL_NEGATIVE_TTL
+            if time.time() - cached['timestamp'] < ttl:
+                _principal_cache.move_to_end(user_email)
+                metrics['hits'] += 1
+                return cached['principal']
+    metrics['misses'] += 1
+    principal = _load_principal(db, user_email)
+    with _principal_lock:
+        _principal_cache[user_email] = {'principal': principal, 'timestamp': time.time()}
+        _principal_cache.move_to_end(user_email)
+        while len(_principal_cache) > PRINCIPAL_CACHE_SIZE:
+            _principal_cache.popitem(last=False)
+    return principal
+
+
+def invalidate_principal(user_email=None):
+    """Forget one cached principal, or all of them (e.g. after a club's admins change)."""
+    with _principal_lock:
+        if user_email is None:
+            _principal_cache.clear()
+        else:
+            _principal_cache.pop(user_email, None)
+    _principal_metrics()['invalidations'] += 1
+
+
+def resolve_session_scope(db, user_email):
+    """Work out who the user is and which applications they may see.
+
+    Returns the thin per-session layer: current_user, admin_clubs and the
+    (app_key, app_query) naming the shared club snapshot, if any.
+    """
+    scope = {'current_user': None, 'admin_clubs': None, 'app_key': None, 'app_query': None, 'user_fp': None}
+    if not user_email:
+        return scope
+    
+    principal = get_principal(db, user_email)
+    if not principal:
+        return scope
+    scope['user_fp'] = principal['user_fp']
+    scope['current_user'] = {
+        'email': principal['email'],
+        'name': principal['name'],
+        'roles': principal['roles']
+    }
+    if not principal['is_admin']:
+        return scope
+    
+    admin_clubs = principal['admin_clubs']
+    if admin_clubs:
+        scope['admin_clubs'] = [{
+            'name': c.get('name'),
+            'slug': c.get('slug'),
+            'id': str(c.get('_id'))
+        } for c in admin_clubs]
+        
+        # Get applications for these clubs
+        club_ids = [str(c.get('_id')) for c in admin_clubs]
+        club_names = [c.get('name') for c in admin_clubs]
+        club_slugs = [c.get('slug') for c in admin_clubs]
+        club_object_ids = [c.get('_id') for c in admin_clubs]
+        scope['app_key'] = 'club_applications'
+        
+        if APPLICATION_READ_MODEL or CANONICAL_REFS:
+            role_ids = [r['_id'] for r in db.openroles.find(
+                {'club': {'$in': club_object_ids if CANONICAL_REFS else club_object_ids + club_ids}}, {'_id': 1})]
+            scope['app_query'] = read_model_app_query(club_object_ids, role_ids)
+        elif not principal['demo']:
+            scope['app_query'] = {
+                '$or': [
+                    {'clubId': {'$in': club_ids}},
+                    {'club': {'$in': club_names}},
+                    {'clubSlug': {'$in': club_slugs}}
+                ]
+            }
+        else:
+            # Demo admins: find applications via the clubs' openRoles
+            open_roles = list(db.openroles.find({
+                '$or': [
+                    {'club': {'$in': club_object_ids}},  # ObjectId reference
+                    {'club': {'$in': club_ids}},  # String ID
+                    {'clubId': {'$in': club_ids}},
+                ]
+            }))
+            role_ids = [r.get('_id') for r in open_roles]
+            role_id_strs = [str(r.get('_id')) for r in open_roles]
             
-            elif demo_admin:
-                # Demo mode: user not in MongoDB but is a recognized demo admin
-                context['current_user'] = {
-                    'email': user_email,
-                    'name': demo_admin['name'],
-                    'roles': ['ADMIN']
+            # Find applications that reference these openRoles
+            if role_ids:
+                scope['app_query'] = {
+                    '$or': [
+                        {'openRole': {'$in': role_ids}},
+                        {'openRole': {'$in': role_id_strs}},
+                        {'roleId': {'$in': role_id_strs}},
+                        {'clubId': {'$in': club_ids}},
+                        {'club': {'$in': club_names}}
+                    ]
                 }
-                
-                # Find clubs matching the demo admin's club
-                demo_club_name = demo_admin['clubName']
-                admin_clubs = list(db.clubs.find({
+            else:
+                # No roles found, try direct club match
+                scope['app_query'] = {
                     '$or': [
-                        {'name': demo_club_name},
-                        {'name': {'$regex': demo_club_name, '$options': 'i'}}
+                        {'clubId': {'$in': club_ids}},
+                        {'club': {'$in': club_names}}
                     ]
-                }))
-                
-                if admin_clubs:
-                    context['admin_clubs'] = [{
-                        'name': c.get('name'),
-                        'slug': c.get('slug'),
-                        'id': str(c.get('_id'))
-                    } for c in admin_clubs]
-                    
-                    # Get applications for these clubs via openRoles
-                    club_ids = [str(c.get('_id')) for c in admin_clubs]
-                    club_names = [c.get('name') for c in admin_clubs]
-                    club_object_ids = [c.get('_id') for c in admin_clubs]
-                    
-                    # Find all openRoles for these clubs
-                    open_roles = list(db.openroles.find({
-                        '$or': [
-                            {'club': {'$in': club_object_ids}},  # ObjectId reference
-                            {'club': {'$in': club_ids}},  # String ID
-                            {'clubId': {'$in': club_ids}},
-                        ]
-                    }))
-                    
-                    # Get role IDs
-                    role_ids = [r.get('_id') for r in open_roles]
-                    role_id_strs = [str(r.get('_id')) for r in open_roles]
-                    
-                    # Find applications that reference these openRoles
-                    if role_ids:
-                        applications_raw = list(db.applications.find({
-                            '$or': [
-                                {'openRole': {'$in': role_ids}},
-                                {'openRole': {'$in': role_id_strs}},
-                                {'roleId': {'$in': role_id_strs}},
-                                {'clubId': {'$in': club_ids}},
-                                {'club': {'$in': club_names}}
-                            ]
-                        }).limit(100))
-                    else:
-                        # No roles found, try direct club match
-                        applications_raw = list(db.applications.find({
-                            '$or': [
-                                {'clubId': {'$in': club_ids}},
-                                {'club': {'$in': club_names}}
-                            ]
-                        }).limit(100))
-                    
-                    applications = [populate_application(db, app) for app in applications_raw]
-                    context['club_applications'] = applications
-                    print(f"[MONGO_CTX] Demo admin clubs: {[c.get('name') for c in admin_clubs]}")
-                    print(f"[MONGO_CTX] Fetched {len(applications)} club_applications (via openRoles)")
-                    for a in applications:
-                        print(f"[MONGO_CTX]   - {a.get('applicantName')} ({a.get('applicantEmail')}), status={a.get('status')}, _id={a.get('_id')}")
-                else:
-                    # Demo admin but club not found - show all applications as fallback
-                    context['admin_clubs'] = [{'name': demo_club_name, 'slug': demo_club_name.lower().replace(' ', '-'), 'id': 'demo'}]
-                    applications_raw = list(db.applications.find({}).limit(100))
-                    applications = [populate_application(db, app) for app in applications_raw]
-                    context['all_applications'] = applications
-        
-        return context
+                }
+        print(f"[MONGO_CTX] Admin clubs: {club_names}")
+    elif principal['demo']:
+        # Demo admin but club not found - show all applications as fallback
+        demo_club_name = principal['demo_club_name']
+        scope['admin_clubs'] = [{'name': demo_club_name, 'slug': demo_club_name.lower().replace(' ', '-'), 'id': 'demo'}]
+        scope['app_key'] = 'all_applications'
+        scope['app_query'] = {}
+    elif 'ADMIN' in principal['roles']:
+        # Admin but no specific club - show all applications
+        scope['app_key'] = 'all_applications'
+        scope['app_query'] = {}
+    
+    if scope['app_key']:
+        scope['scope_key'] = club_scope_key(scope['app_key'], scope['app_query'])
+    _context_metrics()['session'] += 1
+    return scope
+
+
+def compose_mongo_context(scope, force_club_refresh=False):
+    """Assemble the prompt context from the public, club and session layers.
+
+    The returned dict shares lists with the cached snapshots; treat it as read-only.
+    """
+    context = dict(get_public_snapshot())
+    if scope['current_user']:
+        context['current_user'] = scope['current_user']
+    if scope['admin_clubs'] is not None:
+        context['admin_clubs'] = scope['admin_clubs']
+    if scope['app_key']:
+        snapshot = get_club_snapshot(scope['scope_key'], scope['app_query'], force=force_club_refresh)
+        context[scope['app_key']] = snapshot['applications']
+        if snapshot.get('stale'):
+            context['stale'] = True
+        context['application_digest'] = snapshot['digest']
+        context['application_query'] = scope['app_query']
+    return context
+
+
+def get_mongo_context(query=None, user_email=None):
+    """Query MongoDB for relevant context based on user query and user role."""
+    try:
+        scope = resolve_session_scope(get_mongo_db(), user_email)
+        return compose_mongo_context(scope)
     except Exception as e:
         print(f"MongoDB error: {e}")
         return {'error': str(e)}
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for frontend requests
 
-def get_snowflake_conn(use_db=True):
-    params = dict(
-        user=os.getenv('SNOWFLAKE_USER'),
-        password=os.getenv('SNOWFLAKE_PASSWORD'),
-        account=os.getenv('SNOWFLAKE_ACCOUNT'),
-        warehouse=os.getenv('SNOWFLAKE_WAREHOUSE'),
-    )
-    if use_db:
-        params['database'] = 'MCWICS_APP'
-        params['schema'] = 'PUBLIC'
-    return snowflake.connector.connect(**params)
+def get_session_context(session_id, user_email, force_club_refresh=False):
+    """Context for a chat turn: cached per-session scope over the shared snapshots."""
+    cache_key = f"{session_id}:{user_email}"
+    start_context_refresher()
+    _refresher['last_request'] = time.time()
+    try:
+        cached = _context_cache.get(cache_key)
+        now = time.time()
+        if cached and (now - cached['timestamp']) < CONTEXT_CACHE_TTL:
+            scope = cached['scope']
+        else:
+            try:
+                scope = guarded('mongo', lambda: resolve_session_scope(get_mongo_db(), user_email), retries=RETRY_MAX)
+                _context_cache[cache_key] = {'scope': scope, 'timestamp': now}
+            except Exception as e:
+                # Keep using the expired scope while Mongo is down
+                if not cached or not is_transient_error(e):
+                    raise
+                scope = cached['scope']
+        return compose_mongo_context(scope, force_club_refresh)
+    except Exception as e:
+        print(f"MongoDB error: {e}")
+        return {'error': str(e)}
+
+
+
+# ── Refresh-ahead ────────────────────────────────────────────────
+# A background thread per worker reloads hot club snapshots (read within
+# CONTEXT_HOT_WINDOW) shortly before they expire, and the public snapshot on
+# a fixed jittered schedule while chat is in use, so /chat requests don't pay
+# for a reload. Refreshes run on a small pool (CONTEXT_REFRESH_CONCURRENCY).
+
+CONTEXT_REFRESHER = os.getenv('CONTEXT_REFRESHER', 'true').lower() == 'true'
+CONTEXT_REFRESH_INTERVAL = float(os.getenv('CONTEXT_REFRESH_INTERVAL', '2'))  # seconds between scans
+CONTEXT_REFRESH_AHEAD = float(os.getenv('CONTEXT_REFRESH_AHEAD', '5'))  # seconds before expiry
+CONTEXT_REFRESH_JITTER = float(os.getenv('CONTEXT_REFRESH_JITTER', '2'))  # seconds, only ever earlier
+CONTEXT_HOT_WINDOW = int(os.getenv('CONTEXT_HOT_WINDOW', '120'))  # seconds since last read
+CONTEXT_REFRESH_CONCURRENCY = int(os.getenv('CONTEXT_REFRESH_CONCURRENCY', '2'))
+
+_refresher = {'thread': None, 'pid': None, 'inflight': set(), 'next_public': 0, 'last_request': 0}
+_refresher_lock = threading.Lock()
+
+
+def _refresher_metrics():
+    return metrics_group('context_refresher', scans=0, public=0, club=0, skipped_cold=0, deferred=0, errors=0)
+
+
+def _refresh_lead():
+    return CONTEXT_REFRESH_AHEAD + random.uniform(0, CONTEXT_REFRESH_JITTER)
+
+
+def _refresh_club_ahead(scope_key, app_query):
+    try:
+        get_club_snapshot(scope_key, app_query, force=True, touch=False)
+        _refresher_metrics()['club'] += 1
+    except Exception as e:
+        _refresher_metrics()['errors'] += 1
+        print(f"[REFRESH] Club snapshot {scope_key} failed: {e}")
+    finally:
+        with _refresher_lock:
+            _refresher['inflight'].discard(scope_key)
+
+
+def refresh_ahead_once(executor):
+    """One scan: schedule refreshes for everything hot and about to expire."""
+    metrics = _refresher_metrics()
+    metrics['scans'] += 1
+    now = time.time()
+    
+    if now >= _refresher['next_public'] and now - _refresher['last_request'] < CONTEXT_HOT_WINDOW:
+        try:
+            get_public_snapshot(force=True)
+            metrics['public'] += 1
+        except Exception as e:
+            metrics['errors'] += 1
+            print(f"[REFRESH] Public snapshot failed: {e}")
+        _refresher['next_public'] = now + max(PUBLIC_CONTEXT_TTL - _refresh_lead(), CONTEXT_REFRESH_INTERVAL)
+    
+    with _snapshot_lock:
+        snapshots = list(_club_snapshots.items())
+    for scope_key, snapshot in snapshots:
+        if now - snapshot.get('accessed', 0) > CONTEXT_HOT_WINDOW:
+            metrics['skipped_cold'] += 1
+            continue
+        if now - snapshot['timestamp'] < CLUB_CONTEXT_TTL - _refresh_lead():
+            continue
+        with _refresher_lock:
+            if scope_key in _refresher['inflight']:
+                continue
+            if len(_refresher['inflight']) >= CONTEXT_REFRESH_CONCURRENCY:
+                metrics['deferred'] += 1  # picked up on the next scan
+                continue
+            _refresher['inflight'].add(scope_key)
+        executor.submit(_refresh_club_ahead, scope_key, snapshot['app_query'])
+
+
+def _refresher_loop():
+    executor = ThreadPoolExecutor(max_workers=CONTEXT_REFRESH_CONCURRENCY, thread_name_prefix='context-refresh')
+    while True:
+        try:
+            refresh_ahead_once(executor)
+        except Exception as e:
+            print(f"[REFRESH] Scan failed: {e}")
+        time.sleep(CONTEXT_REFRESH_INTERVAL)
+
+
+def start_context_refresher():
+    """Start this worker's refresher thread once (threads don't survive fork)."""
+    if not CONTEXT_REFRESHER or _refresher['pid'] == os.getpid():
+        return
+    with _refresher_lock:
+        if _refresher['pid'] == os.getpid():
+            return
+        _refresher.update(pid=os.getpid(), inflight=set(), next_public=0)
+        _refresher['thread'] = threading.Thread(target=_refresher_loop, name='context-refresher', daemon=True)
+        _refresher['thread'].start()
+
+
+app = Flask(__name__)
+CORS(app)  # Enable CORS for frontend requests
+
+# Process-wide counters exposed by GET /metrics, grouped by subsystem
+METRICS = {}
+
+
+def metrics_group(name, **defaults):
+    """Return the METRICS dict for a subsystem, creating it with defaults if needed."""
+    return METRICS.setdefault(name, dict(defaults))
+
+
+# ── Response compression ─────────────────────────────────────────
+# Negotiated via Accept-Encoding: brotli when the client and server both
+# support it, otherwise gzip. Streamed responses are compressed chunk by
+# chunk with a sync flush so the first bytes still go out immediately.
+
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))  # bytes
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', '6'))  # gzip 1-9
+COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', '4'))  # brotli 0-11
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html'}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _compression_metrics(encoding):
+    group = metrics_group('compression')
+    return group.setdefault(encoding, {'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_seconds': 0.0, 'ratio': None})
+
+
+def _record_compression(encoding, bytes_in, bytes_out, cpu_seconds):
+    stats = _compression_metrics(encoding)
+    stats['bytes_in'] += bytes_in
+    stats['bytes_out'] += bytes_out
+    stats['cpu_seconds'] += cpu_seconds
+    if stats['bytes_out']:
+        stats['ratio'] = round(stats['bytes_in'] / stats['bytes_out'], 2)
+
+
+def _negotiate_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted.quality('br') > 0:
+        return 'br'
+    if accepted.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def _new_compressor(encoding):
+    """Return (compress(chunk), flush(final)) callables for an encoding."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        return compressor.process, lambda final: compressor.finish() if final else compressor.flush()
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    return compressor.compress, lambda final: compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def _compress_stream(chunks, encoding):
+    compress, flush = _new_compressor(encoding)
+    _compression_metrics(encoding)['responses'] += 1
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        started = time.thread_time()
+        out = compress(chunk) + flush(False)
+        _record_compression(encoding, len(chunk), len(out), time.thread_time() - started)
+        if out:
+            yield out
+    started = time.thread_time()
+    out = flush(True)
+    _record_compression(encoding, 0, len(out), time.thread_time() - started)
+    if out:
+        yield out
+
+
+@app.after_request
+def compress_response(response):
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = _negotiate_encoding()
+    if not encoding:
+        return response
+    
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        compress, flush = _new_compressor(encoding)
+        started = time.thread_time()
+        compressed = compress(data) + flush(True)
+        _compression_metrics(encoding)['responses'] += 1
+        _record_compression(encoding, len(data), len(compressed), time.thread_time() - started)
+        response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Process-level counters (compression, caches, limits, ...)."""
+    return json_response(METRICS)
+
+
+@app.route('/principals/invalidate', methods=['POST'])
+def invalidate_principals():
+    """Drop cached principals after users or clubs change elsewhere (body: {"email": ...} or {})."""
+    denied = _profile_access_denied()
+    if denied:
+        return denied
+    data = request.get_json(silent=True) or {}
+    invalidate_principal(data.get('email'))
+    _context_cache.clear()
+    return jsonify({'message': 'Principal cache invalidated'})
+
+
+# ── Request profiling ────────────────────────────────────────────
+# Opt-in statistical profiles of single requests. A request is profiled when
+# it carries X-Profile: <PROFILE_TOKEN> (or ?profile=<PROFILE_TOKEN>), or as
+# 1 in PROFILE_SAMPLE_EVERY requests to PROFILE_ENDPOINTS. A native thread
+# samples the request's stack every PROFILE_INTERVAL_MS; the folded stacks
+# (flamegraph.pl / speedscope / inferno input) are written to PROFILE_DIR
+# together with wall time spent in Mongo, Snowflake and Cortex, and can be
+# fetched from GET /profiles/<id>. Stacks are rooted at the dependency the
+# request was waiting on, so a flamegraph splits by [mongo]/[snowflake]/...
+
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')  # unset: header/flag triggers and /profiles are disabled
+PROFILE_SAMPLE_EVERY = int(os.getenv('PROFILE_SAMPLE_EVERY', '0'))  # 0 = no sampling
+PROFILE_ENDPOINTS = set(filter(None, os.getenv('PROFILE_ENDPOINTS', 'chat,get_club_applications').split(',')))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '120'))  # sampler gives up after this
+PROFILE_DIR = os.getenv('PROFILE_DIR', '/tmp/backend2-profiles')  # shared by all workers on the box
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '100'))  # newest profiles kept on disk
+PROFILE_MAX_DEPTH = 128
+# Operational endpoints gated by the same token (see _profile_access_denied)
+TOKEN_ENDPOINTS = {'list_profiles', 'get_profile', 'get_memory', 'invalidate_principals'}
+
+_profile_local = threading.local()  # greenlet-local under gevent
+_profile_counter_lock = threading.Lock()
+_profile_counter = 0
+
+
+def _profiling_metrics():
+    return metrics_group('profiling', profiles=0, triggered=0, sampled=0, samples=0, rejected_tokens=0)
+
+
+def _native(module, name):
+    """The stdlib callable gevent hasn't patched, so the sampler is a real OS thread."""
+    if COOPERATIVE_IO:
+        return sys.modules['gevent.monkey'].get_original(module, name)
+    return getattr(importlib.import_module(module), name)
+
+
+def active_profile():
+    return getattr(_profile_local, 'profile', None)
+
+
+def _supplied_profile_token():
+    return request.headers.get('X-Profile') or request.args.get('profile') or ''
+
+
+def _profile_token_ok(supplied):
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(supplied.encode(), PROFILE_TOKEN.encode())
+
+
+def _profile_trigger():
+    """'header' / 'sampled' if this request should be profiled, else None."""
+    global _profile_counter
+    supplied = _supplied_profile_token()
+    if supplied:
+        if _profile_token_ok(supplied):
+            return 'header'
+        _profiling_metrics()['rejected_tokens'] += 1
+    if PROFILE_SAMPLE_EVERY > 0 and request.endpoint in PROFILE_ENDPOINTS:
+        with _profile_counter_lock:
+            _profile_counter += 1
+            if _profile_counter % PROFILE_SAMPLE_EVERY == 0:
+                return 'sampled'
+    return None
+
+
+def _fold_stack(frame):
+    names = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _profile_frame(profile):
+    # Under gevent a suspended greenlet (i.e. one waiting on I/O) keeps its own
+    # frame; a running one is whatever the OS thread is currently executing.
+    glet = profile['greenlet']
+    if glet is not None and glet.gr_frame is not None:
+        return glet.gr_frame
+    return sys._current_frames().get(profile['thread'])
+
+
+def _sample_loop(profile):
+    sleep = _native('time', 'sleep')
+    interval = PROFILE_INTERVAL_MS / 1000
+    deadline = time.perf_counter() + PROFILE_MAX_SECONDS
+    while profile['running'] and time.perf_counter() < deadline:
+        frame = _profile_frame(profile)
+        if frame is not None:
+            waiting_on = profile['active'][-1] if profile['active'] else 'python'
+            stack = f"[{waiting_on}];{_fold_stack(frame)}"
+            with profile['lock']:
+                if not profile['running']:
+                    break
+                profile['stacks'][stack] = profile['stacks'].get(stack, 0) + 1
+        sleep(interval)
+
+
+def start_profile(trigger):
+    data = request.get_json(silent=True) if request.is_json else None
+    if not isinstance(data, dict):
+        data = {}
+    profile = {
+        'id': f"{int(time.time())}-{os.getpid()}-{os.urandom(3).hex()}",
+        'trigger': trigger,
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'user_email': request.args.get('user_email') or data.get('user_email'),
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'started': time.perf_counter(),
+        'thread': _native('_thread', 'get_ident')(),
+        'greenlet': sys.modules['greenlet'].getcurrent() if COOPERATIVE_IO else None,
+        'active': [],
+        'spans': {},
+        'stacks': {},
+        'lock': _native('_thread', 'allocate_lock')(),  # guards stacks/running against the sampler thread
+        'running': True,
+    }
+    _profile_local.profile = profile
+    _profiling_metrics()['sampled' if trigger == 'sampled' else 'triggered'] += 1
+    _native('_thread', 'start_new_thread')(_sample_loop, (profile,))
+    return profile
+
+
+@contextmanager
+def profile_span(dependency):
+    """Attribute the wall time of the enclosed call to dependency in the active profile."""
+    profile = active_profile()
+    if profile is None:
+        yield
+        return
+    profile['active'].append(dependency)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile['active'].pop()
+        _record_span(profile, dependency, time.perf_counter() - started)
+
+
+def _record_span(profile, dependency, seconds):
+    span = profile['spans'].setdefault(dependency, {'calls': 0, 'seconds': 0.0})
+    span['calls'] += 1
+    span['seconds'] = round(span['seconds'] + seconds, 6)
+
+
+def mongo_profile_listeners():
+    """pymongo command listeners feeding Mongo round trips into the active profile."""
+    monitoring = lazy_import('pymongo.monitoring')
+
+    class MongoProfileListener(monitoring.CommandListener):
+        def started(self, event):
+            profile = active_profile()
+            if profile is not None:
+                profile['active'].append('mongo')
+
+        def succeeded(self, event):
+            self._finish(event)
+
+        def failed(self, event):
+            self._finish(event)
+
+        def _finish(self, event):
+            profile = active_profile()
+            if profile is not None and profile['active'] and profile['active'][-1] == 'mongo':
+                profile['active'].pop()
+                _record_span(profile, 'mongo', event.duration_micros / 1e6)
+
+    return [MongoProfileListener()]
+
+
+def _profile_path(profile_id, suffix):
+    if not re.fullmatch(r'[0-9a-f-]+', profile_id):
+        return None
+    return os.path.join(PROFILE_DIR, f"{profile_id}.{suffix}")
+
+
+def finish_profile(profile, status=None):
+    # Once running is cleared under the lock the sampler never writes again,
+    # so the copy below is final even if the sampler thread hasn't exited yet.
+    with profile['lock']:
+        profile['running'] = False
+        stacks = dict(profile['stacks'])
+    wall = time.perf_counter() - profile['started']
+    attributed = sum(span['seconds'] for span in profile['spans'].values())
+    samples = sum(stacks.values())
+    meta = {key: profile[key] for key in ('id', 'trigger', 'method', 'path', 'endpoint', 'user_email', 'started_at', 'spans')}
+    meta.update(
+        status=status,
+        wall_seconds=round(wall, 6),
+        other_seconds=round(max(0.0, wall - attributed), 6),
+        samples=samples,
+        interval_ms=PROFILE_INTERVAL_MS,
+    )
+    metrics = _profiling_metrics()
+    metrics['profiles'] += 1
+    metrics['samples'] += samples
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(_profile_path(profile['id'], 'folded'), 'w') as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+        with open(_profile_path(profile['id'], 'json'), 'w') as f:
+            json.dump(meta, f)
+        _prune_profiles()
+    except OSError as e:
+        print(f"[PROFILE] Could not write profile {profile['id']}: {e}")
+    print(f"[PROFILE] {profile['id']} {profile['method']} {profile['path']} wall={wall:.3f}s "
+          f"samples={samples} spans={profile['spans']}")
+    return meta
+
+
+def _prune_profiles():
+    metas = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith('.json'))
+    for name in metas[:max(0, len(metas) - PROFILE_KEEP)]:
+        for suffix in ('json', 'folded'):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name[:-len('json')] + suffix))
+            except OSError:
+                pass
+
+
+@app.before_request
+def start_request_profile():
+    _profile_local.profile = None
+    if request.endpoint in TOKEN_ENDPOINTS:
+        return  # X-Profile authenticates these, it doesn't profile them
+    trigger = _profile_trigger()
+    if trigger:
+        start_profile(trigger)
+
+
+@app.after_request
+def tag_profiled_response(response):
+    profile = active_profile()
+    if profile is not None:
+        profile['status'] = response.status_code
+        response.headers['X-Profile-Id'] = profile['id']
+    return response
+
+
+@app.teardown_request
+def finish_request_profile(exc):
+    profile = active_profile()
+    if profile is not None:
+        _profile_local.profile = None
+        finish_profile(profile, profile.get('status', 500 if exc else None))
+
+
+def _profile_access_denied():
+    if not _profile_token_ok(_supplied_profile_token()):
+        return jsonify({'error': 'This endpoint requires X-Profile: <PROFILE_TOKEN>'}), 403
+    return None
+
+
+@app.route('/profiles')
+def list_profiles():
+    """Newest-first profile summaries (wall time, dependency spans, sample count)."""
+    denied = _profile_access_denied()
+    if denied:
+        return denied
+    profiles = []
+    if os.path.isdir(PROFILE_DIR):
+        for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(PROFILE_DIR, name)) as f:
+                        profiles.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+    return jsonify(profiles)
+
+
+@app.route('/profiles/<profile_id>')
+def get_profile(profile_id):
+    """Folded stacks for one profile (?format=json for its summary)."""
+    denied = _profile_access_denied()
+    if denied:
+        return denied
+    suffix = 'json' if request.args.get('format') == 'json' else 'folded'
+    path = _profile_path(profile_id, suffix)
+    if path is None or not os.path.exists(path):
+        return jsonify({'error': 'Profile not found'}), 404
+    with open(path) as f:
+        body = f.read()
+    if suffix == 'json':
+        return Response(body, mimetype='application/json')
+    return Response(body, mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename="{profile_id}.folded"'})
+
+
+def get_snowflake_conn(use_db=True, **extra):
+    params = dict(
+        user=os.getenv('SNOWFLAKE_USER'),
+        password=os.getenv('SNOWFLAKE_PASSWORD'),
+        account=os.getenv('SNOWFLAKE_ACCOUNT'),
+        warehouse=os.getenv('SNOWFLAKE_WAREHOUSE'),
+    )
+    if use_db:
+        params['database'] = 'MCWICS_APP'
+        params['schema'] = 'PUBLIC'
+    params.update(extra)
+    return lazy_import('snowflake.connector').connect(**params)
+
+
+SNOWFLAKE_LOGIN_TIMEOUT = int(os.getenv('SNOWFLAKE_LOGIN_TIMEOUT', '10'))  # seconds
+SNOWFLAKE_QUERY_TIMEOUT = int(os.getenv('SNOWFLAKE_QUERY_TIMEOUT', '20'))  # seconds per statement
+
+SNOWFLAKE_SESSION_EXPIRED_ERRNOS = {390111, 390112, 390114}  # session gone / expired / token expired
+
+_snowflake_conn = None
+_snowflake_conn_lock = threading.Lock()
+
+
+def get_shared_snowflake_conn():
+    """Return this worker's long-lived Snowflake connection, logging in on first use.
+
+    The connector is thread-safe at the connection level (threadsafety=2), so
+    request threads share one session and only open their own cursors.
+    Statements use server-side `?` binds (qmark), so the statement text stays
+    the same across parameter values.
+    """
+    global _snowflake_conn
+    conn = _snowflake_conn
+    if conn is not None and not conn.is_closed():
+        return conn
+    with _snowflake_conn_lock:
+        if _snowflake_conn is None or _snowflake_conn.is_closed():
+            _snowflake_conn = get_snowflake_conn(client_session_keep_alive=True, paramstyle='qmark',
+                                                 login_timeout=SNOWFLAKE_LOGIN_TIMEOUT)
+        return _snowflake_conn
+
+
+def is_snowflake_session_expired(err):
+    return (getattr(err, 'errno', None) in SNOWFLAKE_SESSION_EXPIRED_ERRNOS
+            and any(cls.__name__ in ('ProgrammingError', 'OperationalError') for cls in type(err).__mro__))
+
+
+def drop_shared_snowflake_conn(conn):
+    """Forget conn as the shared connection (unless another thread already replaced it)."""
+    global _snowflake_conn
+    with _snowflake_conn_lock:
+        if _snowflake_conn is conn:
+            _snowflake_conn = None
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def run_on_snowflake(work):
+    """Call work(cursor) on the shared connection.
+
+    is_closed() doesn't notice a session the server has expired, so on a
+    session-expired error the connection is dropped and work is retried once
+    on a fresh login. The statement was rejected before it ran, so this is
+    safe for writes too.
+    """
+    for attempt in range(2):
+        conn = get_shared_snowflake_conn()
+        cs = conn.cursor()
+        try:
+            return work(cs)
+        except Exception as e:
+            if attempt or not is_snowflake_session_expired(e):
+                raise
+            print(f"[SNOWFLAKE] Session expired ({e.errno}), reconnecting")
+            metrics_group('snowflake_sessions', reconnects=0)['reconnects'] += 1
+            drop_shared_snowflake_conn(conn)
+        finally:
+            cs.close()
+
+
+# ── Statement templates ──────────────────────────────────────────
+# Filter endpoints build SQL from fixed clause templates with `?` binds, so
+# each filter combination maps to one statement text. Snowflake can then
+# reuse the compiled plan and, for repeated values, the result cache.
+# Reuse is counted under `snowflake_statements` in GET /metrics.
+
+LIKE_ANY_BUCKETS = (1, 2, 4, 8)  # padded term counts for LIKE ANY
+STATEMENT_TRACK_MAX = 2048
+
+_seen_templates = OrderedDict()
+_seen_statements = OrderedDict()
+_statement_lock = threading.Lock()
+
+
+def sql_select(base, *conditions, suffix=''):
+    """Join (clause, params) conditions onto a SELECT; None conditions are skipped.
+
+    Returns (sql, params). The SQL only depends on which conditions are
+    present, never on their values.
+    """
+    clauses, params = [], []
+    for condition in conditions:
+        if condition is None:
+            continue
+        clause, values = condition
+        clauses.append(clause)
+        params.extend(values)
+    sql = base
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    return sql + suffix, tuple(params)
+
+
+def like_any(column, terms):
+    """`LOWER(column) LIKE ANY (...)` over substring patterns, or None if no terms.
+
+    The bind count is padded (repeating the last pattern) up to the next
+    LIKE_ANY_BUCKETS size so 3 and 4 interests share one statement text.
+    Extra terms beyond the largest bucket are dropped.
+    """
+    patterns = [f'%{t.lower()}%' for t in terms if t][:LIKE_ANY_BUCKETS[-1]]
+    if not patterns:
+        return None
+    size = next(b for b in LIKE_ANY_BUCKETS if b >= len(patterns))
+    patterns += [patterns[-1]] * (size - len(patterns))
+    return f"LOWER({column}) LIKE ANY ({', '.join(['?'] * size)})", patterns
+
+
+def _remember(seen, key):
+    """True if key was seen before; keeps the most recent STATEMENT_TRACK_MAX keys."""
+    if key in seen:
+        seen.move_to_end(key)
+        return True
+    seen[key] = True
+    if len(seen) > STATEMENT_TRACK_MAX:
+        seen.popitem(last=False)
+    return False
+
+
+def record_statement(sql, params):
+    metrics = metrics_group('snowflake_statements', executions=0, templates=0,
+                            template_reuse=0, identical_reuse=0)
+    statement_key = (sql, repr(params))
+    with _statement_lock:
+        metrics['executions'] += 1
+        if _remember(_seen_templates, sql):
+            metrics['template_reuse'] += 1  # same text: compiled plan can be reused
+        else:
+            metrics['templates'] += 1
+        if _remember(_seen_statements, statement_key):
+            metrics['identical_reuse'] += 1  # same text and values: result-cache candidate
 
 
 def query_snowflake(sql, params=None):
-    """Run a SELECT and return list-of-dicts."""
-    conn = get_snowflake_conn()
-    cs = conn.cursor()
-    try:
-        cs.execute(sql, params)
+    """Run a SELECT and return list-of-dicts (retried on transient failures)."""
+    record_statement(sql, params)
+    return guarded('snowflake', _run_query, sql, params, retries=RETRY_MAX)
+
+
+def _run_query(sql, params):
+    def work(cs):
+        cs.execute(sql, params, timeout=SNOWFLAKE_QUERY_TIMEOUT)
         cols = [desc[0].lower() for desc in cs.description]
-        rows = [dict(zip(cols, row)) for row in cs.fetchall()]
-        return rows
-    finally:
-        cs.close()
-        conn.close()
+        return [dict(zip(cols, row)) for row in cs.fetchall()]
+    
+    with profile_span('snowflake'):
+        return run_on_snowflake(work)
 
 
 def execute_snowflake(sql, params=None):
-    """Run a non-SELECT statement."""
-    conn = get_snowflake_conn()
-    cs = conn.cursor()
-    try:
-        cs.execute(sql, params)
-    finally:
-        cs.close()
-        conn.close()
+    """Run a non-SELECT statement (never retried - writes aren't idempotent)."""
+    record_statement(sql, params)
+    guarded('snowflake', _run_statement, sql, params)
+
+
+def _run_statement(sql, params):
+    with profile_span('snowflake'):
+        run_on_snowflake(lambda cs: cs.execute(sql, params, timeout=SNOWFLAKE_QUERY_TIMEOUT))
 
 @app.route('/')
 def hello():
@@ -475,7 +2372,7 @@ def hello():
 @app.route('/snowflake-test')
 def snowflake_test():
     try:
-        ctx = snowflake.connector.connect(
+        ctx = lazy_import('snowflake.connector').connect(
             user=os.getenv('SNOWFLAKE_USER'),
             password=os.getenv('SNOWFLAKE_PASSWORD'),
             account=os.getenv('SNOWFLAKE_ACCOUNT'),
@@ -522,7 +2419,7 @@ def mongo_test():
 def create_snowflake_db():
     db_name = os.getenv('SNOWFLAKE_DATABASE') or 'MY_NEW_DATABASE'
     try:
-        ctx = snowflake.connector.connect(
+        ctx = lazy_import('snowflake.connector').connect(
             user=os.getenv('SNOWFLAKE_USER'),
             password=os.getenv('SNOWFLAKE_PASSWORD'),
             account=os.getenv('SNOWFLAKE_ACCOUNT'),
@@ -539,7 +2436,7 @@ def create_snowflake_db():
 @app.route('/init-snowflake-app', methods=['POST'])
 def init_snowflake_app():
     try:
-        ctx = snowflake.connector.connect(
+        ctx = lazy_import('snowflake.connector').connect(
             user=os.getenv('SNOWFLAKE_USER'),
             password=os.getenv('SNOWFLAKE_PASSWORD'),
             account=os.getenv('SNOWFLAKE_ACCOUNT'),
@@ -628,29 +2525,28 @@ def get_clubs():
     recruiting = request.args.get('recruiting')
     min_members = request.args.get('min_members')
 
-    sql = 'SELECT * FROM clubs WHERE 1=1'
-    if tag:
-        sql += f" AND LOWER(tags) LIKE '%{tag.lower()}%'"
-    if recruiting is not None:
-        sql += f" AND is_recruiting = {'TRUE' if recruiting.lower() == 'true' else 'FALSE'}"
-    if min_members:
-        sql += f" AND member_count >= {int(min_members)}"
     try:
-        return jsonify(query_snowflake(sql))
+        sql, params = sql_select(
+            'SELECT * FROM clubs',
+            like_any('tags', [tag]) if tag else None,
+            ('is_recruiting = ?', [recruiting.lower() == 'true']) if recruiting is not None else None,
+            ('member_count >= ?', [int(min_members)]) if min_members else None,
+        )
+        return serve_stale_on_error('snowflake', ('clubs', sql, params), lambda: query_snowflake(sql, params))
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
 
 
 # GET /clubs/<slug>  – single club by slug
 @app.route('/clubs/<slug>')
 def get_club(slug):
     try:
-        rows = query_snowflake("SELECT * FROM clubs WHERE slug = %s", (slug,))
+        rows = query_snowflake("SELECT * FROM clubs WHERE slug = ?", (slug,))
         if not rows:
             return jsonify({'error': 'Club not found'}), 404
         return jsonify(rows[0])
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
 
 
 # POST /clubs  – create a new club
@@ -660,13 +2556,14 @@ def create_club():
     try:
         execute_snowflake(
             """INSERT INTO clubs (id, slug, name, description, tags, member_count, is_recruiting, created_at)
-               VALUES (%s, %s, %s, %s, %s, %s, %s, CURRENT_DATE)""",
+               VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_DATE)""",
             (data['id'], data['slug'], data['name'], data.get('description', ''),
              data.get('tags', ''), data.get('member_count', 0), data.get('is_recruiting', False))
         )
+        invalidate_completion_cache()
         return jsonify({'message': f"Club '{data['name']}' created."}), 201
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
 
 
 # PUT /clubs/<slug>  – update a club
@@ -675,24 +2572,26 @@ def update_club(slug):
     data = request.json
     try:
         execute_snowflake(
-            """UPDATE clubs SET name=%s, description=%s, tags=%s,
-               member_count=%s, is_recruiting=%s WHERE slug=%s""",
+            """UPDATE clubs SET name=?, description=?, tags=?,
+               member_count=?, is_recruiting=? WHERE slug=?""",
             (data['name'], data.get('description', ''), data.get('tags', ''),
              data.get('member_count', 0), data.get('is_recruiting', False), slug)
         )
+        invalidate_completion_cache()
         return jsonify({'message': f"Club '{slug}' updated."})
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
 
 
 # DELETE /clubs/<slug>  – delete a club
 @app.route('/clubs/<slug>', methods=['DELETE'])
 def delete_club(slug):
     try:
-        execute_snowflake("DELETE FROM clubs WHERE slug = %s", (slug,))
+        execute_snowflake("DELETE FROM clubs WHERE slug = ?", (slug,))
+        invalidate_completion_cache()
         return jsonify({'message': f"Club '{slug}' deleted."})
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
 
 
 #  POSITIONS
@@ -703,27 +2602,27 @@ def get_positions():
     club_id = request.args.get('club_id')
     is_open = request.args.get('is_open')
 
-    sql = 'SELECT * FROM positions WHERE 1=1'
-    if club_id:
-        sql += f" AND club_id = '{club_id}'"
-    if is_open is not None:
-        sql += f" AND is_open = {'TRUE' if is_open.lower() == 'true' else 'FALSE'}"
+    sql, params = sql_select(
+        'SELECT * FROM positions',
+        ('club_id = ?', [club_id]) if club_id else None,
+        ('is_open = ?', [is_open.lower() == 'true']) if is_open is not None else None,
+    )
     try:
-        return jsonify(query_snowflake(sql))
+        return jsonify(query_snowflake(sql, params))
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
 
 
 # GET /positions/<position_id>  – single position
 @app.route('/positions/<position_id>')
 def get_position(position_id):
     try:
-        rows = query_snowflake("SELECT * FROM positions WHERE id = %s", (position_id,))
+        rows = query_snowflake("SELECT * FROM positions WHERE id = ?", (position_id,))
         if not rows:
             return jsonify({'error': 'Position not found'}), 404
         return jsonify(rows[0])
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
 
 
 # POST /positions  – create a new position
@@ -733,24 +2632,297 @@ def create_position():
     try:
         execute_snowflake(
             """INSERT INTO positions (id, club_id, title, description, requirements, deadline, is_open, applicant_count, created_at)
-               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, CURRENT_DATE)""",
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_DATE)""",
             (data['id'], data['club_id'], data['title'], data.get('description', ''),
              data.get('requirements', ''), data.get('deadline'), data.get('is_open', True),
              data.get('applicant_count', 0))
         )
+        invalidate_completion_cache()
+        if data.get('is_open', True):
+            index_deadline(deadline_entry('snowflake', data['id'], data['title'], data['club_id'], None, data.get('deadline')))
         return jsonify({'message': f"Position '{data['title']}' created."}), 201
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
 
 
 # DELETE /positions/<position_id>  – delete a position
 @app.route('/positions/<position_id>', methods=['DELETE'])
 def delete_position(position_id):
     try:
-        execute_snowflake("DELETE FROM positions WHERE id = %s", (position_id,))
+        execute_snowflake("DELETE FROM positions WHERE id = ?", (position_id,))
+        invalidate_completion_cache()
+        unindex_deadline(f'snowflake:{position_id}')
         return jsonify({'message': f"Position '{position_id}' deleted."})
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
+
+
+# ── Deadline index ───────────────────────────────────────────────
+# Open Snowflake positions and Mongo open roles, sorted by deadline in memory
+# (one SortedList overall plus one per club) so "next N deadlines" and
+# "closing in the next D days" are O(log n + k) range scans. Position writes
+# through this API update it in place (building it first if needed); it is
+# rebuilt in the background every DEADLINE_INDEX_TTL seconds to pick up
+# changes made elsewhere.
+
+DEADLINE_INDEX_TTL = int(os.getenv('DEADLINE_INDEX_TTL', '300'))  # seconds
+DEADLINES_MAX_LIMIT = 500
+DEADLINE_BUILD_RETRY = int(os.getenv('DEADLINE_BUILD_RETRY', '10'))  # seconds between failed first builds
+
+_deadline_index = {'all': SortedList(), 'by_club': {}, 'entries': {}, 'built_at': 0, 'rebuilding': False,
+                   'retry_at': 0}
+_deadline_lock = threading.Lock()
+_deadline_build_lock = threading.Lock()
+
+
+def _deadline_metrics():
+    return metrics_group('deadline_index', builds=0, build_errors=0, build_seconds=None, entries=0,
+                         queries=0, updates=0)
+
+
+def parse_deadline(value):
+    """Deadline as a naive UTC datetime, or None. Date-only values mean the end of that day."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, date):
+        return datetime(value.year, value.month, value.day, 23, 59, 59)
+    else:
+        text = str(value).strip()
+        try:
+            parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if len(text) == 10:
+            return parsed.replace(hour=23, minute=59, second=59)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def deadline_entry(source, position_id, title, club_id, club_name, deadline):
+    """Index entry for a position/role, or None if it has no usable deadline."""
+    parsed = parse_deadline(deadline)
+    if parsed is None:
+        return None
+    return {
+        'id': f'{source}:{position_id}',
+        'source': source,
+        'positionId': str(position_id),
+        'title': title or '',
+        'clubId': str(club_id or ''),
+        'clubName': club_name or _known_club_name(str(club_id or '')),
+        'deadline': parsed,
+        'rawDeadline': deadline,
+    }
+
+
+def _known_club_name(club_id):
+    with _deadline_lock:
+        keys = _deadline_index['by_club'].get(club_id)
+        entry = _deadline_index['entries'].get(keys[0][1]) if keys else None
+        return entry['clubName'] if entry else ''
+
+
+def _insert_deadline(index, entry):
+    key = (entry['deadline'], entry['id'])
+    index['entries'][entry['id']] = entry
+    index['all'].add(key)
+    index['by_club'].setdefault(entry['clubId'], SortedList()).add(key)
+
+
+def _remove_deadline(index, entry_id):
+    entry = index['entries'].pop(entry_id, None)
+    if entry:
+        key = (entry['deadline'], entry['id'])
+        index['all'].discard(key)
+        club_keys = index['by_club'].get(entry['clubId'])
+        if club_keys is not None:
+            club_keys.discard(key)
+
+
+def index_deadline(entry):
+    """Add or replace one position in the live index, building the index first if needed."""
+    if entry is None:
+        return
+    try:
+        get_deadline_index()
+    except Exception as e:
+        # The position is written; the first successful build loads it from the source
+        print(f"[DEADLINES] Index not built, {entry['id']} left to the next build: {e}")
+        return
+    with _deadline_lock:
+        _remove_deadline(_deadline_index, entry['id'])
+        _insert_deadline(_deadline_index, entry)
+    _deadline_metrics()['updates'] += 1
+
+
+def unindex_deadline(entry_id):
+    with _deadline_lock:
+        _remove_deadline(_deadline_index, entry_id)
+    _deadline_metrics()['updates'] += 1
+
+
+def _snowflake_deadline_entries():
+    rows = query_snowflake(
+        "SELECT p.id, p.title, p.club_id, c.name AS club_name, p.deadline FROM positions p "
+        "JOIN clubs c ON p.club_id = c.id WHERE p.is_open = TRUE AND p.deadline IS NOT NULL"
+    )
+    entries = (deadline_entry('snowflake', row['id'], row['title'], row['club_id'], row['club_name'], row['deadline'])
+               for row in rows)
+    return [entry for entry in entries if entry]
+
+
+def _mongo_deadline_entries():
+    db = get_mongo_db()
+    club_names = {c['_id']: c.get('name', '') for c in db.clubs.find({}, {'name': 1})}
+    entries = []
+    for role in db.openroles.find({'isOpen': {'$ne': False}, 'deadline': {'$nin': [None, '']}},
+                                  {'jobTitle': 1, 'title': 1, 'club': 1, 'clubId': 1, 'clubName': 1, 'deadline': 1}):
+        club_ref = role.get('club') or role.get('clubId')
+        club_oid = _as_object_id(club_ref)
+        entry = deadline_entry('mongo', role['_id'], role.get('jobTitle') or role.get('title'),
+                               club_oid or club_ref, club_names.get(club_oid) or role.get('clubName'), role['deadline'])
+        if entry:
+            entries.append(entry)
+    return entries
+
+
+def build_deadline_index():
+    """Load every open position/role with a deadline and swap in a fresh index.
+
+    Each source is read in full before anything is indexed. A source that
+    fails keeps its entries from the previous index instead of dropping out
+    (or being half-loaded).
+    """
+    started = time.perf_counter()
+    metrics = _deadline_metrics()
+    index = {'all': SortedList(), 'by_club': {}, 'entries': {}}
+    loaded = 0
+    error = None
+    
+    for source, load in (('snowflake', _snowflake_deadline_entries), ('mongo', _mongo_deadline_entries)):
+        try:
+            entries = load()
+            loaded += 1
+        except Exception as e:
+            error = e
+            metrics['build_errors'] += 1
+            print(f"[DEADLINES] {source} deadlines not refreshed: {e}")
+            with _deadline_lock:
+                entries = [entry for entry in _deadline_index['entries'].values() if entry['source'] == source]
+        for entry in entries:
+            _insert_deadline(index, entry)
+    
+    # Keep the previous index if both sources failed. With no previous index,
+    # stay unbuilt (so callers see the error, not an empty index) and retry
+    # after DEADLINE_BUILD_RETRY seconds.
+    if not loaded:
+        if not _deadline_index['built_at']:
+            _deadline_index['retry_at'] = time.time() + DEADLINE_BUILD_RETRY
+            raise error
+        return _deadline_index
+    with _deadline_lock:
+        _deadline_index.update(index, built_at=time.time())
+    metrics['builds'] += 1
+    metrics['entries'] = len(index['entries'])
+    metrics['build_seconds'] = round(time.perf_counter() - started, 4)
+    return _deadline_index
+
+
+def _rebuild_deadline_index():
+    try:
+        build_deadline_index()
+    finally:
+        _deadline_index['rebuilding'] = False
+
+
+def get_deadline_index():
+    """The deadline index: built on first use, rebuilt in the background once older than the TTL.
+
+    Raises while the first build keeps failing (DependencyUnavailable between retries).
+    """
+    if not _deadline_index['built_at']:
+        wait = _deadline_index['retry_at'] - time.time()
+        if wait > 0:
+            raise DependencyUnavailable('deadlines', wait)
+        with _deadline_build_lock:
+            if not _deadline_index['built_at']:
+                build_deadline_index()
+    elif time.time() - _deadline_index['built_at'] > DEADLINE_INDEX_TTL and not _deadline_index['rebuilding']:
+        _deadline_index['rebuilding'] = True
+        threading.Thread(target=_rebuild_deadline_index, name='deadline-index', daemon=True).start()
+    return _deadline_index
+
+
+def upcoming_deadlines(limit=10, within_days=None, club_id=None, source=None, now=None):
+    """Next `limit` deadlines from now (optionally within D days, for one club or source)."""
+    index = get_deadline_index()
+    _deadline_metrics()['queries'] += 1
+    now = now or datetime.utcnow()
+    maximum = (now + timedelta(days=within_days), '\uffff') if within_days is not None else None
+    with _deadline_lock:
+        keys = index['all'] if club_id is None else index['by_club'].get(club_id)
+        if not keys:
+            return []
+        entries = (index['entries'][key[1]] for key in keys.irange(minimum=(now, ''), maximum=maximum))
+        return list(islice((e for e in entries if source is None or e['source'] == source), limit))
+
+
+def deadlines_by_club(per_club, within_days=None, now=None):
+    """{club id: next `per_club` deadlines} for every club with an upcoming deadline."""
+    index = get_deadline_index()
+    _deadline_metrics()['queries'] += 1
+    now = now or datetime.utcnow()
+    maximum = (now + timedelta(days=within_days), '\uffff') if within_days is not None else None
+    grouped = {}
+    with _deadline_lock:
+        for club_id, keys in index['by_club'].items():
+            upcoming = [index['entries'][key[1]] for key in islice(keys.irange(minimum=(now, ''), maximum=maximum), per_club)]
+            if upcoming:
+                grouped[club_id] = upcoming
+    return grouped
+
+
+def serialize_deadline(entry):
+    return {
+        'positionId': entry['positionId'],
+        'source': entry['source'],
+        'title': entry['title'],
+        'clubId': entry['clubId'],
+        'clubName': entry['clubName'],
+        'deadline': entry['deadline'].isoformat(),
+    }
+
+
+# GET /deadlines  – upcoming deadlines across positions and open roles
+@app.route('/deadlines')
+def get_deadlines():
+    """Optional: ?days=7, ?limit=20, ?club=<club id or name>, ?per_club=3 (group by club)."""
+    try:
+        days = request.args.get('days', type=int)
+        limit = min(request.args.get('limit', 20, type=int), DEADLINES_MAX_LIMIT)
+        per_club = request.args.get('per_club', type=int)
+        club = request.args.get('club')
+        
+        if per_club:
+            grouped = deadlines_by_club(min(per_club, DEADLINES_MAX_LIMIT), within_days=days)
+            return jsonify({'clubs': [
+                {'clubId': club_id, 'clubName': entries[0]['clubName'],
+                 'deadlines': [serialize_deadline(e) for e in entries]}
+                for club_id, entries in sorted(grouped.items(), key=lambda kv: kv[1][0]['deadline'])
+            ]})
+        
+        club_id = None
+        if club:
+            index = get_deadline_index()
+            club_id = club if club in index['by_club'] else next(
+                (e['clubId'] for e in index['entries'].values() if e['clubName'].lower() == club.lower()), club)
+        entries = upcoming_deadlines(limit=limit, within_days=days, club_id=club_id)
+        return jsonify({'deadlines': [serialize_deadline(e) for e in entries]})
+    except Exception as e:
+        return dependency_error_response(e)
 
 #  RECRUITMENT VIEW  (read-only, joins clubs + positions)
 
@@ -759,7 +2931,7 @@ def get_recruitment():
     try:
         return jsonify(query_snowflake('SELECT * FROM recruitment_chat_view'))
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
 
 #  SEARCH  – full-text style search across clubs & positions
 @app.route('/search')
@@ -770,42 +2942,45 @@ def search():
     like = f"%{q}%"
     try:
         clubs = query_snowflake(
-            "SELECT * FROM clubs WHERE LOWER(name) LIKE LOWER(%s) OR LOWER(tags) LIKE LOWER(%s) OR LOWER(description) LIKE LOWER(%s)",
+            "SELECT * FROM clubs WHERE LOWER(name) LIKE LOWER(?) OR LOWER(tags) LIKE LOWER(?) OR LOWER(description) LIKE LOWER(?)",
             (like, like, like)
         )
         positions = query_snowflake(
-            "SELECT * FROM positions WHERE LOWER(title) LIKE LOWER(%s) OR LOWER(requirements) LIKE LOWER(%s) OR LOWER(description) LIKE LOWER(%s)",
+            "SELECT * FROM positions WHERE LOWER(title) LIKE LOWER(?) OR LOWER(requirements) LIKE LOWER(?) OR LOWER(description) LIKE LOWER(?)",
             (like, like, like)
         )
         return jsonify({'clubs': clubs, 'positions': positions})
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
 
 #  ANALYTICS / STATS
 
 @app.route('/stats')
 def stats():
     try:
-        club_count = query_snowflake('SELECT COUNT(*) AS count FROM clubs')[0]['count']
-        recruiting_count = query_snowflake('SELECT COUNT(*) AS count FROM clubs WHERE is_recruiting = TRUE')[0]['count']
-        position_count = query_snowflake('SELECT COUNT(*) AS count FROM positions')[0]['count']
-        open_positions = query_snowflake('SELECT COUNT(*) AS count FROM positions WHERE is_open = TRUE')[0]['count']
-        total_applicants = query_snowflake('SELECT COALESCE(SUM(applicant_count),0) AS total FROM positions')[0]['total']
-        top_clubs = query_snowflake('SELECT name, member_count FROM clubs ORDER BY member_count DESC LIMIT 5')
-        upcoming_deadlines = query_snowflake(
-            "SELECT p.title, c.name AS club_name, p.deadline FROM positions p JOIN clubs c ON p.club_id = c.id WHERE p.is_open = TRUE ORDER BY p.deadline ASC LIMIT 5"
-        )
-        return jsonify({
-            'total_clubs': club_count,
-            'recruiting_clubs': recruiting_count,
-            'total_positions': position_count,
-            'open_positions': open_positions,
-            'total_applicants': total_applicants,
-            'top_clubs_by_members': top_clubs,
-            'upcoming_deadlines': upcoming_deadlines,
-        })
+        return serve_stale_on_error('snowflake', 'stats', _load_stats)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
+
+
+def _load_stats():
+    club_count = query_snowflake('SELECT COUNT(*) AS count FROM clubs')[0]['count']
+    recruiting_count = query_snowflake('SELECT COUNT(*) AS count FROM clubs WHERE is_recruiting = TRUE')[0]['count']
+    position_count = query_snowflake('SELECT COUNT(*) AS count FROM positions')[0]['count']
+    open_positions = query_snowflake('SELECT COUNT(*) AS count FROM positions WHERE is_open = TRUE')[0]['count']
+    total_applicants = query_snowflake('SELECT COALESCE(SUM(applicant_count),0) AS total FROM positions')[0]['total']
+    top_clubs = query_snowflake('SELECT name, member_count FROM clubs ORDER BY member_count DESC LIMIT 5')
+    upcoming = [{'title': e['title'], 'club_name': e['clubName'], 'deadline': e['rawDeadline']}
+                for e in upcoming_deadlines(limit=5, source='snowflake')]
+    return {
+        'total_clubs': club_count,
+        'recruiting_clubs': recruiting_count,
+        'total_positions': position_count,
+        'open_positions': open_positions,
+        'total_applicants': total_applicants,
+        'top_clubs_by_members': top_clubs,
+        'upcoming_deadlines': upcoming,
+    }
 
 
 
@@ -817,15 +2992,18 @@ def recommend():
     if not interests:
         return jsonify({'error': 'Provide ?interests=tag1,tag2'}), 400
     tags = [t.strip() for t in interests.split(',')]
-    conditions = " OR ".join([f"LOWER(tags) LIKE '%{t.lower()}%'" for t in tags])
+    interest_filter = like_any('tags', tags)
+    if not interest_filter:
+        return jsonify({'error': 'Provide ?interests=tag1,tag2'}), 400
     try:
-        clubs = query_snowflake(f"SELECT * FROM clubs WHERE ({conditions}) AND is_recruiting = TRUE")
-        positions = query_snowflake(
-            f"SELECT p.*, c.name AS club_name FROM positions p JOIN clubs c ON p.club_id = c.id WHERE ({conditions}) AND p.is_open = TRUE"
-        )
+        clubs = query_snowflake(*sql_select('SELECT * FROM clubs', interest_filter, ('is_recruiting = TRUE', [])))
+        positions = query_snowflake(*sql_select(
+            'SELECT p.*, c.name AS club_name FROM positions p JOIN clubs c ON p.club_id = c.id',
+            interest_filter, ('p.is_open = TRUE', []),
+        ))
         return jsonify({'recommended_clubs': clubs, 'recommended_positions': positions})
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
 
 
 #  CHATBOT - Snowflake Cortex with Mistral
@@ -833,6 +3011,343 @@ def recommend():
 # Store chat history per session (in production, use Redis or database)
 chat_sessions = {}
 
+
+# ── Chat admission control ───────────────────────────────────────
+# Token buckets per user email and per session stop one client from flooding
+# /chat; a global semaphore caps in-flight Cortex calls, with a short bounded
+# wait queue in front of it. Rejections are fast 429s with Retry-After.
+# Under gevent a waiting Cortex call only costs a greenlet, so the in-flight
+# cap defaults much higher there.
+
+CHAT_USER_RATE = float(os.getenv('CHAT_USER_RATE', '0.5'))  # tokens/second per user email
+CHAT_USER_BURST = int(os.getenv('CHAT_USER_BURST', '5'))
+CHAT_SESSION_RATE = float(os.getenv('CHAT_SESSION_RATE', '0.5'))  # tokens/second per session
+CHAT_SESSION_BURST = int(os.getenv('CHAT_SESSION_BURST', '5'))
+CHAT_MAX_INFLIGHT = int(os.getenv('CHAT_MAX_INFLIGHT', '256' if COOPERATIVE_IO else '8'))  # concurrent Cortex calls per worker
+CHAT_MAX_QUEUED = int(os.getenv('CHAT_MAX_QUEUED', '256' if COOPERATIVE_IO else '16'))
+CHAT_QUEUE_TIMEOUT = float(os.getenv('CHAT_QUEUE_TIMEOUT', '2'))  # seconds
+RATE_BUCKETS_MAX = 10000
+
+_rate_buckets = {}  # key -> {'tokens': float, 'updated': float}
+_rate_lock = threading.Lock()
+_llm_slots = threading.BoundedSemaphore(CHAT_MAX_INFLIGHT)
+_llm_queued = 0
+
+
+class ChatRejected(Exception):
+    """Raised when admission control turns a chat request away."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _admission_metrics():
+    return metrics_group('chat_admission', admitted=0, rejected={}, inflight=0, queued=0,
+                         queue_wait_seconds_total=0.0, queue_wait_seconds_max=0.0)
+
+
+def _reject(reason, retry_after):
+    rejected = _admission_metrics()['rejected']
+    rejected[reason] = rejected.get(reason, 0) + 1
+    raise ChatRejected(reason, retry_after)
+
+
+def take_rate_token(key, rate, burst):
+    """Take one token from key's bucket. Returns 0 on success, else seconds until one is free."""
+    now = time.monotonic()
+    with _rate_lock:
+        bucket = _rate_buckets.get(key)
+        if bucket is None:
+            if len(_rate_buckets) >= RATE_BUCKETS_MAX:
+                # Drop buckets that have refilled completely - they carry no state
+                for k in [k for k, b in _rate_buckets.items() if b['tokens'] + (now - b['updated']) * rate >= burst]:
+                    del _rate_buckets[k]
+            bucket = _rate_buckets[key] = {'tokens': float(burst), 'updated': now}
+        bucket['tokens'] = min(burst, bucket['tokens'] + (now - bucket['updated']) * rate)
+        bucket['updated'] = now
+        if bucket['tokens'] >= 1:
+            bucket['tokens'] -= 1
+            return 0
+        return (1 - bucket['tokens']) / rate
+
+
+def check_chat_rate_limits(session_id, user_email):
+    """Raise ChatRejected if this user or session is over its rate."""
+    if user_email:
+        wait = take_rate_token(f'user:{user_email.lower()}', CHAT_USER_RATE, CHAT_USER_BURST)
+        if wait:
+            _reject('user_rate', wait)
+    wait = take_rate_token(f'session:{session_id}', CHAT_SESSION_RATE, CHAT_SESSION_BURST)
+    if wait:
+        _reject('session_rate', wait)
+
+
+@contextmanager
+def llm_slot():
+    """Hold one of the CHAT_MAX_INFLIGHT Cortex slots, waiting briefly if all are busy."""
+    global _llm_queued
+    metrics = _admission_metrics()
+    started = time.monotonic()
+    if not _llm_slots.acquire(blocking=False):
+        with _rate_lock:
+            if _llm_queued >= CHAT_MAX_QUEUED:
+                _reject('queue_full', CHAT_QUEUE_TIMEOUT)
+            _llm_queued += 1
+            metrics['queued'] = _llm_queued
+        try:
+            acquired = _llm_slots.acquire(timeout=CHAT_QUEUE_TIMEOUT)
+        finally:
+            with _rate_lock:
+                _llm_queued -= 1
+                metrics['queued'] = _llm_queued
+        if not acquired:
+            _reject('queue_timeout', CHAT_QUEUE_TIMEOUT)
+    waited = time.monotonic() - started
+    with _rate_lock:
+        metrics['admitted'] += 1
+        metrics['inflight'] += 1
+        metrics['queue_wait_seconds_total'] += waited
+        metrics['queue_wait_seconds_max'] = max(metrics['queue_wait_seconds_max'], waited)
+    try:
+        yield
+    finally:
+        with _rate_lock:
+            metrics['inflight'] -= 1
+        _llm_slots.release()
+
+
+def chat_rejected_response(err):
+    retry_after = max(1, int(err.retry_after + 0.999))
+    response = jsonify({'error': 'Too many chat requests, please retry shortly', 'reason': err.reason,
+                        'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+# ── Structured admin query fast path ─────────────────────────────
+# "Show me applications to my club", "how many are under review", "list
+# rejected applicants" are fully answerable from the applications already in
+# the session context. These are rendered locally as Markdown instead of
+# asking Cortex to reformat a JSON blob. Anything open-ended, or naming a
+# particular applicant, falls through. All words and phrases are matched on
+# word boundaries of the normalized message ("new" doesn't match "newest").
+
+FAST_PATH_STATUS_WORDS = [
+    ('under review', 'UNDER_REVIEW'), ('in review', 'UNDER_REVIEW'), ('reviewing', 'UNDER_REVIEW'),
+    ('interview', 'INTERVIEW_SCHEDULED'), ('interviews', 'INTERVIEW_SCHEDULED'),
+    ('interviewing', 'INTERVIEW_SCHEDULED'), ('waitlist', 'WAITLISTED'), ('waitlisted', 'WAITLISTED'),
+    ('accepted', 'ACCEPTED'), ('rejected', 'REJECTED'), ('withdrawn', 'WITHDRAWN'), ('submitted', 'SUBMITTED'),
+    ('pending', 'SUBMITTED'), ('new', 'SUBMITTED'),
+]
+FAST_PATH_TOPIC_WORDS = ['application', 'applications', 'applicant', 'applicants', 'candidate', 'candidates',
+                         'status', 'statuses', 'role', 'roles']
+FAST_PATH_OPEN_ENDED = ['why', 'should', 'recommend', 'suggest', 'best', 'compare', 'insight', 'advice',
+                        'strongest', 'weakest', 'answer', 'think', 'opinion', 'email', 'write', 'draft']
+FAST_PATH_LIST_WORDS = ['show', 'list', 'see', 'view', 'display', 'who', 'which', 'give me', 'get']
+FAST_PATH_COUNT_WORDS = ['how many', 'count', 'number of', 'total']
+FAST_PATH_SUMMARY_WORDS = ['breakdown', 'summary', 'summarize', 'stats', 'statistics', 'by status', 'by role', 'overview']
+
+
+def _fast_path_metrics():
+    return metrics_group('chat_fast_path', answered={}, llm_fallbacks=0)
+
+
+def _status_label(status):
+    return (status or 'SUBMITTED').upper()
+
+
+def _markdown_table(headers, rows):
+    lines = ['| ' + ' | '.join(headers) + ' |', '| ' + ' | '.join('---' for _ in headers) + ' |']
+    for row in rows:
+        lines.append('| ' + ' | '.join(str(v).replace('|', '\\|') for v in row) + ' |')
+    return '\n'.join(lines)
+
+
+def _count_by(applications, key):
+    counts = {}
+    for a in applications:
+        value = key(a) or 'Unknown'
+        counts[value] = counts.get(value, 0) + 1
+    return counts
+
+
+def _counts_table(counts, header):
+    rows = sorted(((value, count) for value, count in counts.items() if count), key=lambda kv: (-kv[1], kv[0]))
+    return _markdown_table([header, 'Count'], rows)
+
+
+def _has_phrase(text, phrase):
+    """Whether normalized text contains phrase as whole words."""
+    return bool(phrase) and f' {phrase} ' in f' {text} '
+
+
+def _mentioned_status(text):
+    return next((s for word, s in FAST_PATH_STATUS_WORDS if _has_phrase(text, word)), None)
+
+
+def _mentioned_role(text, applications):
+    role_names = {normalize_chat_message(a['roleName']): a['roleName'] for a in applications if a.get('roleName')}
+    return next((name for lowered, name in sorted(role_names.items(), key=lambda kv: -len(kv[0]))
+                 if _has_phrase(text, lowered)), None)
+
+
+def _mentions_applicant(text, applications):
+    """Whether text names any applicant (a name part or email local part), which the tables can't filter on."""
+    words = set(text.split())
+    for a in applications:
+        name_parts = normalize_chat_message(a.get('applicantName') or '').split()
+        if any(len(part) > 2 and part in words for part in name_parts):
+            return True
+        local_part = normalize_chat_message((a.get('applicantEmail') or '').split('@')[0])
+        if len(local_part) > 2 and _has_phrase(text, local_part):
+            return True
+    return False
+
+
+def answer_structured_admin_query(message, mongo_context):
+    """Render an answer for a structured admin question, or return None to use the LLM."""
+    text = normalize_chat_message(message)
+    applications = mongo_context.get('club_applications') or mongo_context.get('all_applications') or []
+    status = _mentioned_status(text)
+    if not status and not any(_has_phrase(text, w) for w in FAST_PATH_TOPIC_WORDS):
+        return None
+    if any(_has_phrase(text, w) for w in FAST_PATH_OPEN_ENDED) or _mentions_applicant(text, applications):
+        _fast_path_metrics()['llm_fallbacks'] += 1
+        return None
+    
+    role = _mentioned_role(text, applications)
+    selected = [a for a in applications
+                if (not status or _status_label(a.get('status')) == status)
+                and (not role or a.get('roleName') == role)]
+    scope = ' '.join(filter(None, [status and f'**{status}**', role and f'for **{role}**']))
+    # The loaded rows stop at CONTEXT_APPLICATIONS_LIMIT; past that, counts come
+    # from the digest, which only has per-status and per-role totals
+    digest = mongo_context.get('application_digest') or {}
+    truncated = digest.get('total', 0) > len(applications)
+    matching = len(selected)
+    if truncated:
+        matching = (None if status and role else digest['by_status'].get(status, 0) if status
+                    else digest['by_role'].get(role, 0) if role else digest['total'])
+    
+    answer = None
+    if any(_has_phrase(text, w) for w in FAST_PATH_COUNT_WORDS) and (status or role):
+        intent = 'count_filtered'
+        if matching is not None:
+            answer = f"There {'is' if matching == 1 else 'are'} **{matching}** application{'s' if matching != 1 else ''} {scope}."
+    elif any(_has_phrase(text, w) for w in FAST_PATH_COUNT_WORDS + FAST_PATH_SUMMARY_WORDS):
+        intent = 'summary'
+        if not matching:
+            answer = None if truncated else 'No applications found for your clubs yet.'
+        elif truncated and (status or role):
+            answer = None  # no status x role breakdown beyond the loaded rows
+        else:
+            by_status = (digest['by_status'] if truncated
+                         else _count_by(selected, lambda a: _status_label(a.get('status'))))
+            by_role = digest['by_role'] if truncated else _count_by(selected, lambda a: a.get('roleName'))
+            answer = (f"## Application summary\n\n**{matching}** application{'s' if matching != 1 else ''}"
+                      f"{' ' + scope if scope else ''} in total.\n\n### By status\n\n"
+                      + _counts_table(by_status, 'Status')
+                      + '\n\n### By role\n\n'
+                      + _counts_table(by_role, 'Role'))
+    elif any(_has_phrase(text, w) for w in FAST_PATH_LIST_WORDS):
+        intent = 'list'
+        if not selected:
+            answer = None if truncated else f"No applications{' ' + scope if scope else ''} found for your clubs."
+        else:
+            shown = f'{len(selected)} of {matching}' if truncated and matching else len(selected)
+            answer = (f"## Applications{' ' + scope if scope else ''} ({shown})\n\n"
+                      + _markdown_table(['Name', 'Email', 'Role', 'Status'], [
+                          (a.get('applicantName') or 'Unknown', a.get('applicantEmail') or '',
+                           a.get('roleName') or '', _status_label(a.get('status')))
+                          for a in selected
+                      ]))
+            if truncated:
+                answer += (f"\n\nOnly the {len(applications)} applications loaded into this chat are searched; "
+                           "use the applications page or an export for the full list.")
+    
+    if answer is None:
+        _fast_path_metrics()['llm_fallbacks'] += 1
+        return None
+    
+    answered = _fast_path_metrics()['answered']
+    answered[intent] = answered.get(intent, 0) + 1
+    return answer
+
+
+# ── Completion cache ─────────────────────────────────────────────
+# Student questions repeat a lot ("which clubs are recruiting?"). First-turn,
+# non-admin, no-action completions are memoized by (model, catalog data
+# version, normalized message). The version is a hash of the clubs/openroles
+# that go into the prompt plus a counter bumped by catalog writes, so changed
+# data never serves an old answer. The model in the key is the one the turn
+# is routed to; a reply from the large-model fallback is stored under both.
+
+CORTEX_MODEL = os.getenv('CORTEX_MODEL', 'mistral-large')
+COMPLETION_CACHE_SIZE = int(os.getenv('COMPLETION_CACHE_SIZE', '256'))
+COMPLETION_CACHE_TTL = int(os.getenv('COMPLETION_CACHE_TTL', '600'))  # seconds
+
+_completion_cache = OrderedDict()  # key -> {'response': str, 'timestamp': float}
+_completion_lock = threading.Lock()
+_catalog_generation = 0
+
+
+def catalog_data_version(clubs, openroles):
+    """Fingerprint of the public club/role data embedded in the prompt."""
+    digest = hashlib.sha1(orjson.dumps([clubs, openroles], default=_json_default)).hexdigest()[:16]
+    return f'{_catalog_generation}:{digest}'
+
+
+def invalidate_completion_cache():
+    """Drop every cached completion; called when club or role data is written."""
+    global _catalog_generation
+    with _completion_lock:
+        _catalog_generation += 1
+        _completion_cache.clear()
+    metrics_group('completion_cache', hits=0, misses=0, bypassed=0)['invalidations'] = _catalog_generation
+
+
+def is_admin_context(mongo_context):
+    if not mongo_context:
+        return False
+    if 'admin_clubs' in mongo_context or 'all_applications' in mongo_context:
+        return True
+    roles = (mongo_context.get('current_user') or {}).get('roles', [])
+    return 'ADMIN' in roles or 'CLUB_LEADER' in roles
+
+
+def normalize_chat_message(message):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', message.lower()).split())
+
+
+def completion_cache_key(message, mongo_context, model):
+    version = (mongo_context or {}).get('data_version', '')
+    return (model, version, normalize_chat_message(message))
+
+
+def get_cached_completion(key):
+    metrics = metrics_group('completion_cache', hits=0, misses=0, bypassed=0)
+    with _completion_lock:
+        entry = _completion_cache.get(key)
+        if entry and time.time() - entry['timestamp'] < COMPLETION_CACHE_TTL:
+            _completion_cache.move_to_end(key)
+            metrics['hits'] += 1
+            return entry['response']
+        if entry:
+            del _completion_cache[key]
+        metrics['misses'] += 1
+    return None
+
+
+def store_cached_completion(key, response):
+    with _completion_lock:
+        _completion_cache[key] = {'response': response, 'timestamp': time.time()}
+        _completion_cache.move_to_end(key)
+        while len(_completion_cache) > COMPLETION_CACHE_SIZE:
+            _completion_cache.popitem(last=False)
+
 def get_club_context():
     """Get current club and position data as context for the LLM."""
     try:
@@ -862,8 +3377,211 @@ def _slim_application(app):
     }
 
 
-def build_system_prompt(context, mongo_context=None):
-    """Build system prompt with current data context from Snowflake and MongoDB."""
+# ── Prompt encoding ──────────────────────────────────────────────
+# Row lists in the prompt (clubs, open roles, applications) are written as a
+# table: column names once, then one `a | b | c` line per row, instead of JSON
+# that repeats every key on every row. Long text is truncated, columns with
+# the same value on every row are stated once, and long values that repeat
+# are replaced by short @N aliases. PROMPT_ENCODING=json restores JSON.
+# Sizes before/after are reported under `prompt_encoding` in GET /metrics.
+
+PROMPT_ENCODING = os.getenv('PROMPT_ENCODING', 'table')  # 'table' or 'json'
+PROMPT_FIELD_MAX_CHARS = int(os.getenv('PROMPT_FIELD_MAX_CHARS', '200'))
+PROMPT_INTERN_MIN_CHARS = 12  # only alias values at least this long...
+PROMPT_INTERN_MIN_REPEATS = 3  # ...that occur at least this many times
+
+
+def _prompt_encoding_metrics():
+    return metrics_group('prompt_encoding', tables=0, json_chars=0, encoded_chars=0, saved_ratio=None,
+                         prompts=0, prompt_chars=0)
+
+
+def _prompt_cell(value, max_chars):
+    if value is None:
+        return ''
+    if isinstance(value, dict):
+        return '; '.join(f'{k}: {_prompt_cell(v, max_chars)}' for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        separator = ' // ' if any(isinstance(v, dict) for v in value) else ', '
+        return separator.join(_prompt_cell(v, max_chars) for v in value)
+    text = ' '.join(str(value).split()).replace('|', '/')
+    if len(text) > max_chars:
+        text = text[:max_chars - 1] + '…'
+    return text
+
+
+def encode_table(rows, max_chars=None):
+    """Encode a list of dicts as a compact text table for the prompt."""
+    if not rows:
+        return '(none)'
+    max_chars = max_chars or PROMPT_FIELD_MAX_CHARS
+    columns = []
+    for row in rows:
+        columns += [key for key in row if key not in columns]
+    cells = [[_prompt_cell(row.get(col), max_chars) for col in columns] for row in rows]
+    lines = []
+    
+    if len(rows) > 1:
+        constant = [i for i in range(len(columns)) if len({row[i] for row in cells}) == 1]
+        if constant:
+            lines.append('all rows: ' + '; '.join(f'{columns[i]} = {cells[0][i] or "(empty)"}' for i in constant))
+            columns = [col for i, col in enumerate(columns) if i not in constant]
+            cells = [[v for i, v in enumerate(row) if i not in constant] for row in cells]
+    
+    counts = {}
+    for row in cells:
+        for value in row:
+            if len(value) >= PROMPT_INTERN_MIN_CHARS:
+                counts[value] = counts.get(value, 0) + 1
+    aliases = {}
+    for value, count in counts.items():
+        if count >= PROMPT_INTERN_MIN_REPEATS:
+            aliases[value] = f'@{len(aliases) + 1}'
+    if aliases:
+        lines.append('where ' + '; '.join(f'{alias} = {value}' for value, alias in aliases.items()))
+    
+    if columns:
+        lines.append(' | '.join(columns))
+        lines.extend(' | '.join(aliases.get(v, v) for v in row) for row in cells)
+    return '\n'.join(lines)
+
+
+def encode_prompt_rows(rows, max_chars=None):
+    """Serialize prompt rows with PROMPT_ENCODING, recording the size against plain JSON."""
+    as_json = json.dumps(rows, default=str)
+    if PROMPT_ENCODING == 'json':
+        return as_json
+    encoded = encode_table(rows, max_chars)
+    metrics = _prompt_encoding_metrics()
+    metrics['tables'] += 1
+    metrics['json_chars'] += len(as_json)
+    metrics['encoded_chars'] += len(encoded)
+    metrics['saved_ratio'] = round(1 - metrics['encoded_chars'] / max(metrics['json_chars'], 1), 3)
+    return encoded
+
+
+def encode_prompt_counts(counts):
+    if PROMPT_ENCODING == 'json':
+        return json.dumps(counts)
+    return ', '.join(f'{key}: {count}' for key, count in sorted(counts.items(), key=lambda kv: -kv[1]))
+
+
+# ── Admin prompt digest ──────────────────────────────────────────
+# Admin prompts carry a digest (counts by status and role, recent changes)
+# plus only the rows the message points at: applicants named in it (with
+# their answers) and, for status/role questions, a few matching rows. The
+# prompt stays about the same size however many applications a club has.
+# ADMIN_PROMPT_MODE=rows restores the old behaviour of embedding every row.
+
+ADMIN_PROMPT_MODE = os.getenv('ADMIN_PROMPT_MODE', 'digest')  # 'digest' or 'rows'
+PROMPT_RELEVANT_ROWS = int(os.getenv('PROMPT_RELEVANT_ROWS', '10'))
+PROMPT_ANSWER_CHARS = 500  # per answer, for applicants named in the message
+PROMPT_CLOSING_SOON = 5  # deadlines listed in every prompt...
+PROMPT_CLOSING_SOON_DAYS = 14  # ...if they close within this many days
+PROMPT_NAME_STOPWORDS = {
+    'the', 'and', 'for', 'from', 'with', 'what', 'who', 'whom', 'how', 'many', 'much', 'did', 'does', 'show',
+    'list', 'tell', 'about', 'their', 'they', 'this', 'that', 'application', 'applications', 'applicant',
+    'applicants', 'candidate', 'candidates', 'role', 'roles', 'status', 'club', 'clubs', 'answer', 'answers',
+    'please', 'can', 'you', 'give', 'details', 'detail', 'should', 'would', 'are', 'was', 'his', 'her', 'all',
+}
+
+
+def _full_application(app):
+    """Slim row plus the applicant's answers, for applicants named in the message."""
+    row = _slim_application(app)
+    row['submittedAt'] = app.get('submittedAt', '')
+    row['answers'] = [
+        {'question': a.get('question', ''), 'answer': str(a.get('answer', ''))[:PROMPT_ANSWER_CHARS]}
+        for a in app.get('answers') or [] if isinstance(a, dict)
+    ]
+    return row
+
+
+def _recent_change(app):
+    return {'applicantName': app.get('applicantName', ''), 'status': app.get('status', ''),
+            'roleName': app.get('roleName', ''), 'updatedAt': _changed_at(app)}
+
+
+def _fetch_mentioned_applications(mongo_context, message_lower):
+    """Find applicants named in the message among applications that weren't loaded into the context."""
+    query = mongo_context.get('application_query')
+    if query is None:
+        return []
+    words = [w for w in re.findall(r"[a-z][a-z'-]{2,}", message_lower) if w not in PROMPT_NAME_STOPWORDS][:5]
+    emails = re.findall(r'[\w.+-]+@[\w-]+\.[\w.]+', message_lower)
+    clauses = [{'applicantName': {'$regex': rf'\b{re.escape(w)}', '$options': 'i'}} for w in words]
+    clauses += [{'applicantEmail': e} for e in emails]
+    if not clauses:
+        return []
+    db = get_mongo_db()
+    found = [populate_application(db, raw) for raw in
+             db.applications.find({'$and': [query, {'$or': clauses}]}).limit(PROMPT_RELEVANT_ROWS)]
+    return [a for a in found if applicant_match_score(a, message_lower) >= 3]
+
+
+def relevant_applications(message, mongo_context, applications):
+    """Split out (applicants named in the message, other rows matching its status/role)."""
+    message_lower = message.lower()
+    candidates = list(applications)
+    digest = mongo_context.get('application_digest') or {}
+    if digest.get('total', 0) > len(applications):
+        # Not every application is loaded - the named applicant may only be in Mongo
+        try:
+            loaded_ids = {a.get('_id') for a in applications}
+            candidates += [a for a in _fetch_mentioned_applications(mongo_context, message_lower)
+                           if a.get('_id') not in loaded_ids]
+        except Exception as e:
+            print(f"[PROMPT] Applicant lookup failed: {e}")
+    scored = [(applicant_match_score(a, message_lower), a) for a in candidates]
+    # Keep only the best matches, so a shared first name or word doesn't pull in everyone
+    best = max((score for score, _ in scored), default=0)
+    mentioned = [a for score, a in scored if score >= 3 and score == best][:PROMPT_RELEVANT_ROWS]
+    
+    text = normalize_chat_message(message)
+    status, role = _mentioned_status(text), _mentioned_role(text, applications)
+    if not (status or role):
+        return mentioned, []
+    mentioned_ids = {a.get('_id') for a in mentioned}
+    matching = [a for a in applications if a.get('_id') not in mentioned_ids
+                and (not status or _status_label(a.get('status')) == status)
+                and (not role or a.get('roleName') == role)]
+    return mentioned, matching[:max(PROMPT_RELEVANT_ROWS - len(mentioned), 0)]
+
+
+def relevant_rows_section(message, mongo_context, applications):
+    """Prompt text with the rows relevant to this message ('' if none)."""
+    mentioned, matching = relevant_applications(message, mongo_context, applications)
+    section = ""
+    if mentioned:
+        section += f"\n\nApplications of applicants named in this message:\n{encode_prompt_rows([_full_application(a) for a in mentioned], PROMPT_ANSWER_CHARS)}"
+    if matching:
+        section += f"\n\nSome applications matching this question ({len(matching)} shown):\n{encode_prompt_rows([_slim_application(a) for a in matching])}"
+    return section
+
+
+def applications_prompt_section(heading, applications, mongo_context, message):
+    """Applications part of the admin prompt: every row in 'rows' mode, else digest + relevant rows."""
+    if ADMIN_PROMPT_MODE == 'rows':
+        slim_apps = [_slim_application(a) for a in applications]
+        return f"\n\n{heading} ({len(slim_apps)} total):\n{encode_prompt_rows(slim_apps)}"
+    digest = mongo_context.get('application_digest') or dict(_count_digest(applications), recent=[])
+    section = (f"\n\n{heading} - digest ({digest['total']} total):"
+               f"\nBy status: {encode_prompt_counts(digest['by_status'])}"
+               f"\nBy role: {encode_prompt_counts(digest['by_role'])}"
+               f"\nMost recently updated:\n{encode_prompt_rows([_recent_change(a) for a in digest['recent']])}")
+    if message:
+        section += relevant_rows_section(message, mongo_context, applications)
+    return section + ("\n\nOnly the rows above are included. Use the digest counts for totals and"
+                      " distributions. Details of any applicant the admin names are added when they are named.")
+
+
+def build_system_prompt(context, mongo_context=None, include_user=True, message=None):
+    """Build system prompt with current data context from Snowflake and MongoDB.
+
+    include_user=False leaves out the current-user line so the prompt (and any
+    cached completion for it) is the same for every student. message lets the
+    admin digest pick out the application rows relevant to the question.
+    """
 
     # Only use MongoDB context for clubs and positions
     mongo_clubs_str = ""
@@ -873,44 +3591,58 @@ def build_system_prompt(context, mongo_context=None):
 
     if mongo_context:
         if 'mongo_clubs' in mongo_context and mongo_context['mongo_clubs']:
-            mongo_clubs_str = json.dumps(mongo_context['mongo_clubs'], default=str)
+            mongo_clubs_str = encode_prompt_rows(mongo_context['mongo_clubs'])
         if 'openroles' in mongo_context and mongo_context['openroles']:
-            openroles_str = json.dumps(mongo_context['openroles'], default=str)
+            openroles_str = encode_prompt_rows(mongo_context['openroles'])
 
         # Current user info
-        if 'current_user' in mongo_context:
+        if include_user and 'current_user' in mongo_context:
             user = mongo_context['current_user']
             mongo_section += f"\n\nCurrent user: {user.get('name', 'Unknown')} ({user.get('email')}) - Roles: {', '.join(user.get('roles', []))}"
 
         # NOTE: Full user list intentionally excluded to reduce prompt size
 
+        if mongo_context.get('stale'):
+            mongo_section += "\n\nNote: the club and application data below could not be refreshed just now and may be slightly out of date."
+
         # Admin-specific: applications to their clubs (slim format)
         if 'admin_clubs' in mongo_context:
-            admin_clubs_str = json.dumps(mongo_context['admin_clubs'], default=str)
+            admin_clubs_str = encode_prompt_rows(mongo_context['admin_clubs'])
             admin_section += f"\n\n=== ADMIN ACCESS ===\nYou are an admin for these clubs:\n{admin_clubs_str}"
 
             apps = mongo_context.get('club_applications', [])
             if apps:
-                slim_apps = [_slim_application(a) for a in apps]
-                apps_str = json.dumps(slim_apps, default=str)
-                admin_section += f"\n\nApplications to your clubs ({len(slim_apps)} total):\n{apps_str}"
+                admin_section += applications_prompt_section("Applications to your clubs", apps, mongo_context, message)
             else:
                 admin_section += "\n\nNo applications found for your clubs yet."
 
         # Global admin: all applications (slim format)
         if 'all_applications' in mongo_context and mongo_context['all_applications']:
-            slim_apps = [_slim_application(a) for a in mongo_context['all_applications']]
-            apps_str = json.dumps(slim_apps, default=str)
-            admin_section += f"\n\n=== ADMIN ACCESS ===\nAll applications on the platform ({len(slim_apps)} total):\n{apps_str}"
+            admin_section += "\n\n=== ADMIN ACCESS ===" + applications_prompt_section(
+                "All applications on the platform", mongo_context['all_applications'], mongo_context, message)
 
-    return f"""You are a helpful, concise assistant for McGill University's club recruitment platform.
-You help students find clubs and positions that match their interests.
+    closing_soon = ""
+    if _deadline_index['built_at']:
+        # Only once the index is built - never block a chat turn on building it
+        soon = upcoming_deadlines(limit=PROMPT_CLOSING_SOON, within_days=PROMPT_CLOSING_SOON_DAYS)
+        if soon:
+            closing_soon = (f"\n\nPositions closing in the next {PROMPT_CLOSING_SOON_DAYS} days:\n"
+                            + encode_prompt_rows([{'title': e['title'], 'club': e['clubName'],
+                                                   'deadline': e['deadline'].date().isoformat()} for e in soon]))
 
+    format_note = ""
+    if PROMPT_ENCODING != 'json':
+        format_note = ("\nData below is in tables: a line of column names separated by |, then one row per line."
+                       " 'all rows:' lists values shared by every row, and '@N' stands for the value given on the 'where' line.\n")
+
+    prompt = f"""You are a helpful, concise assistant for McGill University's club recruitment platform.
+You help students find clubs and positions that match their interests.
+{format_note}
 Here is the current data about clubs (from MongoDB):
 {mongo_clubs_str if mongo_clubs_str else 'No clubs found in MongoDB.'}
 
 Here are the current open roles/positions (from MongoDB):
-{openroles_str if openroles_str else 'No open roles found in MongoDB.'}
+{openroles_str if openroles_str else 'No open roles found in MongoDB.'}{closing_soon}
 {mongo_section}{admin_section}
 
 Guidelines:
@@ -948,39 +3680,146 @@ Valid statuses: SUBMITTED, UNDER_REVIEW, INTERVIEW_SCHEDULED, ACCEPTED, REJECTED
 
 When a status update is requested, the system will automatically update the database and prepend a confirmation message. Simply acknowledge the change and offer to help with anything else."""
 
+    metrics = _prompt_encoding_metrics()
+    metrics['prompts'] += 1
+    metrics['prompt_chars'] += len(prompt)
+    return prompt
 
-def call_cortex_llm(prompt, conversation_history=None):
+
+CORTEX_TIMEOUT = int(os.getenv('CORTEX_TIMEOUT', '60'))  # seconds per completion
+CORTEX_RETRIES = int(os.getenv('CORTEX_RETRIES', '1'))
+
+
+def call_cortex_llm(prompt, conversation_history=None, model=None):
     """Call Snowflake Cortex COMPLETE function with Mistral."""
-    conn = get_snowflake_conn()
-    cs = conn.cursor()
+    # Builds the full prompt with conversation history
+    full_prompt = ""
+    if conversation_history:
+        for msg in conversation_history:
+            role = "User" if msg['role'] == 'user' else "Assistant"
+            full_prompt += f"{role}: {msg['content']}\n\n"
+    full_prompt += f"User: {prompt}\n\nAssistant:"
+    with profile_span('cortex'):
+        return guarded('cortex', _cortex_complete, model or CORTEX_MODEL, full_prompt, retries=CORTEX_RETRIES)
+
+
+def _cortex_complete(model, full_prompt):
+    sql = """
+    SELECT SNOWFLAKE.CORTEX.COMPLETE(
+        ?,
+        ?
+    ) AS response
+    """
     
-    try:
-        # Builds the full prompt with conversation history
-        full_prompt = ""
-        if conversation_history:
-            for msg in conversation_history:
-                role = "User" if msg['role'] == 'user' else "Assistant"
-                full_prompt += f"{role}: {msg['content']}\n\n"
-        full_prompt += f"User: {prompt}\n\nAssistant:"
-        
-        sql = """
-        SELECT SNOWFLAKE.CORTEX.COMPLETE(
-            'mistral-large',
-            %s
-        ) AS response
-        """
-        
-        cs.execute(sql, (full_prompt,))
-        result = cs.fetchone()
-        
-        if result and result[0]:
-            # Simple string format returns plain text
-            return str(result[0])
-        return "Sorry, I couldn't generate a response."
-        
-    finally:
-        cs.close()
-        conn.close()
+    def work(cs):
+        cs.execute(sql, (model, full_prompt), timeout=CORTEX_TIMEOUT)
+        return cs.fetchone()
+    
+    result = run_on_snowflake(work)
+    if result and result[0]:
+        # Simple string format returns plain text
+        return str(result[0])
+    return "Sorry, I couldn't generate a response."
+
+
+# ── Model routing ────────────────────────────────────────────────
+# Each turn is classified (greeting, confirmation of an applied action,
+# short lookup, open-ended/analysis question, ...) and MODEL_ROUTES maps the
+# class to the small or large Cortex model. Prompts over
+# SMALL_MODEL_MAX_PROMPT_CHARS always go to the large model, and a
+# low-confidence answer from the small model is retried on the large one.
+
+CORTEX_SMALL_MODEL = os.getenv('CORTEX_SMALL_MODEL', 'mistral-7b')
+MODEL_ROUTING = os.getenv('MODEL_ROUTING', 'true').lower() == 'true'
+SMALL_MODEL_MAX_PROMPT_CHARS = int(os.getenv('SMALL_MODEL_MAX_PROMPT_CHARS', '12000'))
+MODEL_ROUTES = {
+    'greeting': 'small',
+    'action_confirmation': 'small',
+    'lookup': 'small',
+    'admin_question': 'large',
+    'open_ended': 'large',
+    'general': 'large',
+}
+MODEL_ROUTES.update(json.loads(os.getenv('MODEL_ROUTES', '{}')))  # e.g. {"admin_question": "small"}
+
+ROUTING_GREETING_WORDS = {'hi', 'hello', 'hey', 'thanks', 'thank', 'you', 'ok', 'okay', 'cool', 'great', 'bye',
+                          'goodbye', 'morning', 'good', 'evening', 'afternoon', 'yo', 'sup', 'perfect', 'nice',
+                          'there', 'so', 'much', 'again', 'everyone', 'all', 'awesome'}
+ROUTING_LOOKUP_MAX_WORDS = 14
+LOW_CONFIDENCE_MARKERS = ["i don't have", "i do not have", "i'm not sure", "i am not sure", "i cannot",
+                          "i can't", "as an ai", "no information", "not able to", "couldn't generate"]
+
+
+def _routing_metrics(model):
+    group = metrics_group('model_routing', intents={}, fallbacks=0, models={})
+    return group, group['models'].setdefault(model, {
+        'calls': 0, 'latency_seconds_total': 0.0, 'latency_seconds_max': 0.0,
+        'prompt_tokens_est': 0, 'completion_tokens_est': 0,
+    })
+
+
+def classify_turn(message, action_performed=False, admin=False):
+    """Coarse intent of a chat turn, used to pick a model."""
+    if action_performed:
+        return 'action_confirmation'
+    words = normalize_chat_message(message).split()
+    if words and len(words) <= 6 and all(w in ROUTING_GREETING_WORDS for w in words):
+        return 'greeting'
+    if any(w in FAST_PATH_OPEN_ENDED for w in words):
+        return 'open_ended'
+    if admin:
+        return 'admin_question'
+    if len(words) <= ROUTING_LOOKUP_MAX_WORDS:
+        return 'lookup'
+    return 'general'
+
+
+def route_model(intent, prompt_chars):
+    if not MODEL_ROUTING or prompt_chars > SMALL_MODEL_MAX_PROMPT_CHARS:
+        return CORTEX_MODEL
+    return CORTEX_SMALL_MODEL if MODEL_ROUTES.get(intent, 'large') == 'small' else CORTEX_MODEL
+
+
+def is_low_confidence(response, intent):
+    text = (response or '').strip().lower()
+    if not text:
+        return True
+    if intent != 'greeting' and len(text) < 20:
+        return True
+    return any(marker in text for marker in LOW_CONFIDENCE_MARKERS)
+
+
+def _timed_completion(prompt, conversation_history, model):
+    started = time.perf_counter()
+    response = call_cortex_llm(prompt, conversation_history, model=model)
+    elapsed = time.perf_counter() - started
+    _, stats = _routing_metrics(model)
+    stats['calls'] += 1
+    stats['latency_seconds_total'] = round(stats['latency_seconds_total'] + elapsed, 4)
+    stats['latency_seconds_max'] = round(max(stats['latency_seconds_max'], elapsed), 4)
+    history_chars = sum(len(m['content']) for m in conversation_history or [])
+    # Token counts are estimated at ~4 characters per token
+    stats['prompt_tokens_est'] += (len(prompt) + history_chars) // 4
+    stats['completion_tokens_est'] += len(response or '') // 4
+    return response
+
+
+def routed_completion(prompt, conversation_history, intent, model=None):
+    """Complete on the model MODEL_ROUTES picks for intent, retrying low-confidence small-model answers.
+
+    model skips routing when the caller has already routed the turn.
+    Returns (response, model that produced it).
+    """
+    model = model or route_model(intent, len(prompt))
+    group, _ = _routing_metrics(model)
+    group['intents'][intent] = group['intents'].get(intent, 0) + 1
+    response = _timed_completion(prompt, conversation_history, model)
+    if model != CORTEX_MODEL and is_low_confidence(response, intent):
+        group['fallbacks'] += 1
+        print(f"[ROUTING] Low-confidence {model} answer for {intent}, retrying on {CORTEX_MODEL}")
+        model = CORTEX_MODEL
+        response = _timed_completion(prompt, conversation_history, CORTEX_MODEL)
+    return response, model
 
 
 @app.route('/chat', methods=['POST'])
@@ -995,30 +3834,25 @@ def chat():
         return jsonify({'error': 'Message is required'}), 400
     
     try:
+        check_chat_rate_limits(session_id, user_email)
+    except ChatRejected as err:
+        return chat_rejected_response(err)
+    
+    try:
+        start_memory_reporter()
         # Get or create session history
         if session_id not in chat_sessions:
             chat_sessions[session_id] = {
                 'history': [],
                 'context': get_club_context(),
-                'mongo_context': get_mongo_context(user_message, user_email),
                 'user_email': user_email
             }
         
         session = chat_sessions[session_id]
         
-        # Use cached context if fresh enough, otherwise refresh
+        # Compose context from the shared public/club snapshots and this session's scope
+        session['mongo_context'] = get_session_context(session_id, user_email)
         if user_email:
-            cache_key = f"{session_id}:{user_email}"
-            cached = _context_cache.get(cache_key)
-            now = time.time()
-            if cached and (now - cached['timestamp']) < CONTEXT_CACHE_TTL:
-                session['mongo_context'] = cached['data']
-                print(f"[DEBUG] Using cached mongo_context (age {now - cached['timestamp']:.1f}s)")
-            else:
-                session['mongo_context'] = get_mongo_context(user_message, user_email)
-                _context_cache[cache_key] = {'data': session['mongo_context'], 'timestamp': now}
-                print(f"[DEBUG] Refreshed mongo_context keys: {list(session['mongo_context'].keys())}")
-
             session['user_email'] = user_email
             print(f"[DEBUG] current_user: {session['mongo_context'].get('current_user')}")
             print(f"[DEBUG] admin_clubs: {session['mongo_context'].get('admin_clubs')}")
@@ -1057,32 +3891,74 @@ def chat():
                                 'the applicant'
                             )
                             action_result = f"✅ I've updated the application for {applicant_name} to status: **{update_cmd['new_status']}**."
-                            # Force-refresh mongo context after mutation
-                            session['mongo_context'] = get_mongo_context(user_message, user_email)
-                            cache_key = f"{session_id}:{user_email}"
-                            _context_cache[cache_key] = {'data': session['mongo_context'], 'timestamp': time.time()}
+                            # Force-refresh the shared club snapshot after mutation
+                            session['mongo_context'] = get_session_context(session_id, user_email, force_club_refresh=True)
                         else:
                             action_result = f"❌ Could not update the application: {result['error']}"
                     else:
                         print(f"[DEBUG] No app ID found in application: {app_to_update}")
         
-        # Build prompt with context from both Snowflake and MongoDB
-        system_prompt = build_system_prompt(session['context'], session.get('mongo_context'))
+        # Structured admin questions are answered locally from the context
+        response = None
+        if not action_result and is_admin_context(session.get('mongo_context')):
+            response = answer_structured_admin_query(user_message, session.get('mongo_context'))
         
-        # If an action was performed, include it in the prompt
-        if action_result:
-            full_prompt = f"{system_prompt}\n\nSystem note: {action_result}\n\nUser message: {user_message}\n\nPlease confirm the action to the user and offer any follow-up assistance."
-        elif not session['history']:
-            full_prompt = f"{system_prompt}\n\n{user_message}"
-        else:
-            full_prompt = user_message
+        # First-turn student questions can be answered from the completion cache
+        cacheable = (not action_result and not session['history']
+                     and not is_admin_context(session.get('mongo_context')))
+        if response is None and not cacheable:
+            metrics_group('completion_cache', hits=0, misses=0, bypassed=0)['bypassed'] += 1
         
-        # Call Cortex LLM
-        response = call_cortex_llm(full_prompt, session['history'])
+        if response is None:
+            # Build prompt with context from both Snowflake and MongoDB
+            system_prompt = build_system_prompt(session['context'], session.get('mongo_context'),
+                                                include_user=not cacheable, message=user_message)
+            
+            # If an action was performed, include it in the prompt
+            if action_result:
+                full_prompt = f"{system_prompt}\n\nSystem note: {action_result}\n\nUser message: {user_message}\n\nPlease confirm the action to the user and offer any follow-up assistance."
+            elif not session['history']:
+                full_prompt = f"{system_prompt}\n\n{user_message}"
+            else:
+                full_prompt = user_message
+                # Follow-ups don't resend the digest; add rows for any applicant the admin names now
+                mongo_ctx = session.get('mongo_context') or {}
+                apps = mongo_ctx.get('club_applications') or mongo_ctx.get('all_applications')
+                if ADMIN_PROMPT_MODE != 'rows' and apps:
+                    rows = relevant_rows_section(user_message, mongo_ctx, apps)
+                    if rows:
+                        full_prompt = f"{rows.strip()}\n\nUser message: {user_message}"
+            
+            # Route first, so the cache is keyed on the model this turn goes to
+            intent = classify_turn(user_message, action_performed=action_result is not None,
+                                   admin=is_admin_context(session.get('mongo_context')))
+            model = route_model(intent, len(full_prompt))
+            if cacheable:
+                completion_key = completion_cache_key(user_message, session.get('mongo_context'), model)
+                response = get_cached_completion(completion_key)
         
+        if response is None:
+            # Call Cortex LLM
+            answered_by = None
+            try:
+                with llm_slot():
+                    response, answered_by = routed_completion(full_prompt, session['history'], intent, model)
+            except Exception as e:
+                # The status change has already been written: confirm it without an
+                # LLM reply rather than answer 429/503, which would invite a retry
+                if not action_result or not (isinstance(e, ChatRejected) or is_transient_error(e)):
+                    raise
+                print(f"[CHAT] Action applied but no LLM reply ({type(e).__name__}: {e})")
+            if cacheable and answered_by:
+                # A large-model fallback answers the routed key too, so the small
+                # model isn't asked again for the same question
+                store_cached_completion(completion_key, response)
+                if answered_by != model:
+                    store_cached_completion(completion_cache_key(user_message, session.get('mongo_context'),
+                                                                 answered_by), response)
         # If we performed an action, prepend the result to the response
         if action_result:
-            response = f"{action_result}\n\n{response}"
+            response = f"{action_result}\n\n{response}" if response else action_result
         
         # Update history
         session['history'].append({'role': 'user', 'content': user_message})
@@ -1092,14 +3968,19 @@ def chat():
         if len(session['history']) > 12:
             session['history'] = session['history'][-12:]
         
-        return jsonify({
+        result = {
             'response': response,
             'session_id': session_id,
             'action_performed': action_result is not None
-        })
+        }
+        if (session.get('mongo_context') or {}).get('stale'):
+            result['stale'] = True
+        return jsonify(result)
         
+    except ChatRejected as err:
+        return chat_rejected_response(err)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
 
 
 @app.route('/chat/reset', methods=['POST'])
@@ -1124,33 +4005,94 @@ def patch_application(application_id):
     if not user_email:
         return jsonify({'error': 'user_email is required'}), 400
     
-    # Extract updates (exclude user_email from updates)
-    updates = {k: v for k, v in data.items() if k != 'user_email'}
+    # Extract updates (exclude user_email and the concurrency check from updates)
+    updates = {k: v for k, v in data.items() if k not in ('user_email', 'expectedStatus')}
     
     if not updates:
         return jsonify({'error': 'No updates provided'}), 400
     
-    result = update_application(application_id, updates, user_email)
+    result = update_application(application_id, updates, user_email, expected_status=data.get('expectedStatus'))
     
     if result['success']:
         return jsonify(result)
+    elif result.get('conflict'):
+        return jsonify(result), 409
     else:
         return jsonify(result), 400
 
 
-def serialize_mongo_doc(doc):
-    """Recursively convert ObjectId to string in a MongoDB document."""
-    if isinstance(doc, dict):
-        return {k: serialize_mongo_doc(v) for k, v in doc.items()}
-    elif isinstance(doc, list):
-        return [serialize_mongo_doc(item) for item in doc]
-    elif isinstance(doc, ObjectId):
-        return str(doc)
-    else:
-        return doc
+def _json_default(obj):
+    """orjson fallback for types it doesn't encode natively."""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def json_response(payload, status=200):
+    """Encode payload with orjson (ObjectId/datetime aware) into a JSON response."""
+    return Response(orjson.dumps(payload, default=_json_default), status=status, mimetype='application/json')
+
+
+# Fields of the frontend Application shape, in response order
+APPLICATION_FIELDS = ['id', 'userId', 'clubId', 'positionId', 'status', 'answers', 'submittedAt',
+                      'updatedAt', 'applicantName', 'applicantEmail', 'clubName', 'positionTitle']
+
+
+def parse_fields_param():
+    """Parse ?fields=a,b,c into a list of known application fields (None = all)."""
+    raw = request.args.get('fields')
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(',') if f.strip() in APPLICATION_FIELDS]
+    return fields or None
+
+
+def serialize_application(app, populated, fields=None, list_answers=False, **overrides):
+    """Build the frontend Application shape for a raw application document.
+
+    populated is the populate_application() result for app. fields limits the
+    output to those keys (so list views can skip `answers`); overrides replace
+    individual values. list_answers converts dict answers to the list form.
+    """
+    wanted = fields or APPLICATION_FIELDS
+    doc = {}
+    for field in wanted:
+        if field in overrides:
+            doc[field] = overrides[field]
+        elif field == 'id':
+            doc['id'] = str(app.get('_id'))
+        elif field == 'userId':
+            doc['userId'] = str(app.get('applicant') or app.get('userId') or '')
+        elif field == 'clubId':
+            doc['clubId'] = str(app.get('clubRef') or app.get('clubId') or '')
+        elif field == 'positionId':
+            doc['positionId'] = str(app.get('openRole') or app.get('roleId') or app.get('positionId') or '')
+        elif field == 'status':
+            doc['status'] = app.get('status') or 'submitted'
+        elif field == 'answers':
+            answers = app.get('answers', [])
+            if list_answers and isinstance(answers, dict):
+                answers = [{'questionId': k, 'question': k, 'answer': v} for k, v in answers.items()]
+            doc['answers'] = answers
+        elif field == 'submittedAt':
+            doc['submittedAt'] = app.get('submittedAt') or app.get('createdAt', '')
+        elif field == 'updatedAt':
+            doc['updatedAt'] = app.get('updatedAt') or app.get('submittedAt', '')
+        elif field == 'applicantName':
+            doc['applicantName'] = populated.get('applicantName') or 'Unknown'
+        elif field == 'applicantEmail':
+            doc['applicantEmail'] = populated.get('applicantEmail', '')
+        elif field == 'clubName':
+            doc['clubName'] = populated.get('clubName') or app.get('club', '')
+        elif field == 'positionTitle':
+            doc['positionTitle'] = populated.get('roleName') or app.get('role', '')
+    return doc
 
 
 @app.route('/applications', methods=['GET'])
+@mongo_view
 def get_applications():
     """Get applications (admin only)."""
     user_email = request.args.get('user_email')
@@ -1161,18 +4103,18 @@ def get_applications():
     try:
         db = get_mongo_db()
         
-        # Verify user is admin
-        user = db.users.find_one({'email': user_email}, {'passwordHash': 0})
-        if not user or ('ADMIN' not in user.get('roles', []) and 'CLUB_LEADER' not in user.get('roles', [])):
+        # Verify user is admin (demo admins have no MongoDB user and are not allowed here)
+        principal = get_principal(db, user_email)
+        if not principal or principal['demo'] or not principal['is_admin']:
             return jsonify({'error': 'Unauthorized'}), 403
         
         # Get applications with populated applicant info
         applications_raw = list(db.applications.find({}).limit(100))
         applications = [populate_application(db, app) for app in applications_raw]
         
-        return jsonify({'applications': applications})
+        return json_response({'applications': applications})
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
 
 
 # ── Application endpoints for admin frontend ─────────────────────
@@ -1187,7 +4129,88 @@ DEMO_CLUB_IDS = {
     'c6': 'McGill Blockchain Club',
 }
 
+def resolve_club_applications_query(db, club_id, status=None, position_id=None):
+    """Resolve a (possibly demo) club ID and build the applications query for it.
+
+    Returns (club, open_roles, app_query), or (None, [], None) if no club matches.
+    """
+    # Handle demo club IDs
+    club_name = DEMO_CLUB_IDS.get(club_id)
+    
+    # Try to find the actual club first
+    actual_club = None
+    if club_name:
+        # Demo club ID - look up by name
+        actual_club = db.clubs.find_one({'name': {'$regex': club_name, '$options': 'i'}})
+    
+    if not actual_club:
+        # Try as ObjectId or slug
+        try:
+            actual_club = db.clubs.find_one({'_id': ObjectId(club_id)})
+        except:
+            actual_club = db.clubs.find_one({'$or': [{'slug': club_id}, {'name': club_id}]})
+    
+    if not actual_club:
+        return None, [], None
+    
+    actual_club_id = str(actual_club.get('_id'))
+    actual_club_name = actual_club.get('name', '')
+    
+    # Find all openRoles for this club
+    # The openroles collection has a 'club' field that references the club ObjectId
+    if CANONICAL_REFS:
+        open_roles = list(db.openroles.find({'club': actual_club.get('_id')}))
+    else:
+        open_roles = list(db.openroles.find({
+            '$or': [
+                {'club': actual_club.get('_id')},  # ObjectId reference
+                {'club': actual_club_id},  # String ID
+                {'clubId': actual_club_id},
+            ]
+        }))
+    
+    # Get role IDs as both ObjectId and string
+    role_ids = []
+    role_id_strs = []
+    for role in open_roles:
+        role_ids.append(role.get('_id'))
+        role_id_strs.append(str(role.get('_id')))
+    
+    # Find applications that reference these openRoles
+    if APPLICATION_READ_MODEL or CANONICAL_REFS:
+        app_query = read_model_app_query([actual_club.get('_id')], role_ids)
+    elif role_ids:
+        app_query = {'$or': [
+            {'openRole': {'$in': role_ids}},
+            {'openRole': {'$in': role_id_strs}},
+            {'roleId': {'$in': role_id_strs}},
+            {'positionId': {'$in': role_id_strs}},
+        ]}
+    else:
+        # No roles found, try direct club match as fallback
+        app_query = {'$or': [
+            {'clubId': actual_club_id},
+            {'club': actual_club_name},
+            {'club': {'$regex': actual_club_name, '$options': 'i'}}
+        ]}
+    
+    if status:
+        app_query = {'$and': [app_query, {'status': {'$regex': status, '$options': 'i'}}]}
+    if position_id and CANONICAL_REFS:
+        app_query = dict(app_query, openRole=_as_object_id(position_id))
+    elif position_id:
+        app_query = {'$and': [app_query, {'$or': [
+            {'openRole': ObjectId(position_id) if ObjectId.is_valid(position_id) else position_id},
+            {'openRole': position_id},
+            {'roleId': position_id},
+            {'positionId': position_id},
+        ]}]}
+    
+    return actual_club, open_roles, app_query
+
+
 @app.route('/clubs/<club_id>/applications', methods=['GET'])
+@mongo_view
 def get_club_applications(club_id):
     """Get applications for a specific club (for admin frontend)."""
     try:
@@ -1197,22 +4220,7 @@ def get_club_applications(club_id):
         status = request.args.get('status')
         position_id = request.args.get('positionId')
         
-        # Handle demo club IDs
-        club_name = DEMO_CLUB_IDS.get(club_id)
-        
-        # Try to find the actual club first
-        actual_club = None
-        if club_name:
-            # Demo club ID - look up by name
-            actual_club = db.clubs.find_one({'name': {'$regex': club_name, '$options': 'i'}})
-        
-        if not actual_club:
-            # Try as ObjectId or slug
-            try:
-                actual_club = db.clubs.find_one({'_id': ObjectId(club_id)})
-            except:
-                actual_club = db.clubs.find_one({'$or': [{'slug': club_id}, {'name': club_id}]})
-        
+        actual_club, open_roles, app_query = resolve_club_applications_query(db, club_id, status, position_id)
         if not actual_club:
             # No club found
             return jsonify([])
@@ -1220,55 +4228,13 @@ def get_club_applications(club_id):
         actual_club_id = str(actual_club.get('_id'))
         actual_club_name = actual_club.get('name', '')
         
-        # Find all openRoles for this club
-        # The openroles collection has a 'club' field that references the club ObjectId
-        open_roles = list(db.openroles.find({
-            '$or': [
-                {'club': actual_club.get('_id')},  # ObjectId reference
-                {'club': actual_club_id},  # String ID
-                {'clubId': actual_club_id},
-            ]
-        }))
-        
-        # Get role IDs as both ObjectId and string
-        role_ids = []
-        role_id_strs = []
-        for role in open_roles:
-            role_ids.append(role.get('_id'))
-            role_id_strs.append(str(role.get('_id')))
-        
-        # Find applications that reference these openRoles
-        if role_ids:
-            app_query = {'$or': [
-                {'openRole': {'$in': role_ids}},
-                {'openRole': {'$in': role_id_strs}},
-                {'roleId': {'$in': role_id_strs}},
-                {'positionId': {'$in': role_id_strs}},
-            ]}
-        else:
-            # No roles found, try direct club match as fallback
-            app_query = {'$or': [
-                {'clubId': actual_club_id},
-                {'club': actual_club_name},
-                {'club': {'$regex': actual_club_name, '$options': 'i'}}
-            ]}
-        
-        if status:
-            app_query = {'$and': [app_query, {'status': {'$regex': status, '$options': 'i'}}]}
-        if position_id:
-            app_query = {'$and': [app_query, {'$or': [
-                {'openRole': ObjectId(position_id) if ObjectId.is_valid(position_id) else position_id},
-                {'openRole': position_id},
-                {'roleId': position_id},
-                {'positionId': position_id},
-            ]}]}
-        
         applications_raw = list(db.applications.find(app_query).limit(200))
         
         # Build a map of role IDs to role info
         role_map = {str(r.get('_id')): r for r in open_roles}
         
         # Transform to frontend shape
+        fields = parse_fields_param()
         applications = []
         for app in applications_raw:
             # Get the role info
@@ -1276,69 +4242,262 @@ def get_club_applications(club_id):
             role_info = role_map.get(app_role_id, {})
             
             populated = populate_application(db, app)
-            
-            # Convert answers if stored as dict
-            answers = app.get('answers', [])
-            if isinstance(answers, dict):
-                answers = [{'questionId': k, 'question': k, 'answer': v} for k, v in answers.items()]
-            
-            applications.append({
-                'id': str(app.get('_id')),
-                'userId': str(app.get('applicant', '')) or app.get('userId', ''),
-                'clubId': actual_club_id,
-                'positionId': app_role_id or app.get('positionId', ''),
-                'status': (app.get('status', 'submitted') or 'submitted').lower().replace('_', '_'),
-                'answers': answers,
-                'submittedAt': str(app.get('submittedAt') or app.get('createdAt', '')),
-                'updatedAt': str(app.get('updatedAt') or app.get('submittedAt', '')),
-                'applicantName': populated.get('applicantName', 'Unknown'),
-                'applicantEmail': populated.get('applicantEmail', ''),
-                'clubName': actual_club_name,
-                'positionTitle': role_info.get('jobTitle') or role_info.get('title') or populated.get('positionTitle', ''),
-            })
+            applications.append(serialize_application(
+                app, populated, fields, list_answers=True,
+                clubId=actual_club_id,
+                status=(app.get('status', 'submitted') or 'submitted').lower(),
+                submittedAt=str(app.get('submittedAt') or app.get('createdAt', '')),
+                updatedAt=str(app.get('updatedAt') or app.get('submittedAt', '')),
+                clubName=actual_club_name,
+                positionTitle=role_info.get('jobTitle') or role_info.get('title') or populated.get('roleName', ''),
+            ))
         
-        return jsonify(applications)
+        return json_response(applications)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
+
+
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '200'))
+EXPORT_COLUMNS = ['id', 'applicantName', 'applicantEmail', 'positionId', 'positionTitle',
+                  'status', 'submittedAt', 'updatedAt', 'userId', 'answers']
+
+
+def _hydrate_export_chunk(db, chunk, role_map, club_id_str, club_name):
+    """Turn a chunk of raw applications into export rows with one user lookup per chunk."""
+    applicant_oids = []
+    for app in chunk:
+        applicant_id = app.get('applicant')
+        if 'applicantName' in app:
+            continue
+        if applicant_id and ObjectId.is_valid(applicant_id):
+            applicant_oids.append(ObjectId(applicant_id) if isinstance(applicant_id, str) else applicant_id)
+    users = {}
+    if applicant_oids:
+        for u in db.users.find({'_id': {'$in': applicant_oids}}, {'name': 1, 'email': 1}):
+            users[str(u['_id'])] = {'applicantName': u.get('name', ''), 'applicantEmail': u.get('email', '')}
+    
+    rows = []
+    for app in chunk:
+        role_info = role_map.get(str(app.get('openRole', '')), {})
+        populated = app if 'applicantName' in app else users.get(str(app.get('applicant', '')), {})
+        rows.append(serialize_application(
+            app, populated, EXPORT_COLUMNS + ['clubId', 'clubName'], list_answers=True,
+            clubId=club_id_str,
+            clubName=club_name,
+            status=(app.get('status', 'submitted') or 'submitted').lower(),
+            submittedAt=str(app.get('submittedAt') or app.get('createdAt', '')),
+            updatedAt=str(app.get('updatedAt') or app.get('submittedAt', '')),
+            positionTitle=role_info.get('jobTitle') or role_info.get('title') or app.get('roleName', ''),
+        ))
+    return rows
+
+
+@app.route('/clubs/<club_id>/applications/export', methods=['GET'])
+@mongo_view
+def export_club_applications(club_id):
+    """Stream all applications for a club as CSV or NDJSON.
+
+    Reads from a Mongo cursor in batches and hydrates applicants one chunk at a
+    time, so memory stays flat regardless of club size.
+    """
+    fmt = (request.args.get('format') or 'csv').lower()
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    
+    try:
+        db = get_mongo_db()
+        actual_club, open_roles, app_query = resolve_club_applications_query(
+            db, club_id, request.args.get('status'), request.args.get('positionId'))
+        if not actual_club:
+            return jsonify({'error': 'Club not found'}), 404
+    except Exception as e:
+        return dependency_error_response(e)
+    
+    club_id_str = str(actual_club.get('_id'))
+    club_name = actual_club.get('name', '')
+    role_map = {str(r.get('_id')): r for r in open_roles}
+    cursor = db.applications.find(app_query).batch_size(EXPORT_BATCH_SIZE)
+    
+    def encode_csv_row(values):
+        buf = io.StringIO()
+        csv.writer(buf).writerow(values)
+        return buf.getvalue()
+    
+    def generate():
+        if fmt == 'csv':
+            yield encode_csv_row(EXPORT_COLUMNS)
+        chunk = []
+        try:
+            for app in cursor:
+                chunk.append(app)
+                if len(chunk) < EXPORT_BATCH_SIZE:
+                    continue
+                yield from emit(chunk)
+                chunk = []
+            if chunk:
+                yield from emit(chunk)
+        finally:
+            cursor.close()
+    
+    def emit(chunk):
+        rows = _hydrate_export_chunk(db, chunk, role_map, club_id_str, club_name)
+        if fmt == 'csv':
+            yield ''.join(encode_csv_row([
+                json.dumps(row['answers'], default=str) if col == 'answers' else row[col]
+                for col in EXPORT_COLUMNS
+            ]) for row in rows)
+        else:
+            yield b''.join(orjson.dumps(row, default=_json_default) + b'\n' for row in rows)
+    
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    filename = f"{actual_club.get('slug') or club_id_str}-applications.{fmt}"
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no',
+    })
+
+# ── Application funnel summary ───────────────────────────────────
+# Per-club counters (by status, by role, submissions per day) are built once
+# with a single $facet aggregation and stored in `applicationsummaries`.
+# Status writes in backend2 then $inc/$dec the status counters. Writes the
+# counters don't see - Node submissions and status changes (Date updatedAt,
+# new _ids) and backend2 writes that couldn't resolve a clubRef - are found
+# with one indexed find_one for anything newer than builtAt, and trigger a
+# rebuild instead of serving wrong counts until SUMMARY_MAX_AGE.
+
+SUMMARY_MAX_AGE = int(os.getenv('SUMMARY_MAX_AGE', '3600'))  # seconds before a full rebuild
+
+_summary_indexes = {'done': False}
+
+
+def _status_key(status):
+    return (status or 'SUBMITTED').upper().replace(' ', '_')
+
+
+def changed_outside_summary(db, app_query, built_at):
+    """Whether an application in app_query was written after built_at without updating the summary.
+
+    Node writes a Date updatedAt (backend2 writes ISO strings, which a Date
+    comparison doesn't match) and new documents get a newer _id; backend2
+    writes without a clubRef can't $inc a summary, so their lastUpdatedAt
+    counts too.
+    """
+    if not _summary_indexes['done']:
+        db.applications.create_index([('updatedAt', 1)])
+        _summary_indexes['done'] = True
+    return db.applications.find_one({'$and': [app_query, {'$or': [
+        {'updatedAt': {'$gt': built_at}},
+        {'_id': {'$gt': ObjectId.from_datetime(built_at)}},
+        {'clubRef': None, 'lastUpdatedAt': {'$gt': built_at.isoformat()}},
+    ]}]}, {'_id': 1}) is not None
+
+
+def build_application_summary(db, club, app_query):
+    """Aggregate counts by status, role and submission day for one club."""
+    submitted = {'$ifNull': ['$submittedAt', {'$ifNull': ['$createdAt', '']}]}
+    day = {'$cond': [
+        {'$eq': [{'$type': submitted}, 'date']},
+        {'$dateToString': {'format': '%Y-%m-%d', 'date': submitted}},
+        {'$substrBytes': [{'$toString': submitted}, 0, 10]},
+    ]}
+    facets = list(db.applications.aggregate([
+        {'$match': app_query},
+        {'$facet': {
+            'byStatus': [{'$group': {'_id': {'$toUpper': {'$ifNull': ['$status', 'SUBMITTED']}}, 'count': {'$sum': 1}}}],
+            'byRole': [{'$group': {'_id': {'$toString': {'$ifNull': ['$openRole', '']}}, 'count': {'$sum': 1}}}],
+            'byDay': [{'$group': {'_id': day, 'count': {'$sum': 1}}}],
+        }},
+    ]))[0]
+    by_status = {}
+    for row in facets['byStatus']:
+        # "under review" and "UNDER_REVIEW" land in the same counter
+        by_status[_status_key(row['_id'])] = by_status.get(_status_key(row['_id']), 0) + row['count']
+    summary = {
+        '_id': club['_id'],
+        'total': sum(row['count'] for row in facets['byStatus']),
+        'byStatus': by_status,
+        'byRole': {row['_id'] or 'unknown': row['count'] for row in facets['byRole']},
+        'byDay': {row['_id'] or 'unknown': row['count'] for row in facets['byDay']},
+        'builtAt': datetime.utcnow(),
+    }
+    db.applicationsummaries.replace_one({'_id': club['_id']}, summary, upsert=True)
+    metrics_group('application_summary', builds=0, reads=0, increments=0)['builds'] += 1
+    return summary
+
+
+def record_status_changes(db, changes):
+    """Apply (club_ref, old_status, new_status) transitions to stored summaries."""
+    incs = {}
+    for club_ref, old_status, new_status in changes:
+        old_key, new_key = _status_key(old_status), _status_key(new_status)
+        if not club_ref or old_key == new_key:
+            continue
+        club_incs = incs.setdefault(club_ref, {})
+        club_incs[f'byStatus.{old_key}'] = club_incs.get(f'byStatus.{old_key}', 0) - 1
+        club_incs[f'byStatus.{new_key}'] = club_incs.get(f'byStatus.{new_key}', 0) + 1
+    for club_ref, inc in incs.items():
+        # No upsert: clubs without a stored summary build one on first read
+        db.applicationsummaries.update_one({'_id': _as_object_id(club_ref)}, {'$inc': inc})
+    metrics_group('application_summary', builds=0, reads=0, increments=0)['increments'] += len(incs)
+
+
+def record_status_change(db, club_ref, old_status, new_status):
+    record_status_changes(db, [(club_ref, old_status, new_status)])
+
+
+@app.route('/clubs/<club_id>/applications/summary', methods=['GET'])
+@mongo_view
+def get_club_applications_summary(club_id):
+    """Application funnel counts for a club (by status, by role, per day)."""
+    try:
+        db = get_mongo_db()
+        actual_club, open_roles, app_query = resolve_club_applications_query(db, club_id)
+        if not actual_club:
+            return jsonify({'error': 'Club not found'}), 404
+        
+        summary = db.applicationsummaries.find_one({'_id': actual_club['_id']})
+        stale = (summary is None
+                 or datetime.utcnow() - summary['builtAt'] > timedelta(seconds=SUMMARY_MAX_AGE)
+                 or changed_outside_summary(db, app_query, summary['builtAt']))
+        if stale:
+            summary = build_application_summary(db, actual_club, app_query)
+        metrics_group('application_summary', builds=0, reads=0, increments=0)['reads'] += 1
+        
+        role_titles = {str(r['_id']): r.get('jobTitle') or r.get('title') or r.get('name', '') for r in open_roles}
+        return json_response({
+            'clubId': str(actual_club['_id']),
+            'clubName': actual_club.get('name', ''),
+            'total': summary['total'],
+            'byStatus': {k: v for k, v in summary['byStatus'].items() if v},
+            'byRole': sorted([
+                {'positionId': role_id, 'positionTitle': role_titles.get(role_id, ''), 'count': count}
+                for role_id, count in summary['byRole'].items()
+            ], key=lambda r: -r['count']),
+            'submissionsByDay': [{'date': d, 'count': c} for d, c in sorted(summary['byDay'].items())],
+            'builtAt': summary['builtAt'],
+        })
+    except Exception as e:
+        return dependency_error_response(e)
 
 
 @app.route('/applications/<application_id>', methods=['GET'])
+@mongo_view
 def get_application_detail(application_id):
     """Get a single application by ID."""
     try:
         db = get_mongo_db()
-        
-        try:
-            app_filter = {'_id': ObjectId(application_id)}
-        except:
-            app_filter = {'$or': [{'applicationId': application_id}, {'id': application_id}]}
-        
-        app = db.applications.find_one(app_filter)
+        app = db.applications.find_one(application_filter(application_id))
         if not app:
             return jsonify({'error': 'Application not found'}), 404
         
         populated = populate_application(db, app)
-        result = {
-            'id': str(app.get('_id')),
-            'userId': app.get('applicant') or app.get('userId', ''),
-            'clubId': app.get('clubId', ''),
-            'positionId': app.get('roleId') or app.get('positionId', ''),
-            'status': app.get('status', 'submitted'),
-            'answers': app.get('answers', []),
-            'submittedAt': app.get('submittedAt') or app.get('createdAt', ''),
-            'updatedAt': app.get('updatedAt') or app.get('submittedAt', ''),
-            'applicantName': populated.get('applicantName', 'Unknown'),
-            'applicantEmail': populated.get('applicantEmail', ''),
-            'clubName': populated.get('clubName') or app.get('club', ''),
-            'positionTitle': populated.get('positionTitle') or app.get('role', ''),
-        }
-        
-        return jsonify(result)
+        return json_response(serialize_application(app, populated, parse_fields_param()))
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
 
 
 @app.route('/applications/<application_id>/status', methods=['PATCH'])
+@mongo_view
 def patch_application_status(application_id):
     """Update just the status of an application."""
     data = request.json
@@ -1347,49 +4506,39 @@ def patch_application_status(application_id):
     if not new_status:
         return jsonify({'error': 'status is required'}), 400
     
+    # Stored the same way update_application stores it, so expectedStatus compares like for like
+    new_status = normalize_status(new_status)
+    expected_status = normalize_status(data['expectedStatus']) if data.get('expectedStatus') else None
+    
     try:
         db = get_mongo_db()
+        app_filter = application_filter(application_id)
+        fields = parse_fields_param()
         
-        try:
-            app_filter = {'_id': ObjectId(application_id)}
-        except:
-            app_filter = {'$or': [{'applicationId': application_id}, {'id': application_id}]}
-        
-        app = db.applications.find_one(app_filter)
-        if not app:
+        # Update status and get the updated application back in one round trip
+        set_fields = {
+            'status': new_status,
+            'updatedAt': __import__('datetime').datetime.utcnow().isoformat()
+        }
+        projection = None if fields is None or 'answers' in fields else {'answers': 0}
+        before, app = find_and_set_application(db, app_filter, set_fields, expected_status, projection)
+        if not before:
+            current = current_status(db, app_filter) if expected_status else None
+            if current is not None:
+                return jsonify({'error': f'Application is {current}, not {expected_status}',
+                                'currentStatus': current}), 409
             return jsonify({'error': 'Application not found'}), 404
+        record_status_change(db, app.get('clubRef'), before.get('status'), new_status)
+        enqueue_status_notifications(db, [(before, app, new_status)])
         
-        # Update status
-        result = db.applications.update_one(app_filter, {
-            '$set': {
-                'status': new_status,
-                'updatedAt': __import__('datetime').datetime.utcnow().isoformat()
-            }
-        })
-        
-        # Return updated application
-        app = db.applications.find_one(app_filter)
         populated = populate_application(db, app)
-        
-        return jsonify({
-            'id': str(app.get('_id')),
-            'userId': app.get('applicant') or app.get('userId', ''),
-            'clubId': app.get('clubId', ''),
-            'positionId': app.get('roleId') or app.get('positionId', ''),
-            'status': app.get('status', 'submitted'),
-            'answers': app.get('answers', []),
-            'submittedAt': app.get('submittedAt') or app.get('createdAt', ''),
-            'updatedAt': app.get('updatedAt', ''),
-            'applicantName': populated.get('applicantName', 'Unknown'),
-            'applicantEmail': populated.get('applicantEmail', ''),
-            'clubName': populated.get('clubName') or app.get('club', ''),
-            'positionTitle': populated.get('positionTitle') or app.get('role', ''),
-        })
+        return json_response(serialize_application(app, populated, fields))
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
 
 
 @app.route('/clubs/<club_id>/recruitment-posts', methods=['GET'])
+@mongo_view
 def get_club_recruitment_posts(club_id):
     """Get recruitment posts for a club (includes positions)."""
     try:
@@ -1417,12 +4566,15 @@ def get_club_recruitment_posts(club_id):
         club_name = club.get('name', '')
         
         # Get open roles as positions
-        roles = list(db.openroles.find({
-            '$or': [
-                {'clubId': club_id_str},
-                {'club': club_name}
-            ]
-        }))
+        if CANONICAL_REFS:
+            roles = list(db.openroles.find({'club': club.get('_id')}))
+        else:
+            roles = list(db.openroles.find({
+                '$or': [
+                    {'clubId': club_id_str},
+                    {'club': club_name}
+                ]
+            }))
         
         positions = []
         for role in roles:
@@ -1453,10 +4605,11 @@ def get_club_recruitment_posts(club_id):
         
         return jsonify([])
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
 
 
 @app.route('/applications/bulk-status', methods=['PATCH'])
+@mongo_view
 def bulk_update_status():
     """Update status for multiple applications at once."""
     data = request.json
@@ -1465,45 +4618,427 @@ def bulk_update_status():
     
     if not application_ids or not new_status:
         return jsonify({'error': 'applicationIds and status are required'}), 400
+    new_status = normalize_status(new_status)
     
     try:
         db = get_mongo_db()
+        
+        # Optional: authorize the whole batch once and record who made the change
+        user_email = data.get('user_email')
+        if user_email:
+            principal = get_principal(db, user_email)
+            if not principal or not principal['is_admin']:
+                return jsonify({'error': 'Unauthorized'}), 403
+        
         updated = []
+        status_changes = []
+        notifications = []
+        lookup_cache = {}
+        fields = parse_fields_param()
+        projection = None if fields is None or 'answers' in fields else {'answers': 0}
+        # Optional: only move applications still in this status; the others are
+        # reported as conflicts (with their current status) or notFound
+        expected_status = normalize_status(data['expectedStatus']) if data.get('expectedStatus') else None
+        conflicts = []
+        not_found = []
         
         for app_id in application_ids:
             try:
                 app_filter = {'_id': ObjectId(app_id)}
             except:
+                not_found.append(app_id)
                 continue
             
-            db.applications.update_one(app_filter, {
-                '$set': {
-                    'status': new_status,
-                    'updatedAt': __import__('datetime').datetime.utcnow().isoformat()
-                }
-            })
-            
-            app = db.applications.find_one(app_filter)
-            if app:
-                populated = populate_application(db, app)
-                updated.append({
-                    'id': str(app.get('_id')),
-                    'userId': app.get('applicant') or app.get('userId', ''),
-                    'clubId': app.get('clubId', ''),
-                    'positionId': app.get('roleId') or app.get('positionId', ''),
-                    'status': app.get('status', 'submitted'),
-                    'answers': app.get('answers', []),
-                    'submittedAt': app.get('submittedAt') or app.get('createdAt', ''),
-                    'updatedAt': app.get('updatedAt', ''),
-                    'applicantName': populated.get('applicantName', 'Unknown'),
-                    'applicantEmail': populated.get('applicantEmail', ''),
-                    'clubName': populated.get('clubName') or app.get('club', ''),
-                    'positionTitle': populated.get('positionTitle') or app.get('role', ''),
-                })
+            set_fields = {
+                'status': new_status,
+                'updatedAt': __import__('datetime').datetime.utcnow().isoformat()
+            }
+            if user_email:
+                set_fields['lastUpdatedBy'] = user_email
+            before, app = find_and_set_application(db, app_filter, set_fields, expected_status, projection,
+                                                   lookup_cache)
+            if not before:
+                current = current_status(db, app_filter) if expected_status else None
+                if current is not None:
+                    conflicts.append({'id': app_id, 'currentStatus': current})
+                else:
+                    not_found.append(app_id)
+                continue
+            status_changes.append((app.get('clubRef'), before.get('status'), new_status))
+            notifications.append((before, app, new_status))
+            populated = populate_application(db, app)
+            updated.append(serialize_application(app, populated, fields))
         
-        return jsonify(updated)
+        record_status_changes(db, status_changes)
+        # Emails go out from the background dispatcher; one insert queues the whole batch
+        enqueue_status_notifications(db, notifications)
+        if expected_status:
+            return json_response({'updated': updated, 'conflicts': conflicts, 'notFound': not_found})
+        return json_response(updated)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return dependency_error_response(e)
+
+
+@app.route('/outbox', methods=['GET'])
+@mongo_view
+def get_outbox():
+    """Queued status-change emails for the caller's clubs, newest first.
+
+    ?user_email= (required, admin), ?status=pending|sending|sent|failed, ?clubId=, ?limit=
+    """
+    user_email = request.args.get('user_email')
+    if not user_email:
+        return jsonify({'error': 'user_email is required'}), 400
+    try:
+        db = get_mongo_db()
+        principal = get_principal(db, user_email)
+        if not principal or not principal['is_admin']:
+            return jsonify({'error': 'Unauthorized'}), 403
+        
+        # Club admins only see their clubs' mail; an ADMIN without clubs sees everything
+        query = {}
+        club_id = request.args.get('clubId')
+        if principal['club_ids'] or 'ADMIN' not in principal['roles']:
+            if club_id and _as_object_id(club_id) not in principal['club_ids']:
+                return jsonify({'error': 'Unauthorized for this club'}), 403
+            query['clubRef'] = _as_object_id(club_id) if club_id else {'$in': sorted(principal['club_ids'])}
+        elif club_id:
+            query['clubRef'] = _as_object_id(club_id)
+        counts = {row['_id']: row['count'] for row in db.outbox.aggregate([
+            {'$match': dict(query)}, {'$group': {'_id': '$status', 'count': {'$sum': 1}}}])}
+        if request.args.get('status'):
+            query['status'] = request.args['status']
+        limit = min(500, max(1, request.args.get('limit', 50, type=int)))
+        emails = [{
+            'id': str(doc['_id']),
+            'applicationId': doc.get('applicationId'),
+            'to': doc['to'],
+            'subject': doc['subject'],
+            'body': doc['body'],
+            'createdAt': doc['createdAt'],
+            'status': doc['status'],
+            'attempts': doc.get('attempts', 0),
+            'sentAt': doc.get('sentAt'),
+            'lastError': doc.get('lastError'),
+        } for doc in db.outbox.find(query).sort('createdAt', -1).limit(limit)]
+        return json_response({'counts': counts, 'emails': emails})
+    except Exception as e:
+        return dependency_error_response(e)
+
+
+# ── Memory accounting ────────────────────────────────────────────
+# GET /memory (and a [MEMORY] log line every MEMORY_LOG_INTERVAL seconds)
+# reports entry counts and approximate deep sizes of the in-process state:
+# chat sessions (split into history, Snowflake context and mongo_context),
+# context snapshots, caches and indexes, plus the largest sessions. Sizes
+# are sys.getsizeof summed over reachable containers; each structure is
+# measured on its own, so data shared between structures (a session's
+# mongo_context points into the club snapshots) is counted in both, and
+# `deduplicated_bytes` counts it once. With MEMORY_TRACEMALLOC=true the
+# report also lists the allocation sites that grew most since the previous
+# report and since the first one. Budgets in MEMORY_BUDGETS_MB raise alarms.
+
+MEMORY_LOG_INTERVAL = int(os.getenv('MEMORY_LOG_INTERVAL', '300'))  # seconds, 0 = no periodic log
+MEMORY_TOP_SESSIONS = int(os.getenv('MEMORY_TOP_SESSIONS', '10'))
+MEMORY_TRACEMALLOC = os.getenv('MEMORY_TRACEMALLOC', 'false').lower() == 'true'
+MEMORY_TRACEMALLOC_FRAMES = int(os.getenv('MEMORY_TRACEMALLOC_FRAMES', '1'))
+MEMORY_TRACEMALLOC_TOP = int(os.getenv('MEMORY_TRACEMALLOC_TOP', '15'))
+MEMORY_SIZEOF_MAX_OBJECTS = 2_000_000  # stop walking a structure after this many objects
+# Alarm thresholds in MB: 'rss' for the worker, 'session' for the largest single
+# chat session, anything else is a structure name from MEMORY_STRUCTURES
+MEMORY_BUDGETS_MB = {
+    'rss': 1024,
+    'chat_sessions': 256,
+    'session': 16,
+}
+MEMORY_BUDGETS_MB.update(json.loads(os.getenv('MEMORY_BUDGETS_MB', '{}')))  # e.g. {"rss": 2048, "club_snapshots": 128}
+
+# Objects that are never worth descending into (shared code, locks, threads)
+_SIZEOF_OPAQUE = (type, type(sys), type(lambda: None), type(len), type(threading.Lock()), threading.Thread)
+
+MEMORY_STRUCTURES = {
+    'chat_sessions': lambda: chat_sessions,
+    'context_scopes': lambda: _context_cache,
+    'public_snapshot': lambda: _public_snapshot,
+    'club_snapshots': lambda: _club_snapshots,
+    'principal_cache': lambda: _principal_cache,
+    'completion_cache': lambda: _completion_cache,
+    'stale_responses': lambda: _last_good,
+    'deadline_index': lambda: _deadline_index,
+    'rate_buckets': lambda: _rate_buckets,
+    'statement_fingerprints': lambda: (_seen_templates, _seen_statements),
+}
+SESSION_FIELDS = ('history', 'context', 'mongo_context')
+
+_memory = {'pid': None, 'thread': None, 'baseline': None, 'previous': None}
+_memory_lock = threading.Lock()
+
+if MEMORY_TRACEMALLOC:
+    import tracemalloc
+    tracemalloc.start(MEMORY_TRACEMALLOC_FRAMES)
+
+
+def _memory_metrics():
+    return metrics_group('memory', reports=0, alarms={}, last_alarms=[])
+
+
+def _children(obj):
+    if isinstance(obj, dict):
+        items = list(obj.items())
+        return [k for k, _ in items] + [v for _, v in items]
+    if isinstance(obj, (list, tuple, set, frozenset, SortedList)):
+        return list(obj)
+    if hasattr(obj, '__dict__') and not isinstance(obj, _SIZEOF_OPAQUE):
+        return [obj.__dict__]
+    return ()
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate bytes reachable from obj, skipping ids already in seen (which is updated)."""
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    while stack and len(seen) < MEMORY_SIZEOF_MAX_OBJECTS:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _SIZEOF_OPAQUE):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current, 0)
+        for _ in range(3):
+            try:
+                stack.extend(_children(current))
+                break
+            except RuntimeError:
+                continue  # mutated by another thread mid-copy; try again
+    return total
+
+
+def _entry_count(obj):
+    if isinstance(obj, tuple):
+        return sum(_entry_count(part) for part in obj)
+    if obj is _public_snapshot:
+        return 1 if obj.get('data') is not None else 0
+    if obj is _deadline_index:
+        return len(obj['entries'])
+    return len(obj)
+
+
+def session_memory(session_id, session):
+    sizes = {field: deep_sizeof(session.get(field)) for field in SESSION_FIELDS}
+    return {
+        # Hashed: a raw session id is enough to continue someone's chat
+        'session': hashlib.sha256(str(session_id).encode()).hexdigest()[:12],
+        'turns': len(session.get('history') or []) // 2,
+        'bytes': sum(sizes.values()),
+        **{f'{field}_bytes': size for field, size in sizes.items()},
+    }
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource  # macOS: peak rather than current, in bytes
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _tracemalloc_growth(snapshot, since):
+    return [{
+        'site': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+        'size_diff_bytes': stat.size_diff,
+        'count_diff': stat.count_diff,
+        'size_bytes': stat.size,
+    } for stat in snapshot.compare_to(since, 'lineno')[:MEMORY_TRACEMALLOC_TOP] if stat.size_diff]
+
+
+def tracemalloc_report():
+    """Top allocation growth since the previous report and since the first one."""
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    with _memory_lock:
+        baseline = _memory['baseline'] or snapshot
+        previous = _memory['previous'] or snapshot
+        _memory['baseline'] = baseline
+        _memory['previous'] = snapshot
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        'traced_bytes': current,
+        'traced_peak_bytes': peak,
+        'growth_since_previous': _tracemalloc_growth(snapshot, previous),
+        'growth_since_baseline': _tracemalloc_growth(snapshot, baseline),
+    }
+
+
+def check_memory_budgets(report):
+    """Return alarm strings for every budget in MEMORY_BUDGETS_MB that report exceeds."""
+    mb = 1024 * 1024
+    observed = {name: stats['bytes'] for name, stats in report['structures'].items()}
+    observed['rss'] = report['rss_bytes']
+    observed['session'] = report['largest_sessions'][0]['bytes'] if report['largest_sessions'] else 0
+    alarms = []
+    for name, budget in MEMORY_BUDGETS_MB.items():
+        if budget and name in observed and observed[name] > budget * mb:
+            alarms.append(f"{name} {observed[name] / mb:.1f}MB > budget {budget}MB")
+    return alarms
+
+
+def memory_report(include_tracemalloc=True):
+    structures = {}
+    shared_seen = set()
+    deduplicated = 0
+    for name, get in MEMORY_STRUCTURES.items():
+        obj = get()
+        structures[name] = {'entries': _entry_count(obj), 'bytes': deep_sizeof(obj)}
+        deduplicated += deep_sizeof(obj, shared_seen)
+
+    sessions = list(chat_sessions.items())
+    per_session = [session_memory(session_id, session) for session_id, session in sessions]
+    for field in SESSION_FIELDS:
+        field_seen = set()  # the same Snowflake context or snapshot rows shared by sessions count once
+        structures[f'chat_sessions.{field}'] = {
+            'entries': len(sessions),
+            'bytes': sum(deep_sizeof(session.get(field), field_seen) for _, session in sessions),
+        }
+    per_session.sort(key=lambda s: s['bytes'], reverse=True)
+
+    report = {
+        'pid': os.getpid(),
+        'rss_bytes': _rss_bytes(),
+        'deduplicated_bytes': deduplicated,
+        'structures': structures,
+        'largest_sessions': per_session[:MEMORY_TOP_SESSIONS],
+        'budgets_mb': MEMORY_BUDGETS_MB,
+    }
+    if include_tracemalloc and MEMORY_TRACEMALLOC:
+        report['tracemalloc'] = tracemalloc_report()
+    report['alarms'] = check_memory_budgets(report)
+
+    metrics = _memory_metrics()
+    metrics['reports'] += 1
+    metrics['last_alarms'] = report['alarms']
+    for alarm in report['alarms']:
+        name = alarm.split(' ', 1)[0]
+        metrics['alarms'][name] = metrics['alarms'].get(name, 0) + 1
+    return report
+
+
+def log_memory_report():
+    report = memory_report()
+    mb = 1024 * 1024
+    sizes = ' '.join(f"{name}={stats['entries']}/{stats['bytes'] / mb:.1f}MB"
+                     for name, stats in report['structures'].items())
+    print(f"[MEMORY] pid={report['pid']} rss={report['rss_bytes'] / mb:.1f}MB {sizes}")
+    if report.get('tracemalloc'):
+        for growth in report['tracemalloc']['growth_since_previous'][:5]:
+            print(f"[MEMORY] {growth['size_diff_bytes'] / 1024:+.0f}KB {growth['site']}")
+    for alarm in report['alarms']:
+        print(f"[MEMORY] ALARM {alarm}")
+
+
+def _memory_loop():
+    while True:
+        time.sleep(MEMORY_LOG_INTERVAL)
+        try:
+            log_memory_report()
+        except Exception as e:
+            print(f"[MEMORY] Report failed: {e}")
+
+
+def start_memory_reporter():
+    """Start this worker's periodic [MEMORY] log thread once (threads don't survive fork)."""
+    if MEMORY_LOG_INTERVAL <= 0 or _memory['pid'] == os.getpid():
+        return
+    with _memory_lock:
+        if _memory['pid'] == os.getpid():
+            return
+        _memory['pid'] = os.getpid()
+        _memory['thread'] = threading.Thread(target=_memory_loop, name='memory-reporter', daemon=True)
+        _memory['thread'].start()
+
+
+@app.route('/memory')
+def get_memory():
+    """Entry counts and approximate sizes of in-process state (?tracemalloc=true adds a snapshot diff)."""
+    denied = _profile_access_denied()
+    if denied:
+        return denied
+    include_tracemalloc = request.args.get('tracemalloc', 'false').lower() == 'true'
+    return json_response(memory_report(include_tracemalloc))
+
+
+# ── Worker startup ───────────────────────────────────────────────
+# Under gunicorn (see gunicorn.conf.py) the app can be preloaded in the master
+# and each forked worker then calls reset_after_fork() + warm_worker() before
+# it accepts traffic, so recycled workers never serve a cold first request.
+
+WARMUP_TASKS = []
+
+
+def warmup_task(fn):
+    """Register fn to run in warm_worker(); its duration is reported in boot timings."""
+    WARMUP_TASKS.append(fn)
+    return fn
+
+
+@warmup_task
+def warm_mongo():
+    get_mongo_db().command('ping')
+
+
+@warmup_task
+def warm_context():
+    get_public_snapshot()
+    start_context_refresher()
+
+
+@warmup_task
+def warm_snowflake():
+    if os.getenv('SNOWFLAKE_ACCOUNT'):
+        get_shared_snowflake_conn()
+
+
+@warmup_task
+def warm_deadlines():
+    get_deadline_index()
+
+
+@warmup_task
+def warm_memory_reporter():
+    start_memory_reporter()
+
+
+@warmup_task
+def warm_outbox_dispatcher():
+    start_outbox_dispatcher()  # drain anything queued before a restart
+
+
+def reset_after_fork():
+    """Drop connections inherited from the master; they are not fork-safe."""
+    global mongo_client, mongo_db, _snowflake_conn
+    mongo_client = None
+    mongo_db = None
+    _snowflake_conn = None
+
+
+def warm_worker():
+    """Open connections and prime caches, recording per-task timings."""
+    started = time.perf_counter()
+    for task in WARMUP_TASKS:
+        task_started = time.perf_counter()
+        try:
+            task()
+            BOOT_TIMINGS['warmup'][task.__name__] = round(time.perf_counter() - task_started, 4)
+        except Exception as e:
+            BOOT_TIMINGS['warmup'][task.__name__] = f'failed: {e}'
+    BOOT_TIMINGS['warmup_seconds'] = round(time.perf_counter() - started, 4)
+    print(f"[BOOT] pid={os.getpid()} timings={BOOT_TIMINGS}")
+
+
+BOOT_TIMINGS['module_import_seconds'] = round(time.perf_counter() - _BOOT_STARTED, 4)
+METRICS['boot'] = BOOT_TIMINGS
 
 
 if __name__ == '__main__':
@@ -0,0 +1,29 @@
+"""Backfill and reconcile the denormalized application read model.
+
+Usage:
+    python backfill_read_model.py              # fill missing fields, then reconcile renames
+    python backfill_read_model.py --reconcile  # only push renamed users/roles/clubs
+    python backfill_read_model.py --batch-size 1000
+
+Run once before enabling APPLICATION_READ_MODEL, then periodically (e.g. cron)
+so renamed users, roles and clubs show up on existing applications.
+"""
+import argparse
+
+from app import (
+    get_mongo_db,
+    ensure_read_model_indexes,
+    backfill_application_read_model,
+    reconcile_application_read_model,
+)
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument('--reconcile', action='store_true', help='skip the backfill and only reconcile')
+parser.add_argument('--batch-size', type=int, default=500)
+args = parser.parse_args()
+
+db = get_mongo_db()
+ensure_read_model_indexes(db)
+if not args.reconcile:
+    backfill_application_read_model(db, batch_size=args.batch_size)
+reconcile_application_read_model(db)
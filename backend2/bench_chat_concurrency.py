@@ -0,0 +1,73 @@
+"""Fire concurrent /chat requests at a running backend2 and report throughput.
+
+Usage:
+    python bench_chat_concurrency.py --url http://localhost:5001 --concurrency 200 --requests 400
+    python bench_chat_concurrency.py --path /recruitment --method GET   # no Cortex credits
+
+Compare the default worker class with cooperative mode on the same box:
+    gunicorn -c gunicorn.conf.py app:app
+    GUNICORN_WORKER_CLASS=gevent WEB_CONCURRENCY=1 gunicorn -c gunicorn.conf.py app:app
+
+Every request uses its own session, user email and message, so the chat
+rate limits and the completion cache don't hide the cost of the Cortex call.
+"""
+import argparse
+import json
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument('--url', default='http://localhost:5001')
+parser.add_argument('--path', default='/chat')
+parser.add_argument('--method', default='POST')
+parser.add_argument('--concurrency', type=int, default=100)
+parser.add_argument('--requests', type=int, default=200)
+parser.add_argument('--message', default='Which clubs are recruiting right now?')
+parser.add_argument('--timeout', type=float, default=120)
+args = parser.parse_args()
+
+run_id = uuid.uuid4().hex[:8]
+
+
+def one_request(i):
+    body = None
+    if args.method == 'POST':
+        body = json.dumps({
+            'message': f'{args.message} (bench {run_id} {i})',
+            'session_id': f'bench-{run_id}-{i}',
+            'user_email': f'bench-{run_id}-{i}@example.com',
+        }).encode()
+    req = urllib.request.Request(args.url + args.path, data=body, method=args.method,
+                                 headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=args.timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception as e:
+        status = type(e).__name__
+    return status, time.perf_counter() - started
+
+
+started = time.perf_counter()
+with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+    results = list(pool.map(one_request, range(args.requests)))
+elapsed = time.perf_counter() - started
+
+latencies = sorted(latency for _, latency in results)
+
+
+def percentile(p):
+    return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+
+print(f"{args.requests} requests, concurrency {args.concurrency}, {elapsed:.2f}s total")
+print(f"throughput: {args.requests / elapsed:.1f} req/s")
+print(f"latency p50={percentile(50):.3f}s p95={percentile(95):.3f}s max={latencies[-1]:.3f}s")
+print(f"status: {dict(Counter(status for status, _ in results))}")
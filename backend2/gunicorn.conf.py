@@ -0,0 +1,36 @@
+"""Gunicorn config for backend2.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+With GUNICORN_PRELOAD=true (the default) the app is imported once in the
+master and forked into workers. Each worker drops inherited connections and
+warms Mongo/Snowflake before it starts accepting requests.
+
+GUNICORN_WORKER_CLASS=gevent switches to cooperative I/O: every Mongo,
+Snowflake and Cortex call yields while it waits, so one worker can hold
+hundreds of concurrent chats instead of one per thread.
+"""
+import os
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class == 'gevent':
+    # Patch before the app is imported so pymongo, the Snowflake connector
+    # (requests/urllib3) and the app's locks and threads are all cooperative.
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5001')
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))  # gevent only
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+
+
+def post_fork(server, worker):
+    import app as backend
+
+    backend.reset_after_fork()
+    if os.getenv('WARM_ON_START', 'true').lower() == 'true':
+        backend.warm_worker()
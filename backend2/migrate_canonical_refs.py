@@ -0,0 +1,26 @@
+"""Rewrite application and openrole references to canonical ObjectIds.
+
+Usage:
+    python migrate_canonical_refs.py                  # migrate (resumes an interrupted run)
+    python migrate_canonical_refs.py --restart        # ignore checkpoints and start over
+    python migrate_canonical_refs.py --batch-size 1000
+
+Progress is checkpointed in the `migrations` collection after every batch.
+Once it reports no unresolved documents (or they have been fixed by hand),
+set CANONICAL_REFS=true so queries use single-field equality/$in filters.
+"""
+import argparse
+
+from app import get_mongo_db, migrate_canonical_refs
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument('--restart', action='store_true', help='discard checkpoints and migrate from the beginning')
+parser.add_argument('--batch-size', type=int, default=500)
+args = parser.parse_args()
+
+report = migrate_canonical_refs(get_mongo_db(), batch_size=args.batch_size, restart=args.restart)
+for collection, result in report.items():
+    unresolved = result['unresolved'] or []
+    print(f"{collection}: {result['updated']} updated, {len(unresolved)} unresolved")
+    for doc in unresolved:
+        print(f"  {doc['_id']}: missing {', '.join(doc['missing'])}")
@@ -0,0 +1,96 @@
+"""Local SMTP stand-in for exercising the notification outbox.
+
+Usage:
+    python smtp_sink.py --port 1025                  # accept and print every message
+    python smtp_sink.py --port 1025 --fail-rate 0.3  # reject 30% of messages with a 451 (retried)
+    python smtp_sink.py --port 1025 --delay 0.5      # slow server
+
+Then run the backend with:
+    SMTP_HOST=localhost SMTP_PORT=1025 python app.py
+
+and bulk-update a batch of applications to ACCEPTED/REJECTED. The request
+returns immediately; the messages arrive here at OUTBOX_RATE per second.
+"""
+import argparse
+import random
+import socketserver
+import time
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument('--host', default='localhost')
+parser.add_argument('--port', type=int, default=1025)
+parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of messages answered with 451')
+parser.add_argument('--delay', type=float, default=0.0, help='seconds to wait before accepting each message')
+parser.add_argument('--quiet', action='store_true', help='print one line per message instead of the body')
+args = parser.parse_args()
+
+received = 0
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        global received
+        self.reply('220 smtp-sink ready')
+        sender, recipients = None, []
+        while True:
+            try:
+                line = self.rfile.readline()
+            except OSError:
+                return
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command[:4].upper()
+            if verb in ('HELO', 'EHLO'):
+                self.reply('250 smtp-sink')
+            elif verb == 'MAIL':
+                sender, recipients = command[10:].strip(), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command[8:].strip())
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                    text = data.decode(errors='replace').rstrip('\r\n')
+                    if text[:1] in (' ', '\t') and lines and lines[-1] and ':' in lines[-1]:
+                        lines[-1] += ' ' + text.strip()  # unfold a long header
+                    else:
+                        lines.append(text)
+                time.sleep(args.delay)
+                if random.random() < args.fail_rate:
+                    self.reply('451 Temporary failure, try again later')
+                    continue
+                received += 1
+                subject = next((l[9:] for l in lines if l.startswith('Subject: ')), '')
+                print(f"[{received}] {sender} -> {', '.join(recipients)}: {subject}")
+                if not args.quiet:
+                    print('\n'.join(lines), end='\n\n')
+                self.reply('250 OK: queued')
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+print(f"SMTP sink listening on {args.host}:{args.port}")
+with Server((args.host, args.port), SMTPHandler) as server:
+    server.serve_forever()